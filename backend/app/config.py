@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Any, Dict
 
 
 class Settings(BaseSettings):
@@ -7,13 +8,149 @@ class Settings(BaseSettings):
     supabase_url: str
     supabase_key: str
     supabase_service_key: str
+    supabase_timeout_seconds: int = 30
+    supabase_storage_timeout_seconds: int = 120
     
     # Google Gemini
     gemini_api_key: str
+    llm_max_concurrency: int = 32
+    llm_max_concurrency_per_org: int = 8
+    llm_timeout_seconds: float = 30.0
+    embedding_batch_size: int = 50
+    embedding_max_in_flight: int = 4
+    embedding_requests_per_minute: int = 120
+    
+    # Cache de embeddings de perguntas (disco opcional: caminho de um arquivo SQLite)
+    embedding_cache_maxsize: int = 10000
+    embedding_cache_ttl_seconds: float = 86400.0
+    embedding_cache_path: str = ""
+    embedding_cache_disk_ttl_seconds: float = 2592000.0
+    
+    # Cache de regras compiladas (invalidado por rotas e Realtime; TTL como segurança)
+    rules_cache_ttl_seconds: float = 300.0
+    rules_realtime_invalidation: bool = True
+    sentiment_cache_ttl_seconds: float = 3600.0
+    
+    # Blacklists (números normalizados para E.164; índice em memória por organização)
+    blacklist_default_country_code: str = "55"
+    blacklist_cache_ttl_seconds: float = 600.0
+    blacklist_import_batch_size: int = 1000
+    
+    # Cache semântico de respostas (similaridade do embedding da pergunta)
+    semantic_cache_enabled: bool = True
+    semantic_cache_threshold: float = 0.95
+    semantic_cache_max_entries_per_org: int = 500
+    semantic_cache_ttl_seconds: float = 86400.0
+    semantic_cache_min_chars: int = 12
+    knowledge_version_ttl_seconds: float = 5.0
+    
+    # Índice vetorial local por organização (pgvector continua como fonte da verdade)
+    vector_index_enabled: bool = True
+    vector_index_max_vectors: int = 200000
+    vector_index_ivf_min_vectors: int = 20000
+    vector_index_nprobe: int = 8
+    vector_index_reload_interval_seconds: float = 60.0
+    vector_index_max_total_vectors: int = 400000
+    vector_index_content_cache_size: int = 4096
+    
+    # Recuperação ("vector" ou "hybrid": vetorial + full-text com RRF e reranker local)
+    retrieval_mode: str = "hybrid"
+    retrieval_candidate_multiplier: int = 4
+    retrieval_rrf_k: int = 60
+    # ts_rank_cd mínimo da busca léxica (~0.1 por ocorrência de termo)
+    retrieval_lexical_min_rank: float = 0.2
+    retrieval_reranker_enabled: bool = True
+    
+    # Chunking por tipo de documento; ajustes sobre os perfis padrão de app.services.chunker
+    # ex: CHUNKING_PROFILES='{"pdf": {"max_tokens": 400}, "csv": {"repeat_header": false}}'
+    chunking_profiles: Dict[str, Dict[str, Any]] = {}
+    
+    # Fila de ingestão ("supabase" ou "memory" para desenvolvimento local)
+    ingestion_queue_backend: str = "supabase"
+    ingestion_workers: int = 2
+    ingestion_max_attempts: int = 5
+    ingestion_retry_base_seconds: float = 10.0
+    ingestion_lease_seconds: int = 120
+    ingestion_poll_interval_seconds: float = 2.0
+    
+    # Extração em streaming: uploads e downloads vão para arquivos temporários (vazio = padrão do SO)
+    ingestion_spool_dir: str = ""
+    # Processos para extrair páginas de PDF em paralelo (0 = na thread de ingestão)
+    pdf_extraction_workers: int = 2
+    pdf_pages_per_task: int = 8
+    
+    # Crawler de sites (modo "site" de /api/documents/crawl)
+    crawler_concurrency: int = 8
+    crawler_requests_per_second_per_host: float = 2.0
+    crawler_user_agent: str = "NexusAIBot/1.0"
+    crawler_timeout_seconds: float = 20.0
+    crawler_max_page_bytes: int = 5 * 1024 * 1024
+    crawler_max_pages: int = 500
+    
+    # Extração de HTML ("lxml": parser C + remoção de boilerplate; "bs4": html.parser, página inteira)
+    html_extractor_backend: str = "lxml"
+    html_main_content: bool = True
+    
+    # Memória de conversa: resumo incremental (context_summary) + últimas mensagens literais no prompt
+    memory_recent_messages: int = 6
+    memory_history_token_budget: int = 800
+    # Mensagens não resumidas que disparam o resumo em segundo plano; as mais recentes ficam de fora
+    memory_summary_threshold: int = 16
+    memory_summary_keep_recent: int = 6
+    memory_summary_batch_size: int = 60
+    
+    # Montagem do contexto das respostas: etapas em paralelo, cada uma com tempo limite
+    # (estourado, a resposta segue sem a etapa: só busca léxica, sem base de conhecimento, sem histórico)
+    response_embedding_timeout_seconds: float = 2.0
+    response_retrieval_timeout_seconds: float = 3.0
+    response_rules_timeout_seconds: float = 3.0
+    response_history_timeout_seconds: float = 2.0
     
     # Evolution API (WhatsApp)
     evolution_api_url: str = "http://localhost:8080"
     evolution_api_key: str = ""
+    # Rotas instância → organização (em memória, invalidadas pelas rotas de integrações e por
+    # Realtime nas outras réplicas; o TTL curto limita o roteamento errado se um evento se perder)
+    instance_routes_ttl_seconds: float = 30.0
+    instance_routes_realtime_invalidation: bool = True
+    instance_routes_negative_ttl_seconds: float = 30.0
+    # Envio pelo WhatsApp: ritmo por instância (limite do WhatsApp), requisições
+    # simultâneas por instância e novas tentativas (backoff com jitter) em falhas temporárias
+    whatsapp_send_rate_per_minute: float = 60.0
+    whatsapp_send_burst: int = 10
+    whatsapp_send_concurrency: int = 4
+    whatsapp_send_max_connections: int = 20
+    whatsapp_send_timeout_seconds: float = 15.0
+    whatsapp_send_max_attempts: int = 4
+    whatsapp_send_retry_base_seconds: float = 1.0
+    whatsapp_bulk_max_recipients: int = 5000
+    # "supabase": ritmo por instância compartilhado entre as réplicas e campanhas reservadas de
+    # outbound_messages com lease (sobrevivem a deploys); "memory": tudo no processo (desenvolvimento local)
+    whatsapp_send_backend: str = "supabase"
+    whatsapp_send_lease_seconds: int = 120
+    # Envios de campanha reservados por réplica de cada vez (esperam o ritmo dentro do lease)
+    whatsapp_campaign_prefetch: int = 20
+    whatsapp_campaign_poll_seconds: float = 2.0
+    
+    # Fila de webhooks do WhatsApp ("supabase" ou "memory"): ack após gravação durável
+    webhook_queue_backend: str = "supabase"
+    # Eventos processados em paralelo (sempre um por conversa, em ordem de chegada); a conversa
+    # ocupa a vaga durante a janela de agrupamento e a geração da resposta
+    webhook_workers: int = 32
+    webhook_max_attempts: int = 3
+    webhook_retry_base_seconds: float = 2.0
+    webhook_lease_seconds: int = 120
+    webhook_poll_interval_seconds: float = 0.5
+    # Retenção de eventos concluídos (janela de deduplicação por key.id)
+    webhook_retention_hours: int = 24
+    # Backpressure da entrada: gravações simultâneas e espera máxima por vaga antes do 503
+    webhook_intake_max_concurrency: int = 64
+    webhook_intake_wait_seconds: float = 2.0
+    
+    # Mensagens seguidas do WhatsApp viram um único turno da IA: cada mensagem reinicia
+    # a janela, limitada pela espera máxima da mais antiga (0 = responder sem esperar)
+    message_coalesce_window_seconds: float = 1.5
+    message_coalesce_max_wait_seconds: float = 6.0
     
     # App Settings
     debug: bool = False
@@ -1,14 +1,48 @@
-from supabase import create_client, Client
+from typing import Optional
+from supabase import acreate_client, AsyncClient, AsyncClientOptions
 from app.config import get_settings
 
 settings = get_settings()
 
-# Criar cliente Supabase
-supabase: Client = create_client(
-    supabase_url=settings.supabase_url,
-    supabase_key=settings.supabase_service_key
-)
+# Cliente Supabase assíncrono (compartilhado por toda a aplicação).
+# O cliente PostgREST subjacente usa um único httpx.AsyncClient com HTTP/2 e
+# pool de conexões, então cada `.execute()` é aguardado sem bloquear o event loop.
+supabase: Optional[AsyncClient] = None
 
 
-def get_supabase() -> Client:
+async def init_supabase() -> AsyncClient:
+    """Criar o cliente Supabase assíncrono (chamado no startup da aplicação)"""
+    global supabase
+
+    if supabase is None:
+        supabase = await acreate_client(
+            supabase_url=settings.supabase_url,
+            supabase_key=settings.supabase_service_key,
+            options=AsyncClientOptions(
+                postgrest_client_timeout=settings.supabase_timeout_seconds,
+                storage_client_timeout=settings.supabase_storage_timeout_seconds
+            )
+        )
+
+    return supabase
+
+
+async def close_supabase():
+    """Fechar conexões do pool (chamado no shutdown da aplicação)"""
+    global supabase
+
+    if supabase is None:
+        return
+
+    try:
+        await supabase.postgrest.aclose()
+    except Exception as e:
+        print(f"Erro ao fechar cliente Supabase: {e}")
+
+    supabase = None
+
+
+def get_supabase() -> AsyncClient:
+    if supabase is None:
+        raise RuntimeError("Cliente Supabase não inicializado. Chame init_supabase() no startup.")
     return supabase
@@ -1,6 +1,17 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import chat, rules, documents, integrations, webhooks, dashboard
+from app.routers import chat, rules, documents, integrations, webhooks, whatsapp, dashboard
+from app.database import init_supabase, close_supabase
+from app.services.ingestion_queue import start_ingestion_workers, stop_ingestion_workers
+from app.services.pdf_extraction import shutdown_pool
+from app.services.rules_cache import rules_cache
+from app.services.instance_routes import instance_routes
+from app.services.conversation_memory import conversation_memory
+from app.services.webhook_queue import start_webhook_workers, stop_webhook_workers
+from app.services.whatsapp_sender import whatsapp_sender
+from app.config import get_settings
+
+settings = get_settings()
 
 app = FastAPI(
     title="Nexus AI API",
@@ -8,6 +19,31 @@ app = FastAPI(
     version="1.0.0",
 )
 
+@app.on_event("startup")
+async def startup():
+    await init_supabase()
+    start_ingestion_workers()
+    start_webhook_workers(webhooks.handle_webhook_event)
+    # Retoma campanhas pendentes em outbound_messages
+    whatsapp_sender.start()
+    if settings.rules_realtime_invalidation:
+        await rules_cache.start_realtime()
+    if settings.instance_routes_realtime_invalidation:
+        await instance_routes.start_realtime()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_ingestion_workers()
+    await stop_webhook_workers()
+    await whatsapp_sender.close()
+    await conversation_memory.close()
+    shutdown_pool()
+    await rules_cache.stop_realtime()
+    await instance_routes.stop_realtime()
+    await close_supabase()
+
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +63,7 @@ app.include_router(rules.router, prefix="/api/rules", tags=["Rules"])
 app.include_router(documents.router, prefix="/api/documents", tags=["Documents"])
 app.include_router(integrations.router, prefix="/api/integrations", tags=["Integrations"])
 app.include_router(webhooks.router, prefix="/webhooks", tags=["Webhooks"])
+app.include_router(whatsapp.router, prefix="/api/whatsapp", tags=["WhatsApp"])
 app.include_router(dashboard.router, prefix="/api/dashboard", tags=["Dashboard"])
 
 
@@ -39,6 +76,7 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+import json
 from fastapi import WebSocket, WebSocketDisconnect
 from app.services.websocket_manager import manager
 
@@ -47,8 +85,14 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
     await manager.connect(websocket, client_id)
     try:
         while True:
-            await websocket.receive_text()
-            # Keep alive or handle incoming messages if needed
+            text = await websocket.receive_text()
+            # Keep alive ou inscrição em conversas ({"type": "subscribe", "conversation_id": "..."})
+            try:
+                message = json.loads(text)
+            except ValueError:
+                continue
+            if isinstance(message, dict):
+                await manager.handle_client_message(message, client_id)
     except WebSocketDisconnect:
         manager.disconnect(websocket, client_id)
 
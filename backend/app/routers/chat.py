@@ -1,8 +1,15 @@
+import asyncio
+import uuid
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional, List
+from app.config import get_settings
 from app.database import get_supabase
 from app.services.ai_engine import AIEngine
+from app.services.conversation_memory import conversation_memory
+from app.services.response_trace import ResponseTrace
+
+settings = get_settings()
 
 router = APIRouter()
 ai_engine = AIEngine()
@@ -33,7 +40,7 @@ async def create_conversation(data: ConversationCreate):
     """Criar nova conversa"""
     supabase = get_supabase()
     
-    result = supabase.table("conversations").insert({
+    result = await supabase.table("conversations").insert({
         "organization_id": data.organization_id,
         "client_phone": data.client_phone,
         "client_name": data.client_name,
@@ -53,7 +60,7 @@ async def get_conversation(conversation_id: str):
     """Buscar conversa por ID"""
     supabase = get_supabase()
     
-    result = supabase.table("conversations").select("*").eq("id", conversation_id).single().execute()
+    result = await supabase.table("conversations").select("*").eq("id", conversation_id).single().execute()
     
     if not result.data:
         raise HTTPException(status_code=404, detail="Conversa não encontrada")
@@ -71,7 +78,7 @@ async def list_conversations(organization_id: str, status: Optional[str] = None)
     if status:
         query = query.eq("status", status)
         
-    result = query.order("updated_at", desc=True).execute()
+    result = await query.order("updated_at", desc=True).execute()
     
     return result.data
 
@@ -81,24 +88,41 @@ async def get_messages(conversation_id: str):
     """Listar mensagens de uma conversa"""
     supabase = get_supabase()
     
-    result = supabase.table("messages").select("*").eq("conversation_id", conversation_id).order("created_at").execute()
+    result = await supabase.table("messages").select("*").eq("conversation_id", conversation_id).order("created_at").execute()
     
     return result.data
 
 
 @router.post("/conversations/{conversation_id}/messages")
-async def send_message(conversation_id: str, data: MessageRequest):
-    """Enviar mensagem e obter resposta da IA"""
+async def send_message(conversation_id: str, data: MessageRequest, stream: bool = False):
+    """Enviar mensagem e obter resposta da IA
+    
+    Com `stream=true`, a resposta da IA é enviada em frames `message_delta` pelo
+    WebSocket aos inscritos na conversa e persistida uma única vez ao final.
+    Os tempos de cada etapa vão em `metadata.timings_ms` da resposta.
+    """
     from app.services.websocket_manager import manager
     supabase = get_supabase()
+    trace = ResponseTrace()
     
     # Salvar mensagem do cliente
-    client_msg = supabase.table("messages").insert({
+    insert = supabase.table("messages").insert({
         "conversation_id": conversation_id,
         "content": data.content,
         "sender": data.sender
     }).execute()
     
+    conv = recent = None
+    if data.sender == "client":
+        # Gravação, conversa e histórico em paralelo
+        client_msg, conv, recent = await asyncio.gather(
+            insert,
+            trace.timed("conversation", supabase.table("conversations").select("*").eq("id", conversation_id).single().execute()),
+            trace.stage("history", conversation_memory.fetch_recent(conversation_id), settings.response_history_timeout_seconds, default=[])
+        )
+    else:
+        client_msg = await insert
+    
     # Broadcast Client Message
     if client_msg.data:
         await manager.broadcast({
@@ -107,35 +131,64 @@ async def send_message(conversation_id: str, data: MessageRequest):
             "message": client_msg.data[0]
         })
     
-    if data.sender == "client":
-        # Buscar conversa para contexto
-        conv = supabase.table("conversations").select("*").eq("id", conversation_id).single().execute()
-        
+    if conv is not None:
         if conv.data and conv.data.get("handled_by") == "ai":
-            # Buscar histórico de mensagens
-            history = supabase.table("messages").select("*").eq("conversation_id", conversation_id).order("created_at").limit(20).execute()
+            # Memória da conversa: resumo acumulado + mensagens recentes
+            memory = conversation_memory.context(conv.data, recent, client_msg.data[0] if client_msg.data else None)
             
-            # Gerar resposta da IA
-            ai_response = await ai_engine.generate_response(
-                organization_id=conv.data["organization_id"],
-                message=data.content,
-                conversation_history=history.data
-            )
+            stream_id = None
+            if stream:
+                # Gerar resposta da IA em streaming
+                stream_id = str(uuid.uuid4())
+                parts = []
+                
+                async for delta in ai_engine.generate_response_stream(
+                    organization_id=conv.data["organization_id"],
+                    message=data.content,
+                    conversation_history=memory.messages,
+                    conversation_summary=memory.summary,
+                    trace=trace
+                ):
+                    parts.append(delta)
+                    await manager.send_to_conversation(conversation_id, {
+                        "type": "message_delta",
+                        "conversation_id": conversation_id,
+                        "stream_id": stream_id,
+                        "index": len(parts) - 1,
+                        "delta": delta
+                    })
+                
+                ai_response = "".join(parts).strip()
+            else:
+                # Gerar resposta da IA
+                ai_response = await ai_engine.generate_response(
+                    organization_id=conv.data["organization_id"],
+                    message=data.content,
+                    conversation_history=memory.messages,
+                    conversation_summary=memory.summary,
+                    trace=trace
+                )
             
             # Salvar resposta da IA
-            ai_msg = supabase.table("messages").insert({
+            ai_msg = await supabase.table("messages").insert({
                 "conversation_id": conversation_id,
                 "content": ai_response,
-                "sender": "ai"
+                "sender": "ai",
+                "metadata": trace.finish()
             }).execute()
 
             # Broadcast AI Message
             if ai_msg.data:
-                await manager.broadcast({
+                event = {
                     "type": "new_message",
                     "conversation_id": conversation_id,
                     "message": ai_msg.data[0]
-                })
+                }
+                if stream_id:
+                    event["stream_id"] = stream_id
+                await manager.broadcast(event)
+            
+            conversation_memory.schedule_summary(conv.data, memory)
             
             return {"client_message": client_msg.data[0], "ai_response": ai_msg.data[0]}
     
@@ -147,7 +200,7 @@ async def transfer_to_human(conversation_id: str):
     """Transferir conversa para atendente humano"""
     supabase = get_supabase()
     
-    result = supabase.table("conversations").update({
+    result = await supabase.table("conversations").update({
         "handled_by": "human",
         "status": "transferred"
     }).eq("id", conversation_id).execute()
@@ -1,5 +1,7 @@
+import asyncio
 from fastapi import APIRouter
 from app.database import get_supabase
+from app.services import metrics
 from datetime import datetime, timedelta
 
 router = APIRouter()
@@ -14,7 +16,7 @@ async def get_stats(organization_id: str):
     start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
     # 1. Total de Atendimentos (Mês Atual)
-    total_chats = supabase.table("conversations").select("*", count="exact")\
+    total_chats = await supabase.table("conversations").select("*", count="exact")\
         .eq("organization_id", organization_id)\
         .gte("created_at", start_of_month.isoformat())\
         .execute()
@@ -23,7 +25,7 @@ async def get_stats(organization_id: str):
     
     # 2. Taxa de Resolução IA (Conversas onde handled_by = 'ai' encerradas)
     # Nota: Simplificação - considerar 'ai' como handled_by final ou checking messages
-    ai_chats = supabase.table("conversations").select("*", count="exact")\
+    ai_chats = await supabase.table("conversations").select("*", count="exact")\
         .eq("organization_id", organization_id)\
         .eq("handled_by", "ai")\
         .gte("created_at", start_of_month.isoformat())\
@@ -36,23 +38,30 @@ async def get_stats(organization_id: str):
     # TODO: Implementar cálculo real baseado em messages.created_at
     avg_time = "1m 45s"
     
-    # 4. Volume Diário (Últimos 7 dias)
-    daily_volume = []
-    for i in range(6, -1, -1):
-        day = now - timedelta(days=i)
+    # 4. Volume Diário (Últimos 7 dias) - consultas em paralelo
+    days = [now - timedelta(days=i) for i in range(6, -1, -1)]
+    
+    async def count_day(day: datetime) -> int:
         day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
         day_end = day.replace(hour=23, minute=59, second=59, microsecond=999999)
         
-        day_chats = supabase.table("conversations").select("id", count="exact")\
+        day_chats = await supabase.table("conversations").select("id", count="exact")\
             .eq("organization_id", organization_id)\
             .gte("created_at", day_start.isoformat())\
             .lte("created_at", day_end.isoformat())\
             .execute()
-            
-        daily_volume.append({
+        
+        return day_chats.count or 0
+    
+    day_counts = await asyncio.gather(*(count_day(day) for day in days))
+    
+    daily_volume = [
+        {
             "name": day.strftime("%a"), # Mon, Tue...
-            "value": day_chats.count or 0
-        })
+            "value": count
+        }
+        for day, count in zip(days, day_counts)
+    ]
         
     return {
         "kpis": {
@@ -62,3 +71,9 @@ async def get_stats(organization_id: str):
         },
         "volume_chart": daily_volume
     }
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Métricas de desempenho em memória (fila do LLM, caches etc.)"""
+    return metrics.snapshot()
@@ -1,12 +1,23 @@
+import os
+import tempfile
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+from app.config import get_settings
 from app.database import get_supabase
-from app.services.document_processor import DocumentProcessor
+from app.services.document_processor import DocumentProcessor, document_context_cache
+from app.services.ingestion_queue import job_queue, STORAGE_BUCKET
+from app.services.semantic_cache import knowledge_versions
+from app.services.vector_index import vector_index
+
+settings = get_settings()
 
 router = APIRouter()
 processor = DocumentProcessor()
 
+# Blocos de leitura do upload ao copiar para o disco
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
 
 class DocumentCreate(BaseModel):
     organization_id: str
@@ -18,6 +29,44 @@ class DocumentCreate(BaseModel):
 class URLCrawlRequest(BaseModel):
     organization_id: str
     url: str
+    # "page": só a URL informada; "site": rastrear a partir dela (links e sitemap.xml)
+    mode: Literal["page", "site"] = "page"
+    max_depth: int = Field(2, ge=0, le=10)
+    max_pages: int = Field(settings.crawler_max_pages, ge=1, le=10000)
+    allowed_domains: List[str] = []
+    include_paths: List[str] = []
+    exclude_paths: List[str] = []
+    use_sitemap: bool = True
+
+
+async def _create_or_reuse_document(match: dict, fields: dict) -> str:
+    """Reaproveitar o documento principal com a mesma origem (reenvio ou novo scan) ou criar um novo
+    
+    Reaproveitar o ID permite reingestão incremental: só chunks alterados são embeddados.
+    """
+    supabase = get_supabase()
+    
+    query = supabase.table("documents").select("id").is_("parent_document_id", "null")
+    for column, value in match.items():
+        query = query.eq(column, value)
+    existing = await query.order("created_at", desc=True).limit(1).execute()
+    
+    if existing.data:
+        document_id = existing.data[0]["id"]
+        await supabase.table("documents").update({
+            **fields,
+            "status": "processing",
+            "error_message": None
+        }).eq("id", document_id).execute()
+        document_context_cache.invalidate(document_id)
+        return document_id
+    
+    result = await supabase.table("documents").insert({**match, **fields, "status": "processing"}).execute()
+    
+    if not result.data:
+        raise HTTPException(status_code=500, detail="Erro ao criar documento")
+    
+    return result.data[0]["id"]
 
 
 @router.get("/")
@@ -25,7 +74,7 @@ async def list_documents(organization_id: str):
     """Listar documentos de uma organização"""
     supabase = get_supabase()
     
-    result = supabase.table("documents").select("*").eq("organization_id", organization_id).is_("parent_document_id", "null").order("created_at", desc=True).execute()
+    result = await supabase.table("documents").select("*").eq("organization_id", organization_id).is_("parent_document_id", "null").order("created_at", desc=True).execute()
     
     return result.data
 
@@ -35,7 +84,7 @@ async def get_document(document_id: str):
     """Buscar documento por ID"""
     supabase = get_supabase()
     
-    result = supabase.table("documents").select("*").eq("id", document_id).single().execute()
+    result = await supabase.table("documents").select("*").eq("id", document_id).single().execute()
     
     if not result.data:
         raise HTTPException(status_code=404, detail="Documento não encontrado")
@@ -43,7 +92,7 @@ async def get_document(document_id: str):
     return result.data
 
 
-@router.post("/upload")
+@router.post("/upload", status_code=202)
 async def upload_document(
     file: UploadFile = File(...),
     organization_id: str = Form(...),
@@ -52,7 +101,6 @@ async def upload_document(
     access_level: str = Form("organization")
 ):
     """Upload de documento para processamento"""
-    import json
     import logging
     
     logger = logging.getLogger(__name__)
@@ -71,19 +119,60 @@ async def upload_document(
             detail=f"Tipo de arquivo não suportado. Use: TXT, PDF, DOCX ou CSV"
         )
     
-    # Validar tamanho (50MB)
-    content = await file.read()
-    file_size = len(content)
+    # Validar tamanho (50MB) enquanto copia para um arquivo temporário, sem carregar o upload na memória
     max_size = 50 * 1024 * 1024  # 50MB
+    spool_path = await _spool_upload(file, max_size)
+    
+    try:
+        return await _store_and_enqueue(
+            file, spool_path, organization_id, conversation_id, business_rule_ids, access_level
+        )
+    finally:
+        os.unlink(spool_path)
+
+
+async def _spool_upload(file: UploadFile, max_size: int) -> str:
+    """Copiar o upload em blocos para um arquivo temporário (HTTP 400 acima de `max_size`)"""
+    import logging
+    
+    logger = logging.getLogger(__name__)
+    fd, path = tempfile.mkstemp(dir=settings.ingestion_spool_dir or None)
+    file_size = 0
+    
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            while data := await file.read(SPOOL_CHUNK_BYTES):
+                file_size += len(data)
+                if file_size > max_size:
+                    logger.error(f"❌ Arquivo muito grande: mais de {max_size} bytes")
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Arquivo muito grande. Tamanho máximo: 50MB"
+                    )
+                spool.write(data)
+    except BaseException:
+        os.unlink(path)
+        raise
     
     logger.info(f"📊 Tamanho do arquivo: {file_size} bytes")
     
-    if file_size > max_size:
-        logger.error(f"❌ Arquivo muito grande: {file_size} bytes")
-        raise HTTPException(
-            status_code=400,
-            detail=f"Arquivo muito grande. Tamanho máximo: 50MB"
-        )
+    return path
+
+
+async def _store_and_enqueue(
+    file: UploadFile,
+    spool_path: str,
+    organization_id: str,
+    conversation_id: Optional[str],
+    business_rule_ids: Optional[str],
+    access_level: str
+):
+    """Enviar o arquivo (já em disco) ao storage, registrar o documento e enfileirar a ingestão"""
+    import json
+    import logging
+    
+    logger = logging.getLogger(__name__)
+    file_size = os.path.getsize(spool_path)
     
     supabase = get_supabase()
     
@@ -125,15 +214,16 @@ async def upload_document(
     # Upload para Supabase Storage
     try:
         logger.info("☁️ Iniciando upload para Supabase Storage...")
-        storage_response = supabase.storage.from_("nexus-documents").upload(
-            path=storage_path,
-            file=content,
-            file_options={"content-type": file.content_type, "upsert": "true"}
-        )
+        with open(spool_path, "rb") as spool:
+            storage_response = await supabase.storage.from_(STORAGE_BUCKET).upload(
+                path=storage_path,
+                file=spool,
+                file_options={"content-type": file.content_type, "upsert": "true"}
+            )
         logger.info(f"✅ Upload para storage concluído: {storage_response}")
         
         # Obter URL pública (ou assinada se privado)
-        file_url = supabase.storage.from_("nexus-documents").get_public_url(storage_path)
+        file_url = await supabase.storage.from_(STORAGE_BUCKET).get_public_url(storage_path)
         logger.info(f"🔗 URL do arquivo: {file_url}")
         
     except Exception as e:
@@ -143,76 +233,121 @@ async def upload_document(
             detail=f"Erro ao fazer upload para storage: {str(e)}"
         )
     
-    # Criar registro inicial
+    # Criar registro inicial (ou reaproveitar o do mesmo arquivo, sobrescrito no storage)
     try:
         logger.info("💾 Criando registro no banco de dados...")
-        result = supabase.table("documents").insert({
-            "organization_id": organization_id,
-            "conversation_id": conversation_id,
-            "filename": file.filename,
-            "file_type": file.content_type,
-            "file_size_bytes": file_size,
-            "file_url": file_url,
-            "storage_path": storage_path,
-            "business_rule_ids": rule_ids,
-            "access_level": access_level,
-            "status": "processing"
-        }).execute()
-        
-        if not result.data:
-            raise HTTPException(status_code=500, detail="Erro ao criar documento")
-        
-        document_id = result.data[0]["id"]
+        document_id = await _create_or_reuse_document(
+            {"organization_id": organization_id, "storage_path": storage_path},
+            {
+                "conversation_id": conversation_id,
+                "filename": file.filename,
+                "file_type": file.content_type,
+                "file_size_bytes": file_size,
+                "file_url": file_url,
+                "business_rule_ids": rule_ids,
+                "access_level": access_level
+            }
+        )
         logger.info(f"✅ Documento criado: {document_id}")
         
     except Exception as e:
         logger.error(f"❌ Erro ao criar registro: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Erro ao criar documento: {str(e)}")
     
-    # Processar documento em background (simplificado)
+    # Enfileirar processamento em background (worker de ingestão)
     try:
-        logger.info(f"🔄 Processando documento {document_id}...")
-        await processor.process_document(document_id, content, file.filename)
-        logger.info(f"✅ Documento processado com sucesso: {document_id}")
+        job = await job_queue.enqueue(
+            organization_id,
+            document_id,
+            "file",
+            {"storage_path": storage_path, "filename": file.filename}
+        )
     except Exception as e:
-        logger.error(f"❌ Erro ao processar documento: {str(e)}", exc_info=True)
-        supabase.table("documents").update({
+        logger.error(f"❌ Erro ao enfileirar documento: {str(e)}", exc_info=True)
+        await supabase.table("documents").update({
             "status": "error",
             "error_message": str(e)
         }).eq("id", document_id).execute()
-        raise HTTPException(status_code=500, detail=f"Erro ao processar documento: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao enfileirar documento: {str(e)}")
     
-    return {"message": "Documento enviado para processamento", "document_id": document_id}
+    logger.info(f"📥 Job de ingestão {job['id']} enfileirado para {document_id}")
+    
+    return {"message": "Documento enviado para processamento", "document_id": document_id, "job_id": job["id"]}
 
 
-@router.post("/crawl")
+@router.post("/crawl", status_code=202)
 async def crawl_url(data: URLCrawlRequest):
-    """Escanear URL e extrair conteúdo"""
-    supabase = get_supabase()
-    
-    # Criar registro inicial
-    result = supabase.table("documents").insert({
-        "organization_id": data.organization_id,
-        "filename": data.url,
-        "file_type": "url",
-        "status": "processing"
-    }).execute()
-    
-    if not result.data:
-        raise HTTPException(status_code=500, detail="Erro ao criar documento")
-    
-    document_id = result.data[0]["id"]
-    
-    # Processar URL em background
-    try:
-        await processor.process_url(document_id, data.url)
-    except Exception as e:
-        supabase.table("documents").update({
-            "status": "error",
-            "error_message": str(e)
-        }).eq("id", document_id).execute()
-    
-    return {"message": "URL enviada para processamento", "document_id": document_id}
+    """Escanear URL (ou rastrear o site a partir dela) e extrair conteúdo"""
+    if data.mode == "site":
+        # Documento do rastreamento; cada página vira um documento "url" ligado a ele
+        document_id = await _create_or_reuse_document(
+            {"organization_id": data.organization_id, "filename": data.url, "file_type": "site"},
+            {}
+        )
+        job = await job_queue.enqueue(data.organization_id, document_id, "site", {
+            "seed_url": data.url,
+            "max_depth": data.max_depth,
+            "max_pages": data.max_pages,
+            "allowed_domains": data.allowed_domains,
+            "include_paths": data.include_paths,
+            "exclude_paths": data.exclude_paths,
+            "use_sitemap": data.use_sitemap
+        })
+        return {"message": "Site enviado para rastreamento", "document_id": document_id, "job_id": job["id"]}
+    
+    # Criar registro inicial (um novo scan da mesma URL reaproveita o documento)
+    document_id = await _create_or_reuse_document(
+        {"organization_id": data.organization_id, "filename": data.url, "file_type": "url"},
+        {}
+    )
+    
+    # Enfileirar processamento da URL em background
+    job = await job_queue.enqueue(data.organization_id, document_id, "url", {"url": data.url})
+    
+    return {"message": "URL enviada para processamento", "document_id": document_id, "job_id": job["id"]}
+
+
+@router.get("/{document_id}/progress")
+async def get_document_progress(document_id: str):
+    """Progresso da ingestão (chunks processados / total)"""
+    job = await job_queue.get_latest_for_document(document_id)
+    
+    if not job:
+        supabase = get_supabase()
+        document = await supabase.table("documents").select("status, metadata").eq("id", document_id).maybe_single().execute()
+        
+        if not document or not document.data:
+            raise HTTPException(status_code=404, detail="Documento não encontrado")
+        
+        total = (document.data.get("metadata") or {}).get("total_chunks")
+        return {
+            "document_id": document_id,
+            "status": "done" if document.data["status"] == "ready" else document.data["status"],
+            "chunks_done": total if document.data["status"] == "ready" else 0,
+            "total_chunks": total,
+            "percent": 100.0 if document.data["status"] == "ready" else 0.0
+        }
+    
+    total = job.get("total_chunks")
+    done = job.get("chunks_done") or 0
+    
+    if job["status"] == "done":
+        percent = 100.0
+    elif total:
+        percent = round(done / total * 100, 1)
+    else:
+        percent = 0.0
+    
+    return {
+        "document_id": document_id,
+        "job_id": job["id"],
+        "status": job["status"],
+        "chunks_done": done,
+        "total_chunks": total,
+        "percent": percent,
+        "attempts": job["attempts"],
+        "error_message": job.get("error_message")
+    }
 
 
 @router.delete("/{document_id}")
@@ -220,11 +355,25 @@ async def delete_document(document_id: str):
     """Excluir documento e seus fragmentos"""
     supabase = get_supabase()
     
+    # Rastreamento de site: excluir também as páginas (e os fragmentos delas)
+    pages = await supabase.table("documents").select("id").eq("metadata->>site_document_id", document_id).is_("parent_document_id", "null").execute()
+    page_ids = [page["id"] for page in pages.data or []]
+    for start in range(0, len(page_ids), 100):
+        batch = page_ids[start:start + 100]
+        await supabase.table("documents").delete().in_("parent_document_id", batch).execute()
+        await supabase.table("documents").delete().in_("id", batch).execute()
+    
     # Excluir fragmentos primeiro
-    supabase.table("documents").delete().eq("parent_document_id", document_id).execute()
+    await supabase.table("documents").delete().eq("parent_document_id", document_id).execute()
     
     # Excluir documento principal
-    supabase.table("documents").delete().eq("id", document_id).execute()
+    result = await supabase.table("documents").delete().eq("id", document_id).execute()
+    
+    # Respostas em cache podem citar o documento excluído
+    for document in result.data or []:
+        knowledge_versions.invalidate(document.get("organization_id"))
+        for removed_id in [document_id] + page_ids:
+            vector_index.remove_document(document.get("organization_id"), removed_id)
     
     return {"message": "Documento excluído com sucesso"}
 
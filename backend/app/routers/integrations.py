@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional
 from app.database import get_supabase
+from app.services.instance_routes import instance_routes
 
 router = APIRouter()
 
@@ -24,7 +25,7 @@ async def list_integrations(organization_id: str):
     """Listar integrações de uma organização"""
     supabase = get_supabase()
     
-    result = supabase.table("integrations").select("*").eq("organization_id", organization_id).execute()
+    result = await supabase.table("integrations").select("*").eq("organization_id", organization_id).execute()
     
     return result.data
 
@@ -34,7 +35,7 @@ async def get_integration(integration_id: str):
     """Buscar integração por ID"""
     supabase = get_supabase()
     
-    result = supabase.table("integrations").select("*").eq("id", integration_id).single().execute()
+    result = await supabase.table("integrations").select("*").eq("id", integration_id).single().execute()
     
     if not result.data:
         raise HTTPException(status_code=404, detail="Integração não encontrada")
@@ -47,11 +48,13 @@ async def create_integration(data: IntegrationCreate):
     """Criar nova integração"""
     supabase = get_supabase()
     
-    result = supabase.table("integrations").insert(data.model_dump()).execute()
+    result = await supabase.table("integrations").insert(data.model_dump()).execute()
     
     if not result.data:
         raise HTTPException(status_code=500, detail="Erro ao criar integração")
     
+    instance_routes.invalidate()
+    
     return result.data[0]
 
 
@@ -62,11 +65,13 @@ async def update_integration(integration_id: str, data: IntegrationUpdate):
     
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
     
-    result = supabase.table("integrations").update(update_data).eq("id", integration_id).execute()
+    result = await supabase.table("integrations").update(update_data).eq("id", integration_id).execute()
     
     if not result.data:
         raise HTTPException(status_code=404, detail="Integração não encontrada")
     
+    instance_routes.invalidate()
+    
     return result.data[0]
 
 
@@ -75,7 +80,9 @@ async def delete_integration(integration_id: str):
     """Excluir integração"""
     supabase = get_supabase()
     
-    supabase.table("integrations").delete().eq("id", integration_id).execute()
+    await supabase.table("integrations").delete().eq("id", integration_id).execute()
+    
+    instance_routes.invalidate()
     
     return {"message": "Integração excluída com sucesso"}
 
@@ -93,7 +100,7 @@ async def list_api_keys(organization_id: str):
     """Listar API Keys de uma organização"""
     supabase = get_supabase()
     
-    result = supabase.table("api_keys").select("id, name, key_prefix, permissions, is_active, created_at, last_used_at").eq("organization_id", organization_id).execute()
+    result = await supabase.table("api_keys").select("id, name, key_prefix, permissions, is_active, created_at, last_used_at").eq("organization_id", organization_id).execute()
     
     return result.data
 
@@ -111,7 +118,7 @@ async def create_api_key(data: APIKeyCreate):
     key_hash = hashlib.sha256(key.encode()).hexdigest()
     key_prefix = key[:12] + "..."
     
-    result = supabase.table("api_keys").insert({
+    result = await supabase.table("api_keys").insert({
         "organization_id": data.organization_id,
         "name": data.name,
         "key_hash": key_hash,
@@ -136,6 +143,6 @@ async def delete_api_key(key_id: str):
     """Revogar API Key"""
     supabase = get_supabase()
     
-    supabase.table("api_keys").update({"is_active": False}).eq("id", key_id).execute()
+    await supabase.table("api_keys").update({"is_active": False}).eq("id", key_id).execute()
     
     return {"message": "API Key revogada com sucesso"}
@@ -1,7 +1,15 @@
-from fastapi import APIRouter, HTTPException
+import csv
+import io
+from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List, Any
+from typing import Optional, List, Dict, Any
+from app.config import get_settings
 from app.database import get_supabase
+from app.services.rules_cache import rules_cache
+from app.services.blacklist_index import blacklist_index, normalize_phone, normalize_many, InvalidPhoneNumber, PAGE_SIZE
+
+settings = get_settings()
 
 router = APIRouter()
 
@@ -34,7 +42,7 @@ async def list_rules(organization_id: str):
     """Listar todas as regras de uma organização"""
     supabase = get_supabase()
     
-    result = supabase.table("business_rules").select("*").eq("organization_id", organization_id).order("priority", desc=True).execute()
+    result = await supabase.table("business_rules").select("*").eq("organization_id", organization_id).order("priority", desc=True).execute()
     
     return result.data
 
@@ -44,7 +52,7 @@ async def get_rule(rule_id: str):
     """Buscar regra por ID"""
     supabase = get_supabase()
     
-    result = supabase.table("business_rules").select("*").eq("id", rule_id).single().execute()
+    result = await supabase.table("business_rules").select("*").eq("id", rule_id).single().execute()
     
     if not result.data:
         raise HTTPException(status_code=404, detail="Regra não encontrada")
@@ -57,11 +65,13 @@ async def create_rule(data: RuleCreate):
     """Criar nova regra"""
     supabase = get_supabase()
     
-    result = supabase.table("business_rules").insert(data.model_dump()).execute()
+    result = await supabase.table("business_rules").insert(data.model_dump()).execute()
     
     if not result.data:
         raise HTTPException(status_code=500, detail="Erro ao criar regra")
     
+    rules_cache.invalidate(result.data[0]["organization_id"])
+    
     return result.data[0]
 
 
@@ -72,11 +82,13 @@ async def update_rule(rule_id: str, data: RuleUpdate):
     
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
     
-    result = supabase.table("business_rules").update(update_data).eq("id", rule_id).execute()
+    result = await supabase.table("business_rules").update(update_data).eq("id", rule_id).execute()
     
     if not result.data:
         raise HTTPException(status_code=404, detail="Regra não encontrada")
     
+    rules_cache.invalidate(result.data[0]["organization_id"])
+    
     return result.data[0]
 
 
@@ -85,7 +97,10 @@ async def delete_rule(rule_id: str):
     """Excluir regra"""
     supabase = get_supabase()
     
-    result = supabase.table("business_rules").delete().eq("id", rule_id).execute()
+    result = await supabase.table("business_rules").delete().eq("id", rule_id).execute()
+    
+    for rule in result.data or []:
+        rules_cache.invalidate(rule["organization_id"])
     
     return {"message": "Regra excluída com sucesso"}
 
@@ -96,14 +111,16 @@ async def toggle_rule(rule_id: str):
     supabase = get_supabase()
     
     # Buscar estado atual
-    current = supabase.table("business_rules").select("is_active").eq("id", rule_id).single().execute()
+    current = await supabase.table("business_rules").select("is_active").eq("id", rule_id).single().execute()
     
     if not current.data:
         raise HTTPException(status_code=404, detail="Regra não encontrada")
     
     # Inverter estado
     new_state = not current.data["is_active"]
-    result = supabase.table("business_rules").update({"is_active": new_state}).eq("id", rule_id).execute()
+    result = await supabase.table("business_rules").update({"is_active": new_state}).eq("id", rule_id).execute()
+    
+    rules_cache.invalidate(result.data[0]["organization_id"])
     
     return {"is_active": new_state, "rule": result.data[0]}
 
@@ -117,14 +134,88 @@ class BlacklistCreate(BaseModel):
     phone_numbers: List[str] = []
 
 
+async def _get_blacklist(blacklist_id: str) -> dict:
+    supabase = get_supabase()
+    
+    result = await supabase.table("blacklists").select("id, organization_id").eq("id", blacklist_id).maybe_single().execute()
+    
+    if not result or not result.data:
+        raise HTTPException(status_code=404, detail="Blacklist não encontrada")
+    
+    return result.data
+
+
+async def _insert_entries(blacklist: dict, phone_numbers: List[str]) -> List[str]:
+    """Inserir números já normalizados em lotes; retorna os que eram novos"""
+    supabase = get_supabase()
+    batch_size = settings.blacklist_import_batch_size
+    inserted = []
+    
+    for start in range(0, len(phone_numbers), batch_size):
+        rows = [
+            {
+                "organization_id": blacklist["organization_id"],
+                "blacklist_id": blacklist["id"],
+                "phone_number": number
+            }
+            for number in phone_numbers[start:start + batch_size]
+        ]
+        result = await supabase.table("blacklist_entries").upsert(
+            rows,
+            on_conflict="blacklist_id,phone_number",
+            ignore_duplicates=True
+        ).execute()
+        inserted.extend(row["phone_number"] for row in result.data or [])
+    
+    blacklist_index.added(blacklist["organization_id"], inserted)
+    
+    return inserted
+
+
+def _normalize_or_400(phone_number: str) -> str:
+    try:
+        return normalize_phone(phone_number)
+    except InvalidPhoneNumber as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _entries_by_blacklist(organization_id: str) -> Dict[str, List[str]]:
+    """Números de cada blacklist da organização (paginação por id)"""
+    supabase = get_supabase()
+    numbers: Dict[str, List[str]] = {}
+    last_id = None
+    
+    while True:
+        query = supabase.table("blacklist_entries").select("id, blacklist_id, phone_number").eq("organization_id", organization_id)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        result = await query.order("id").limit(PAGE_SIZE).execute()
+        
+        rows = result.data or []
+        for row in rows:
+            numbers.setdefault(row["blacklist_id"], []).append(row["phone_number"])
+        
+        if len(rows) < PAGE_SIZE:
+            break
+        last_id = rows[-1]["id"]
+    
+    return numbers
+
+
 @router.get("/blacklists/")
 async def list_blacklists(organization_id: str):
-    """Listar blacklists de uma organização"""
+    """Listar blacklists de uma organização (com os números e o total)"""
     supabase = get_supabase()
     
-    result = supabase.table("blacklists").select("*").eq("organization_id", organization_id).execute()
+    result = await supabase.table("blacklists").select("id, organization_id, name, description, created_at, updated_at").eq("organization_id", organization_id).execute()
+    numbers = await _entries_by_blacklist(organization_id)
     
-    return result.data
+    blacklists = []
+    for row in result.data or []:
+        phone_numbers = numbers.get(row["id"], [])
+        blacklists.append({**row, "phone_numbers": phone_numbers, "total_numbers": len(phone_numbers)})
+    
+    return blacklists
 
 
 @router.post("/blacklists/")
@@ -132,32 +223,28 @@ async def create_blacklist(data: BlacklistCreate):
     """Criar nova blacklist"""
     supabase = get_supabase()
     
-    result = supabase.table("blacklists").insert(data.model_dump()).execute()
+    numbers = normalize_many(data.phone_numbers)
+    
+    result = await supabase.table("blacklists").insert(data.model_dump(exclude={"phone_numbers"})).execute()
     
     if not result.data:
         raise HTTPException(status_code=500, detail="Erro ao criar blacklist")
     
-    return result.data[0]
+    blacklist = result.data[0]
+    inserted = await _insert_entries(blacklist, numbers["valid"])
+    
+    return {**blacklist, "total_numbers": len(inserted), "invalid_numbers": numbers["invalid"]}
 
 
 @router.post("/blacklists/{blacklist_id}/add")
 async def add_to_blacklist(blacklist_id: str, phone_number: str):
     """Adicionar número à blacklist"""
-    supabase = get_supabase()
-    
-    # Buscar blacklist atual
-    current = supabase.table("blacklists").select("phone_numbers").eq("id", blacklist_id).single().execute()
-    
-    if not current.data:
-        raise HTTPException(status_code=404, detail="Blacklist não encontrada")
+    number = _normalize_or_400(phone_number)
+    blacklist = await _get_blacklist(blacklist_id)
     
-    # Adicionar número
-    numbers = current.data["phone_numbers"] or []
-    if phone_number not in numbers:
-        numbers.append(phone_number)
-        supabase.table("blacklists").update({"phone_numbers": numbers}).eq("id", blacklist_id).execute()
+    await _insert_entries(blacklist, [number])
     
-    return {"message": "Número adicionado à blacklist", "phone_numbers": numbers}
+    return {"message": "Número adicionado à blacklist", "phone_number": number}
 
 
 @router.post("/blacklists/{blacklist_id}/remove")
@@ -165,14 +252,67 @@ async def remove_from_blacklist(blacklist_id: str, phone_number: str):
     """Remover número da blacklist"""
     supabase = get_supabase()
     
-    current = supabase.table("blacklists").select("phone_numbers").eq("id", blacklist_id).single().execute()
+    number = _normalize_or_400(phone_number)
+    blacklist = await _get_blacklist(blacklist_id)
     
-    if not current.data:
-        raise HTTPException(status_code=404, detail="Blacklist não encontrada")
+    result = await supabase.table("blacklist_entries").delete().eq("blacklist_id", blacklist_id).eq("phone_number", number).execute()
+    
+    blacklist_index.removed(blacklist["organization_id"], [row["phone_number"] for row in result.data or []])
+    
+    return {"message": "Número removido da blacklist", "phone_number": number}
+
+
+@router.post("/blacklists/{blacklist_id}/import")
+async def import_blacklist(blacklist_id: str, file: UploadFile = File(...)):
+    """Importar números em massa (CSV ou TXT; primeira coluna de cada linha)"""
+    blacklist = await _get_blacklist(blacklist_id)
+    
+    content = (await file.read()).decode("utf-8-sig", errors="ignore")
+    
+    raw_numbers = [row[0] for row in csv.reader(io.StringIO(content)) if row]
+    # Ignorar cabeçalho e linhas sem dígitos
+    raw_numbers = [raw for raw in raw_numbers if any(ch.isdigit() for ch in raw)]
+    
+    numbers = normalize_many(raw_numbers)
+    inserted = await _insert_entries(blacklist, numbers["valid"])
+    
+    return {
+        "message": "Importação concluída",
+        "received": len(raw_numbers),
+        "imported": len(inserted),
+        "duplicates": len(numbers["valid"]) - len(inserted),
+        "invalid": len(numbers["invalid"]),
+        "invalid_sample": numbers["invalid"][:20]
+    }
+
+
+@router.get("/blacklists/{blacklist_id}/export")
+async def export_blacklist(blacklist_id: str):
+    """Exportar números da blacklist em CSV (streaming, paginado por chave)"""
+    await _get_blacklist(blacklist_id)
     
-    numbers = current.data["phone_numbers"] or []
-    if phone_number in numbers:
-        numbers.remove(phone_number)
-        supabase.table("blacklists").update({"phone_numbers": numbers}).eq("id", blacklist_id).execute()
+    async def rows():
+        supabase = get_supabase()
+        last_id = None
+        
+        yield "phone_number,created_at\n"
+        
+        while True:
+            query = supabase.table("blacklist_entries").select("id, phone_number, created_at").eq("blacklist_id", blacklist_id)
+            if last_id is not None:
+                query = query.gt("id", last_id)
+            result = await query.order("id").limit(PAGE_SIZE).execute()
+            
+            page = result.data or []
+            if page:
+                yield "".join(f"{row['phone_number']},{row.get('created_at') or ''}\n" for row in page)
+            
+            if len(page) < PAGE_SIZE:
+                break
+            last_id = page[-1]["id"]
     
-    return {"message": "Número removido da blacklist", "phone_numbers": numbers}
+    return StreamingResponse(
+        rows(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="blacklist-{blacklist_id}.csv"'}
+    )
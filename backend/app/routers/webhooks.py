@@ -1,9 +1,27 @@
-from fastapi import APIRouter, Request, HTTPException, BackgroundTasks
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
+from app.config import get_settings
 from app.database import get_supabase
 from app.services.ai_engine import AIEngine
+from app.services.conversation_memory import ConversationContext, conversation_memory
+from app.services.instance_routes import instance_routes
+from app.services.message_coalescer import message_coalescer
+from app.services.response_trace import ResponseTrace
 from app.services.rules_engine import RulesEngine
+from app.services.webhook_queue import WebhookBackpressure, WebhookBatch, webhook_intake
+from app.services.whatsapp_sender import whatsapp_sender
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 ai_engine = AIEngine()
@@ -21,73 +39,242 @@ class EvolutionWebhook(BaseModel):
     data: Dict[str, Any]
 
 
-async def process_incoming_message(organization_id: str, phone: str, message: str, instance: str):
-    """Processar mensagem recebida"""
+@dataclass
+class _IncomingMessage:
+    """Mensagem do cliente já gravada, aguardando o turno da IA"""
+    organization_id: str
+    instance: str
+    phone: str
+    conversation: Dict[str, Any]
+    record: Optional[Dict[str, Any]]
+    text: str
+    rules_context: Dict[str, Any]
+    trace: ResponseTrace
+    # Chegada ao webhook (epoch): a janela de agrupamento conta daqui, não da saída da fila
+    received_at: float = field(default_factory=time.time)
+
+
+def _message_key(event: Dict[str, Any]) -> str:
+    """Chave da mensagem do cliente gravada a partir do evento (única como em `webhook_events`)"""
+    return f"{event.get('source', 'evolution')}:{event['instance']}:{event['event_key']}"
+
+
+def _received_at(event: Dict[str, Any]) -> float:
+    created_at = event.get("created_at")
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+    return created_at.timestamp() if created_at else time.time()
+
+
+async def record_incoming_message(
+    organization_id: str,
+    phone: str,
+    message: str,
+    instance: str,
+    event_key: str
+) -> Tuple[str, Optional[_IncomingMessage]]:
+    """Gravar mensagem recebida; retorna a ação das regras e a mensagem, se a IA deve responder
+    
+    Regras, conversa ativa e gravação anterior do mesmo evento (`event_key`)
+    são buscadas em paralelo. A fila entrega pelo menos uma vez: numa
+    reentrega, a mensagem já gravada é reaproveitada e, se já foi respondida,
+    nada é refeito ("duplicate"). A resposta não é gerada aqui:
+    `handle_webhook_event` junta mensagens seguidas em um turno.
+    """
     supabase = get_supabase()
+    trace = ResponseTrace()
+    
+    # 1. Verificar regras de negócio, buscar conversa ativa e gravação anterior do evento
+    rule_result, existing, recorded = await asyncio.gather(
+        trace.timed("rules_evaluation", rules_engine.evaluate(organization_id, phone, message)),
+        trace.timed("conversation", supabase.table("conversations").select("*").eq("organization_id", organization_id).eq(
+            "client_phone", phone
+        ).eq("status", "active").order("created_at", desc=True).limit(1).execute()),
+        _recorded_message(event_key)
+    )
     
-    # 1. Verificar regras de negócio
-    rule_result = await rules_engine.evaluate(organization_id, phone, message)
+    if recorded is not None and await _answered(recorded):
+        return "duplicate", None
     
     if rule_result["action"] == "block":
         # Número na blacklist, ignorar
-        return
-    
-    # 2. Buscar ou criar conversa
-    existing = supabase.table("conversations").select("*").eq("client_phone", phone).eq("status", "active").single().execute()
+        return rule_result["action"], None
     
+    # 2. Conversa existente ou nova
     if existing.data:
-        conversation_id = existing.data["id"]
+        conversation = existing.data[0]
     else:
-        new_conv = supabase.table("conversations").insert({
+        new_conv = await supabase.table("conversations").insert({
             "organization_id": organization_id,
             "client_phone": phone,
             "channel": "whatsapp",
             "status": "active",
             "handled_by": "ai"
         }).execute()
-        conversation_id = new_conv.data[0]["id"]
+        conversation = new_conv.data[0]
+    conversation_id = conversation["id"]
     
-    # 3. Salvar mensagem do cliente
-    supabase.table("messages").insert({
-        "conversation_id": conversation_id,
-        "content": message,
-        "sender": "client"
-    }).execute()
+    # 3. Salvar mensagem do cliente (uma vez por evento)
+    if recorded is None:
+        client_msg = await supabase.table("messages").upsert({
+            "conversation_id": conversation_id,
+            "content": message,
+            "sender": "client",
+            "event_key": event_key
+        }, on_conflict="event_key", ignore_duplicates=True).execute()
+        recorded = client_msg.data[0] if client_msg.data else None
     
     # 4. Verificar se deve transferir
     if rule_result["action"] == "transfer":
-        supabase.table("conversations").update({
+        await supabase.table("conversations").update({
             "handled_by": "human",
             "status": "transferred"
         }).eq("id", conversation_id).execute()
+        return rule_result["action"], None
+    
+    # 5. Mensagem para o turno da IA
+    if conversation.get("handled_by") != "ai":
+        return rule_result["action"], None
+    
+    return rule_result["action"], _IncomingMessage(
+        organization_id=organization_id,
+        instance=instance,
+        phone=phone,
+        conversation=conversation,
+        record=recorded,
+        text=message,
+        rules_context=rule_result.get("context", {}),
+        trace=trace
+    )
+
+
+async def _recorded_message(event_key: str) -> Optional[Dict[str, Any]]:
+    supabase = get_supabase()
+    
+    result = await supabase.table("messages").select("id, conversation_id, sender, content, created_at").eq("event_key", event_key).limit(1).execute()
+    
+    return result.data[0] if result.data else None
+
+
+async def _answered(record: Dict[str, Any]) -> bool:
+    """Se a conversa já tem resposta (IA ou atendente) depois da mensagem"""
+    supabase = get_supabase()
+    
+    result = await supabase.table("messages").select("id").eq("conversation_id", record["conversation_id"]).in_(
+        "sender", ["ai", "agent"]
+    ).gt("created_at", record["created_at"]).limit(1).execute()
+    
+    return bool(result.data)
+
+
+async def _generate_turn(items: List[_IncomingMessage]) -> Tuple[str, ConversationContext]:
+    """Gerar uma resposta para todas as mensagens do turno (nada é gravado aqui)"""
+    latest = items[-1]
+    
+    # Histórico buscado depois do agrupamento: já inclui todas as mensagens do turno
+    recent = await latest.trace.stage(
+        "history", conversation_memory.fetch_recent(latest.conversation["id"]), settings.response_history_timeout_seconds, default=[]
+    )
+    memory = conversation_memory.context(latest.conversation, recent, latest.record)
+    
+    ai_response = await ai_engine.generate_response(
+        organization_id=latest.organization_id,
+        message="\n".join(item.text for item in items),
+        conversation_history=memory.messages,
+        rules_context=latest.rules_context,
+        conversation_summary=memory.summary,
+        trace=latest.trace
+    )
+    return ai_response, memory
+
+
+async def _deliver_turn(items: List[_IncomingMessage], result: Tuple[str, ConversationContext]):
+    """Gravar e enviar a resposta do turno"""
+    supabase = get_supabase()
+    latest = items[-1]
+    ai_response, memory = result
+    
+    metadata = latest.trace.finish()
+    if len(items) > 1:
+        metadata["coalesced_messages"] = len(items)
+    
+    # Salvar resposta
+    saved = await supabase.table("messages").insert({
+        "conversation_id": latest.conversation["id"],
+        "content": ai_response,
+        "sender": "ai",
+        "metadata": metadata
+    }).execute()
+    
+    conversation_memory.schedule_summary(latest.conversation, memory)
+    
+    # Enviar pelo WhatsApp (aguarda: a próxima resposta da conversa sai depois desta)
+    await whatsapp_sender.send(
+        latest.instance,
+        latest.phone,
+        ai_response,
+        organization_id=latest.organization_id,
+        message_id=saved.data[0]["id"] if saved.data else None
+    )
+
+
+async def handle_webhook_event(event: Dict[str, Any], batch: Optional[WebhookBatch] = None):
+    """Processar um evento da fila de webhooks (chamado pelos workers, um por conversa por vez)
+    
+    Mensagens seguintes do mesmo cliente que chegam na janela de agrupamento são
+    absorvidas do `batch` (a conversa continua reservada a este worker) e
+    respondidas em um único turno; todos os eventos só são concluídos depois da
+    entrega da resposta. Reentregas de eventos já respondidos não geram outro
+    turno (`record_incoming_message`).
+    """
+    payload = event["payload"]
+    
+    # Organização pela instância (tabela de rotas em memória)
+    route = await instance_routes.resolve(event["instance"])
+    
+    if route is None:
+        logger.warning(f"⚠️ Instância {event['instance']} sem integração WhatsApp; evento {event['id']} descartado")
         return
     
-    # 5. Gerar resposta da IA
-    conversation = supabase.table("conversations").select("*").eq("id", conversation_id).single().execute()
-    if conversation.data.get("handled_by") == "ai":
-        history = supabase.table("messages").select("*").eq("conversation_id", conversation_id).order("created_at").limit(20).execute()
-        
-        ai_response = await ai_engine.generate_response(
-            organization_id=organization_id,
-            message=message,
-            conversation_history=history.data,
-            rules_context=rule_result.get("context", {})
-        )
-        
-        # Salvar resposta
-        supabase.table("messages").insert({
-            "conversation_id": conversation_id,
-            "content": ai_response,
-            "sender": "ai"
-        }).execute()
-        
-        # TODO: Enviar resposta via Evolution API
-        # await send_whatsapp_message(instance, phone, ai_response)
+    _, item = await record_incoming_message(
+        route.organization_id, payload["phone"], payload["text"], event["instance"], _message_key(event)
+    )
+    if item is None:
+        return
+    item.received_at = _received_at(event)
+    
+    async def absorb() -> Optional[List[_IncomingMessage]]:
+        if batch is None:
+            return []
+        items: List[_IncomingMessage] = []
+        transferred = False
+        # Todos os absorvidos são gravados (serão concluídos com o turno), mesmo após uma transferência
+        for follower in await batch.absorb():
+            action, next_item = await record_incoming_message(
+                route.organization_id, follower["payload"]["phone"], follower["payload"]["text"], follower["instance"], _message_key(follower)
+            )
+            transferred = transferred or action == "transfer"
+            if next_item is not None:
+                next_item.received_at = _received_at(follower)
+                items.append(next_item)
+        # Transferida para humano: o turno pendente da IA é descartado
+        return None if transferred else items
+    
+    await message_coalescer.run(
+        item.conversation["id"], [item], absorb, _generate_turn, _deliver_turn, arrival=lambda message: message.received_at
+    )
 
 
 @router.post("/evolution")
-async def evolution_webhook(request: Request, background_tasks: BackgroundTasks):
-    """Webhook da Evolution API (WhatsApp)"""
+async def evolution_webhook(request: Request):
+    """Webhook da Evolution API (WhatsApp)
+    
+    Responde assim que o evento está gravado na fila durável (`webhook_events`);
+    o atendimento roda nos workers de webhook, em ordem dentro de cada conversa.
+    Reentregas da mesma mensagem (key.id) são ignoradas; com a fila sem
+    capacidade, responde 503 com Retry-After. `messages.update` registra o
+    status de entrega das mensagens enviadas.
+    """
     try:
         body = await request.json()
         event = body.get("event")
@@ -96,31 +283,42 @@ async def evolution_webhook(request: Request, background_tasks: BackgroundTasks)
         
         if event == "messages.upsert":
             # Nova mensagem recebida
+            key = data.get("key", {})
             message_data = data.get("message", {})
             
-            if message_data.get("fromMe"):
+            if key.get("fromMe") or message_data.get("fromMe"):
                 # Mensagem enviada, ignorar
                 return {"status": "ignored"}
             
-            phone = data.get("key", {}).get("remoteJid", "").replace("@s.whatsapp.net", "")
+            phone = key.get("remoteJid", "").replace("@s.whatsapp.net", "")
             text = message_data.get("conversation") or message_data.get("extendedTextMessage", {}).get("text", "")
             
             if phone and text:
-                # Buscar organização pelo instance
-                supabase = get_supabase()
-                integration = supabase.table("integrations").select("organization_id").eq("type", "whatsapp").eq("config->>instance", instance).single().execute()
-                
-                if integration.data:
-                    background_tasks.add_task(
-                        process_incoming_message,
-                        integration.data["organization_id"],
-                        phone,
-                        text,
-                        instance
-                    )
+                event_key = key.get("id") or hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+                queued = await webhook_intake.submit(
+                    instance,
+                    event_key,
+                    f"{instance}:{phone}",
+                    {"phone": phone, "text": text}
+                )
+                return {"status": "queued" if queued else "duplicate"}
+        
+        elif event == "messages.update":
+            # Status de entrega das mensagens enviadas (v2: objeto; v1: lista com key/update)
+            updates = data if isinstance(data, list) else [data]
+            for update in updates:
+                if update.get("fromMe", update.get("key", {}).get("fromMe")) is False:
+                    # Status de mensagens recebidas (leitura pelo atendimento), não de envios
+                    continue
+                provider_message_id = update.get("keyId") or update.get("key", {}).get("id")
+                status = update.get("status", update.get("update", {}).get("status"))
+                if provider_message_id and status is not None:
+                    await whatsapp_sender.record_status(instance, provider_message_id, status, update)
         
         return {"status": "ok"}
     
+    except WebhookBackpressure as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -133,13 +331,13 @@ async def erp_webhook(integration_id: str, request: Request):
         supabase = get_supabase()
         
         # Buscar integração
-        integration = supabase.table("integrations").select("*").eq("id", integration_id).single().execute()
+        integration = await supabase.table("integrations").select("*").eq("id", integration_id).single().execute()
         
         if not integration.data:
             raise HTTPException(status_code=404, detail="Integração não encontrada")
         
         # Log do webhook
-        supabase.table("audit_logs").insert({
+        await supabase.table("audit_logs").insert({
             "organization_id": integration.data["organization_id"],
             "action": "webhook_received",
             "entity_type": "integration",
@@ -148,7 +346,7 @@ async def erp_webhook(integration_id: str, request: Request):
         }).execute()
         
         # Atualizar last_sync
-        supabase.table("integrations").update({
+        await supabase.table("integrations").update({
             "last_sync_at": "now()"
         }).eq("id", integration_id).execute()
         
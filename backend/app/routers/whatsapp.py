@@ -0,0 +1,79 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import List, Optional
+from app.config import get_settings
+from app.database import get_supabase
+from app.services.whatsapp_sender import whatsapp_sender
+
+settings = get_settings()
+
+router = APIRouter()
+
+
+class SendRequest(BaseModel):
+    organization_id: str
+    phone: str
+    text: str
+    instance: Optional[str] = None
+
+
+class CampaignCreate(BaseModel):
+    organization_id: str
+    text: str
+    phones: List[str]
+    instance: Optional[str] = None
+
+
+async def _whatsapp_instance(organization_id: str, instance: Optional[str]) -> str:
+    """Instância da Evolution API da organização (a informada precisa pertencer a ela)"""
+    supabase = get_supabase()
+    
+    query = supabase.table("integrations").select("config").eq("organization_id", organization_id).eq("type", "whatsapp")
+    if instance:
+        query = query.eq("config->>instance", instance)
+    result = await query.limit(1).execute()
+    
+    if not result.data or not (result.data[0].get("config") or {}).get("instance"):
+        raise HTTPException(status_code=404, detail="Integração WhatsApp não encontrada")
+    
+    return result.data[0]["config"]["instance"]
+
+
+@router.post("/send")
+async def send_message(data: SendRequest):
+    """Enviar uma mensagem (aguarda o envio, com novas tentativas)"""
+    instance = await _whatsapp_instance(data.organization_id, data.instance)
+    
+    message = await whatsapp_sender.send(instance, data.phone, data.text, organization_id=data.organization_id)
+    
+    if message.status == "failed":
+        raise HTTPException(status_code=502, detail=f"Falha no envio: {message.error}")
+    
+    return {"id": message.id, "status": message.status, "provider_message_id": message.provider_message_id}
+
+
+@router.post("/campaigns", status_code=202)
+async def create_campaign(data: CampaignCreate):
+    """Enfileirar uma campanha (envio em segundo plano, no ritmo permitido para a instância)"""
+    if not data.phones:
+        raise HTTPException(status_code=400, detail="Nenhum destinatário informado")
+    if len(data.phones) > settings.whatsapp_bulk_max_recipients:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo de {settings.whatsapp_bulk_max_recipients} destinatários por campanha"
+        )
+    
+    instance = await _whatsapp_instance(data.organization_id, data.instance)
+    
+    return await whatsapp_sender.send_bulk(instance, data.phones, data.text, organization_id=data.organization_id)
+
+
+@router.get("/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: str):
+    """Progresso da campanha: envios por status (queued, sent, delivered, read, failed)"""
+    counts = await whatsapp_sender.campaign_status(campaign_id)
+    
+    if not counts:
+        raise HTTPException(status_code=404, detail="Campanha não encontrada")
+    
+    return {"campaign_id": campaign_id, "total": sum(counts.values()), "status": counts}
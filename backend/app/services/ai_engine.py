@@ -1,11 +1,34 @@
+import asyncio
+import time
 import google.generativeai as genai
+from dataclasses import dataclass
 from app.config import get_settings
-from app.database import get_supabase
-from typing import List, Dict, Any, Optional
+from app.services.llm_scheduler import llm_scheduler
+from app.services.rules_cache import rules_cache
+from app.services.embedding_cache import query_embedding_cache
+from app.services.retrieval import retrieve
+from app.services.semantic_cache import semantic_cache, knowledge_versions, Versions
+from app.services.chunker import count_tokens
+from app.services.response_trace import ResponseTrace
+from typing import List, Dict, Any, Optional, AsyncIterator, Awaitable, Tuple, Union
 
 settings = get_settings()
 genai.configure(api_key=settings.gemini_api_key)
 
+FALLBACK_RESPONSE = "Desculpe, ocorreu um erro ao processar sua mensagem. Por favor, tente novamente ou aguarde que um atendente humano irá ajudá-lo."
+
+# Sentimento assumido quando a análise falha
+NEUTRAL_SENTIMENT = {"sentiment": "neutral", "score": 0.5, "keywords": []}
+
+
+@dataclass
+class _ResponseContext:
+    """Resultado da montagem do contexto: resposta do cache semântico ou prompt para o Gemini"""
+    cached: Optional[str] = None
+    prompt: Optional[str] = None
+    query_embedding: Optional[List[float]] = None
+    cache_key: Optional[Tuple[Versions, str]] = None
+
 
 class AIEngine:
     def __init__(self):
@@ -16,28 +39,203 @@ class AIEngine:
         organization_id: str,
         message: str,
         conversation_history: List[Dict[str, Any]] = None,
-        rules_context: Dict[str, Any] = None
+        rules_context: Dict[str, Any] = None,
+        conversation_summary: Optional[str] = None,
+        trace: Optional[ResponseTrace] = None
     ) -> str:
         """Gerar resposta usando RAG + Gemini"""
         
-        # 1. Buscar contexto relevante da base de conhecimento
-        knowledge_context = await self._search_knowledge(organization_id, message)
+        trace = trace or ResponseTrace()
+        context = await self._assemble_context(
+            organization_id, message, conversation_history, rules_context, conversation_summary, trace
+        )
+        
+        if context.cached:
+            return context.cached
+        if context.prompt is None:
+            return FALLBACK_RESPONSE
         
-        # 2. Buscar regras aplicáveis
-        business_rules = await self._get_business_rules(organization_id)
+        started = time.perf_counter()
+        try:
+            response = await self._generate(organization_id, context.prompt)
+            answer = response.text.strip()
+        except Exception as e:
+            print(f"Erro ao gerar resposta: {e}")
+            return FALLBACK_RESPONSE
+        finally:
+            trace.record("generation", started)
         
-        # 3. Formatar histórico
-        history_text = self._format_history(conversation_history or [])
+        if context.cache_key:
+            semantic_cache.store(organization_id, context.query_embedding, answer, *context.cache_key)
         
-        # 4. Construir prompt do sistema
+        return answer
+    
+    async def generate_response_stream(
+        self,
+        organization_id: str,
+        message: str,
+        conversation_history: List[Dict[str, Any]] = None,
+        rules_context: Dict[str, Any] = None,
+        conversation_summary: Optional[str] = None,
+        trace: Optional[ResponseTrace] = None
+    ) -> AsyncIterator[str]:
+        """Gerar resposta em streaming (RAG + Gemini), emitindo trechos de texto conforme chegam"""
+        
+        trace = trace or ResponseTrace()
+        context = await self._assemble_context(
+            organization_id, message, conversation_history, rules_context, conversation_summary, trace
+        )
+        
+        if context.cached:
+            yield context.cached
+            return
+        if context.prompt is None:
+            yield FALLBACK_RESPONSE
+            return
+        
+        parts = []
+        started = time.perf_counter()
+        try:
+            async for chunk in llm_scheduler.stream(
+                organization_id,
+                lambda: self.model.generate_content_async(context.prompt, stream=True)
+            ):
+                text = chunk.text
+                if text:
+                    if not parts:
+                        trace.record("first_token", started)
+                    parts.append(text)
+                    yield text
+        except Exception as e:
+            print(f"Erro ao gerar resposta em streaming: {e}")
+            if not parts:
+                yield FALLBACK_RESPONSE
+            return
+        finally:
+            trace.record("generation", started)
+        
+        if context.cache_key and parts:
+            semantic_cache.store(organization_id, context.query_embedding, "".join(parts).strip(), *context.cache_key)
+    
+    async def _assemble_context(
+        self,
+        organization_id: str,
+        message: str,
+        conversation_history: Optional[List[Dict[str, Any]]],
+        rules_context: Optional[Dict[str, Any]],
+        conversation_summary: Optional[str],
+        trace: ResponseTrace
+    ) -> _ResponseContext:
+        """Montar o contexto da resposta com as etapas em paralelo
+        
+        Embedding da pergunta, recuperação (a busca léxica não espera o embedding),
+        regras e versões do cache semântico começam juntos, cada etapa com seu
+        tempo limite. Degradações: sem embedding, só busca léxica e sem cache
+        semântico; sem recuperação, resposta sem base de conhecimento; sem regras,
+        últimas regras conhecidas (ou a resposta de fallback se nunca carregadas).
+        """
+        embedding = asyncio.create_task(trace.stage(
+            "embedding", query_embedding_cache.embed(message), settings.response_embedding_timeout_seconds
+        ))
+        # shield: o timeout da recuperação não pode cancelar o embedding, que o cache semântico ainda espera
+        knowledge = asyncio.create_task(trace.stage(
+            "retrieval", self._search_knowledge(organization_id, message, query_embedding=asyncio.shield(embedding)),
+            settings.response_retrieval_timeout_seconds, default=""
+        ))
+        rules = asyncio.create_task(trace.stage(
+            "rules", self._get_business_rules(organization_id), settings.response_rules_timeout_seconds
+        ))
+        cache_key = asyncio.create_task(
+            self._semantic_cache_key(organization_id, message, conversation_history, rules_context, conversation_summary)
+        )
+        
+        try:
+            query_embedding = await embedding
+            key = await cache_key if query_embedding else None
+            
+            if key:
+                cached = semantic_cache.lookup(organization_id, query_embedding, *key)
+                if cached:
+                    return _ResponseContext(cached=cached)
+            
+            knowledge_context, business_rules = await asyncio.gather(knowledge, rules)
+        finally:
+            for task in (knowledge, rules, cache_key):
+                if not task.done():
+                    task.cancel()
+        
+        if business_rules is None:
+            rule_set = rules_cache.last_known(organization_id)
+            if rule_set is None:
+                return _ResponseContext()
+            business_rules = rule_set.prompt_text
+        
+        prompt = self._build_prompt(
+            message, knowledge_context, business_rules, conversation_history, rules_context, conversation_summary
+        )
+        return _ResponseContext(prompt=prompt, query_embedding=query_embedding, cache_key=key)
+    
+    async def _semantic_cache_key(
+        self,
+        organization_id: str,
+        message: str,
+        conversation_history: List[Dict[str, Any]] = None,
+        rules_context: Dict[str, Any] = None,
+        conversation_summary: Optional[str] = None
+    ) -> Optional[Tuple[Versions, str]]:
+        """Versões (conhecimento, regras) e variante para o cache semântico, ou None se não cacheável
+        
+        A chave não inclui o histórico, então só entram no cache turnos cujo
+        prompt não tem histórico nem resumo: o histórico pode conter só as
+        próprias mensagens do turno. Respostas que usaram conversa anterior
+        (nome do cliente, pedido em andamento) não podem servir a outros
+        clientes. Mensagens curtas ("sim", "ok") também ficam de fora.
+        """
+        if not settings.semantic_cache_enabled:
+            return None
+        
+        if len(message.strip()) < settings.semantic_cache_min_chars:
+            return None
+        
+        if conversation_summary:
+            return None
+        
+        # Histórico com algo além do texto deste turno: resposta personalizada
+        if any(msg.get("sender") != "client" or (msg.get("content") or "") not in message for msg in conversation_history or []):
+            return None
+        
+        try:
+            knowledge_version = await knowledge_versions.get(organization_id)
+        except Exception as e:
+            print(f"Erro ao obter versão da base de conhecimento: {e}")
+            return None
+        
+        variant = "vip" if (rules_context or {}).get("is_vip") else ""
+        return (knowledge_version, rules_cache.version(organization_id)), variant
+    
+    def _build_prompt(
+        self,
+        message: str,
+        knowledge_context: str,
+        business_rules: str,
+        conversation_history: List[Dict[str, Any]] = None,
+        rules_context: Dict[str, Any] = None,
+        conversation_summary: Optional[str] = None
+    ) -> str:
+        """Montar o prompt completo (conhecimento + regras + histórico + mensagem)"""
+        
+        # Histórico (resumo + mensagens recentes dentro do orçamento de tokens)
+        history_text = self._format_history(conversation_history or [], summary=conversation_summary)
+        
+        # Prompt do sistema
         system_prompt = self._build_system_prompt(
             knowledge_context,
             business_rules,
             rules_context
         )
         
-        # 5. Gerar resposta
-        prompt = f"""
+        # Prompt final
+        return f"""
 {system_prompt}
 
 ### Histórico da Conversa:
@@ -48,70 +246,76 @@ class AIEngine:
 
 ### Sua Resposta (como assistente Nexus AI):
 """
-        
-        try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
-        except Exception as e:
-            return f"Desculpe, ocorreu um erro ao processar sua mensagem. Por favor, tente novamente ou aguarde que um atendente humano irá ajudá-lo."
     
-    async def _search_knowledge(self, organization_id: str, query: str, limit: int = 3) -> str:
-        """Buscar documentos relevantes usando embeddings"""
-        try:
-            # Gerar embedding da query
-            embedding_model = genai.GenerativeModel('models/embedding-001')
-            result = genai.embed_content(
-                model="models/embedding-001",
-                content=query,
-                task_type="retrieval_query"
-            )
-            query_embedding = result['embedding']
-            
-            # Buscar documentos similares no Supabase
-            supabase = get_supabase()
-            response = supabase.rpc('search_documents', {
-                'query_embedding': query_embedding,
-                'org_id': organization_id,
-                'match_threshold': 0.7,
-                'match_count': limit
-            }).execute()
-            
-            if response.data:
-                contexts = [doc['content'] for doc in response.data if doc.get('content')]
-                return "\n\n---\n\n".join(contexts)
-        except Exception as e:
-            print(f"Erro na busca de conhecimento: {e}")
+    async def _generate(self, organization_id: Optional[str], prompt: str):
+        """Chamar o Gemini (API assíncrona) via agendador com limite de concorrência e timeout"""
+        return await llm_scheduler.run(
+            organization_id,
+            lambda: self.model.generate_content_async(prompt)
+        )
+    
+    async def _search_knowledge(
+        self,
+        organization_id: str,
+        query: str,
+        limit: int = 3,
+        query_embedding: Union[Optional[List[float]], Awaitable[Optional[List[float]]]] = None
+    ) -> str:
+        """Buscar documentos relevantes (vetorial/híbrida, conforme configuração)
+        
+        Erros propagam: a etapa de recuperação do pipeline decide a degradação.
+        """
+        documents = await retrieve(organization_id, query, query_embedding, limit=limit, threshold=0.7)
         
-        return ""
+        contexts = [doc['content'] for doc in documents if doc.get('content')]
+        return "\n\n---\n\n".join(contexts)
     
     async def _get_business_rules(self, organization_id: str) -> str:
-        """Buscar regras de negócio ativas"""
-        supabase = get_supabase()
+        """Buscar regras de negócio ativas (cache de regras compiladas)"""
+        rule_set = await rules_cache.get(organization_id)
         
-        result = supabase.table("business_rules").select("*").eq("organization_id", organization_id).eq("is_active", True).order("priority", desc=True).execute()
+        return rule_set.prompt_text
+    
+    def _format_history(
+        self,
+        history: List[Dict[str, Any]],
+        summary: Optional[str] = None,
+        max_messages: Optional[int] = None,
+        token_budget: Optional[int] = None
+    ) -> str:
+        """Formatar histórico de conversa: resumo acumulado + últimas mensagens que cabem no orçamento de tokens
         
-        if not result.data:
-            return ""
+        A mensagem mais recente entra sempre; as anteriores, da mais nova para a
+        mais antiga, enquanto couberem em `MEMORY_HISTORY_TOKEN_BUDGET` (o resumo conta no orçamento).
+        """
+        max_messages = max_messages or settings.memory_recent_messages
+        budget = token_budget or settings.memory_history_token_budget
         
-        rules_text = []
-        for rule in result.data:
-            rules_text.append(f"- {rule['name']}: {rule.get('description', 'Sem descrição')}")
+        header = f"Resumo da conversa até aqui: {summary}" if summary else ""
+        used = count_tokens(header)
         
-        return "\n".join(rules_text)
-    
-    def _format_history(self, history: List[Dict[str, Any]], max_messages: int = 10) -> str:
-        """Formatar histórico de conversa"""
-        if not history:
+        lines: List[str] = []
+        for line in reversed(self._format_messages(history[-max_messages:])):
+            tokens = count_tokens(line)
+            if lines and used + tokens > budget:
+                break
+            lines.append(line)
+            used += tokens
+        lines.reverse()
+        
+        if header:
+            lines.insert(0, header)
+        if not lines:
             return "Nenhuma mensagem anterior."
         
-        recent = history[-max_messages:]
+        return "\n".join(lines)
+    
+    def _format_messages(self, messages: List[Dict[str, Any]]) -> List[str]:
         formatted = []
-        
-        for msg in recent:
+        for msg in messages:
             sender = "Cliente" if msg['sender'] == 'client' else "Assistente"
             formatted.append(f"{sender}: {msg['content']}")
-        
-        return "\n".join(formatted)
+        return formatted
     
     def _build_system_prompt(
         self,
@@ -152,8 +356,12 @@ Use estas informações para responder às perguntas do cliente.
         
         return prompt
     
-    async def analyze_sentiment(self, text: str) -> Dict[str, Any]:
-        """Analisar sentimento da mensagem"""
+    async def analyze_sentiment(self, text: str, organization_id: Optional[str] = None, raise_errors: bool = False) -> Dict[str, Any]:
+        """Analisar sentimento da mensagem
+
+        Em caso de falha retorna neutro; com `raise_errors`, a exceção sobe (para
+        quem guarda o resultado em cache não memorizar o neutro de fallback).
+        """
         prompt = f"""Analise o sentimento da seguinte mensagem e retorne APENAS um JSON no formato:
 {{"sentiment": "positive" | "neutral" | "negative", "score": 0.0 a 1.0, "keywords": ["lista", "de", "palavras-chave"]}}
 
@@ -162,18 +370,20 @@ Mensagem: {text}
 JSON:"""
         
         try:
-            response = self.model.generate_content(prompt)
+            response = await self._generate(organization_id, prompt)
             import json
             return json.loads(response.text.strip())
-        except:
-            return {"sentiment": "neutral", "score": 0.5, "keywords": []}
+        except Exception:
+            if raise_errors:
+                raise
+            return dict(NEUTRAL_SENTIMENT)
     
-    async def generate_summary(self, messages: List[Dict[str, Any]]) -> str:
+    async def generate_summary(self, messages: List[Dict[str, Any]], organization_id: Optional[str] = None) -> str:
         """Gerar resumo da conversa"""
         if not messages:
             return "Conversa sem mensagens."
         
-        conversation_text = self._format_history(messages, max_messages=50)
+        conversation_text = "\n".join(self._format_messages(messages[-50:]))
         
         prompt = f"""Resuma a seguinte conversa de atendimento em 2-3 linhas, destacando:
 1. Assunto principal
@@ -186,7 +396,40 @@ Conversa:
 Resumo:"""
         
         try:
-            response = self.model.generate_content(prompt)
+            response = await self._generate(organization_id, prompt)
             return response.text.strip()
         except:
             return "Não foi possível gerar o resumo."
+    
+    async def update_summary(
+        self,
+        previous_summary: Optional[str],
+        messages: List[Dict[str, Any]],
+        organization_id: Optional[str] = None
+    ) -> str:
+        """Atualizar o resumo acumulado da conversa com mensagens novas (memória de conversa)
+        
+        Diferente de `generate_summary`, erros são propagados: um resumo
+        de fallback não pode ser gravado como memória.
+        """
+        conversation_text = "\n".join(self._format_messages(messages))
+        
+        prompt = f"""Você mantém a memória de um atendimento em andamento. Atualize o resumo abaixo
+incorporando as novas mensagens. Preserve fatos necessários para continuar o atendimento:
+dados informados pelo cliente (nome, pedidos, números, datas), problema principal, o que já
+foi respondido ou combinado e pendências. Descarte cumprimentos e repetições.
+Responda apenas com o resumo atualizado, em no máximo 10 linhas.
+
+Resumo atual:
+{previous_summary or "Nenhum (início da conversa)."}
+
+Novas mensagens:
+{conversation_text}
+
+Resumo atualizado:"""
+        
+        response = await self._generate(organization_id, prompt)
+        summary = response.text.strip()
+        if not summary:
+            raise ValueError("resumo vazio")
+        return summary
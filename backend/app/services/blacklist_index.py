@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+from app.config import get_settings
+from app.database import get_supabase
+from app.services import metrics
+from app.services.cache import TTLCache
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+# Página de leitura do PostgREST (limite padrão de linhas por requisição)
+PAGE_SIZE = 1000
+
+_NON_DIGITS = re.compile(r"\D")
+
+
+class InvalidPhoneNumber(ValueError):
+    pass
+
+
+def normalize_phone(raw: str, default_country_code: Optional[str] = None, international: bool = False) -> str:
+    """Normalizar número para E.164 ("+5511999998888").
+
+    Aceita formatação livre, JIDs do WhatsApp ("5511...@s.whatsapp.net"),
+    prefixo internacional "00" e números nacionais com DDD (recebem o código
+    do país padrão). JIDs e números vindos do webhook (`international=True`)
+    já trazem o código do país, mesmo sem "+", e só recebem o "+"; o código
+    padrão vale apenas para números digitados pelo operador.
+    """
+    default_country_code = default_country_code or settings.blacklist_default_country_code
+
+    value = (raw or "").strip()
+    if "@" in value:
+        value, international = value.split("@", 1)[0], True
+    digits = _NON_DIGITS.sub("", value)
+
+    if value.startswith("+") or international:
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    else:
+        digits = digits.lstrip("0")
+        # Número nacional (DDD + número) sem código do país
+        if len(digits) <= 11:
+            digits = default_country_code + digits
+
+    if not 8 <= len(digits) <= 15:
+        raise InvalidPhoneNumber(f"Número inválido: {raw!r}")
+
+    return f"+{digits}"
+
+
+def normalize_many(numbers: Iterable[str]) -> Dict[str, List[str]]:
+    """Normalizar uma lista; retorna {"valid": [...sem duplicatas], "invalid": [...]}"""
+    valid: Dict[str, None] = {}
+    invalid: List[str] = []
+
+    for raw in numbers:
+        if not raw or not raw.strip():
+            continue
+        try:
+            valid[normalize_phone(raw)] = None
+        except InvalidPhoneNumber:
+            invalid.append(raw)
+
+    return {"valid": list(valid), "invalid": invalid}
+
+
+class BlacklistIndex:
+    """Índice em memória dos números bloqueados por organização.
+
+    Carregado uma vez da tabela `blacklist_entries` e mantido em sincronia
+    pelas rotas de blacklist; o TTL cobre escritas feitas por outras réplicas.
+    Cada número guarda quantas blacklists da organização o contêm, para que
+    remover de uma lista não o libere das demais.
+    """
+
+    def __init__(self, ttl: float):
+        self._cache = TTLCache(maxsize=1024, ttl=ttl)
+        self._versions: Dict[str, int] = defaultdict(int)
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def contains(self, organization_id: str, phone: str) -> bool:
+        try:
+            # Remetente do webhook: número internacional sem "+"
+            number = normalize_phone(phone, international=True)
+        except InvalidPhoneNumber:
+            return False
+
+        numbers = await self._get(organization_id)
+        return number in numbers
+
+    async def _get(self, organization_id: str) -> Dict[str, int]:
+        numbers = self._cache.get(organization_id)
+        if numbers is not None:
+            return numbers
+
+        lock = self._locks.setdefault(organization_id, asyncio.Lock())
+        async with lock:
+            numbers = self._cache.get(organization_id)
+            if numbers is not None:
+                return numbers
+
+            version = self._versions[organization_id]
+            numbers = await self._load(organization_id)
+
+            # Escritas durante a carga podem não estar no resultado: não armazenar
+            if version == self._versions[organization_id]:
+                self._cache.set(organization_id, numbers)
+
+            return numbers
+
+    async def _load(self, organization_id: str) -> Dict[str, int]:
+        supabase = get_supabase()
+        numbers: Dict[str, int] = defaultdict(int)
+        last_id = None
+
+        # Paginação por chave (id) para listas com centenas de milhares de números
+        while True:
+            query = supabase.table("blacklist_entries").select("id, phone_number").eq("organization_id", organization_id)
+            if last_id is not None:
+                query = query.gt("id", last_id)
+            result = await query.order("id").limit(PAGE_SIZE).execute()
+
+            rows = result.data or []
+            for row in rows:
+                numbers[row["phone_number"]] += 1
+
+            if len(rows) < PAGE_SIZE:
+                break
+            last_id = rows[-1]["id"]
+
+        logger.info(f"🚫 Blacklist carregada: org {organization_id} ({len(numbers)} números)")
+        return dict(numbers)
+
+    def added(self, organization_id: str, phone_numbers: Iterable[str]):
+        """Registrar números efetivamente inseridos em uma blacklist"""
+        self._versions[organization_id] += 1
+        numbers = self._cache.get(organization_id)
+        if numbers is None:
+            return
+        for number in phone_numbers:
+            numbers[number] = numbers.get(number, 0) + 1
+
+    def removed(self, organization_id: str, phone_numbers: Iterable[str]):
+        """Registrar números efetivamente removidos de uma blacklist"""
+        self._versions[organization_id] += 1
+        numbers = self._cache.get(organization_id)
+        if numbers is None:
+            return
+        for number in phone_numbers:
+            remaining = numbers.get(number, 0) - 1
+            if remaining > 0:
+                numbers[number] = remaining
+            else:
+                numbers.pop(number, None)
+
+    def invalidate(self, organization_id: Optional[str] = None):
+        if organization_id is None:
+            for org_id in list(self._versions):
+                self._versions[org_id] += 1
+            self._cache.clear()
+            return
+
+        self._versions[organization_id] += 1
+        self._cache.invalidate(organization_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+
+blacklist_index = BlacklistIndex(ttl=settings.blacklist_cache_ttl_seconds)
+
+metrics.register("blacklist_index", blacklist_index.stats)
@@ -0,0 +1,108 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Cache em memória com despejo LRU e expiração por TTL.
+
+    Pensado para consultas quentes e repetidas (ex: metadados de documento, regras
+    compiladas). Não é thread-safe; use a partir do event loop. Cargas
+    simultâneas da mesma chave em `get_or_load` são unificadas (single-flight).
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._pending: Dict[Hashable, "asyncio.Future"] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        """Retornar o valor em cache ou carregá-lo com `loader()` e armazenar
+
+        Chamadas concorrentes para a mesma chave aguardam a mesma carga.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.ensure_future(self._load(key, loader, ttl))
+        self._pending[key] = future
+        # shield: cancelar um dos chamadores não cancela a carga compartilhada
+        return await asyncio.shield(future)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], ttl: Optional[float]) -> Any:
+        task = asyncio.current_task()
+        try:
+            value = await loader()
+            # Invalidada durante a carga: devolver o valor sem armazenar
+            if self._pending.get(key) is task:
+                self.set(key, value, ttl)
+            return value
+        finally:
+            if self._pending.get(key) is task:
+                del self._pending[key]
+
+    def invalidate(self, key: Hashable):
+        self._data.pop(key, None)
+        self._pending.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+        self._pending.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key, _MISSING)
+        return entry is not _MISSING and (entry[1] is None or entry[1] > time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
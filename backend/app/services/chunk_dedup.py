@@ -0,0 +1,83 @@
+import json
+import logging
+from typing import Any, Dict, Iterable, List
+from app.database import get_supabase
+from app.services import metrics
+from app.services.embedding_pipeline import EMBEDDING_MODEL
+
+logger = logging.getLogger(__name__)
+
+# Hashes por consulta (`in.(...)` vai na URL do PostgREST)
+LOOKUP_BATCH = 100
+
+
+def _parse_embedding(value: Any) -> List[float]:
+    # pgvector chega pelo PostgREST como texto "[0.1,0.2,...]"
+    return json.loads(value) if isinstance(value, str) else value
+
+
+class ChunkEmbeddingIndex:
+    """Índice de deduplicação por organização (tabela `chunk_embeddings`): hash do chunk -> embedding
+
+    Cobre conteúdo repetido entre documentos (rodapés, termos e condições) e
+    reenvios de documentos já excluídos: o embedding é gerado uma única vez.
+    """
+
+    def __init__(self, model: str = EMBEDDING_MODEL):
+        self.model = model
+        self.lookups = 0
+        self.hits = 0
+        self.stored = 0
+
+    async def lookup(self, organization_id: str, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        """Embeddings já conhecidos para os hashes informados"""
+        supabase = get_supabase()
+        hashes = list(dict.fromkeys(hashes))
+        found: Dict[str, List[float]] = {}
+
+        for start in range(0, len(hashes), LOOKUP_BATCH):
+            result = await supabase.table("chunk_embeddings").select("content_hash, embedding").eq(
+                "organization_id", organization_id
+            ).eq("model", self.model).in_("content_hash", hashes[start:start + LOOKUP_BATCH]).execute()
+
+            for row in result.data or []:
+                found[row["content_hash"]] = _parse_embedding(row["embedding"])
+
+        self.lookups += len(hashes)
+        self.hits += len(found)
+        return found
+
+    async def store(self, organization_id: str, embeddings: Dict[str, List[float]]):
+        """Registrar embeddings recém-gerados (hashes já presentes são ignorados)"""
+        if not embeddings:
+            return
+
+        supabase = get_supabase()
+        rows = [
+            {
+                "organization_id": organization_id,
+                "model": self.model,
+                "content_hash": digest,
+                "embedding": embedding
+            }
+            for digest, embedding in embeddings.items()
+        ]
+        await supabase.table("chunk_embeddings").upsert(
+            rows,
+            on_conflict="organization_id,model,content_hash",
+            ignore_duplicates=True
+        ).execute()
+        self.stored += len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+            "stored": self.stored
+        }
+
+
+chunk_dedup = ChunkEmbeddingIndex()
+
+metrics.register("chunk_dedup", chunk_dedup.stats)
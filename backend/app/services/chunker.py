@@ -0,0 +1,323 @@
+import csv
+import hashlib
+import math
+import re
+import unicodedata
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from app.config import get_settings
+
+settings = get_settings()
+
+# Aproximação de tokens BPE: palavras e sinais de pontuação isolados
+_TOKEN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+# Sequências longas sem espaço (códigos, base64, URLs coladas) viram vários tokens
+_LONG_RUN_CHARS = 12
+_CHARS_PER_TOKEN = 4
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+_MARKDOWN_HEADING = re.compile(r"^\s{0,3}(#{1,6})\s+(.+?)\s*#*\s*$")
+
+
+def count_tokens(text: str) -> int:
+    """Estimativa de tokens (sem dependência de tokenizer)"""
+    return sum(
+        math.ceil(len(token) / _CHARS_PER_TOKEN) if len(token) > _LONG_RUN_CHARS else 1
+        for token in _TOKEN.findall(text)
+    )
+
+
+@dataclass
+class Block:
+    """Unidade estrutural extraída do documento"""
+    kind: str                    # "heading", "paragraph", "row" ou "page"
+    text: str = ""
+    page: Optional[int] = None
+    level: int = 0               # nível do título (1 = mais alto)
+
+
+@dataclass
+class Chunk:
+    text: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class ChunkingProfile:
+    max_tokens: int = 300
+    overlap_tokens: int = 30
+    # Tipos de bloco que sempre fecham o chunk atual (ex: novo título, nova página)
+    boundaries: frozenset = frozenset({"heading"})
+    # Prefixar o título da seção em chunks que começam no meio dela
+    heading_context: bool = True
+    # CSV: repetir o cabeçalho em cada chunk
+    repeat_header: bool = False
+    # Um título só fecha o chunk se ele já tiver ao menos isso (seções curtas seguem juntas)
+    min_tokens: int = 0
+
+
+DEFAULT_PROFILES: Dict[str, ChunkingProfile] = {
+    "text": ChunkingProfile(),
+    "markdown": ChunkingProfile(),
+    "html": ChunkingProfile(min_tokens=120),
+    "docx": ChunkingProfile(),
+    "pdf": ChunkingProfile(boundaries=frozenset({"heading", "page"})),
+    "csv": ChunkingProfile(max_tokens=400, overlap_tokens=0, boundaries=frozenset(), heading_context=False, repeat_header=True),
+}
+
+
+def get_profile(document_type: str) -> ChunkingProfile:
+    """Perfil do tipo de documento, com ajustes de `settings.chunking_profiles`"""
+    profile = DEFAULT_PROFILES.get(document_type, DEFAULT_PROFILES["text"])
+    overrides = dict(settings.chunking_profiles.get(document_type) or {})
+    if "boundaries" in overrides:
+        overrides["boundaries"] = frozenset(overrides["boundaries"])
+    return replace(profile, **overrides) if overrides else profile
+
+
+def document_type(filename: str) -> str:
+    extension = filename.lower().rsplit(".", 1)[-1] if "." in filename else ""
+    return {
+        "md": "markdown",
+        "markdown": "markdown",
+        "csv": "csv",
+        "pdf": "pdf",
+        "docx": "docx",
+        "html": "html",
+        "htm": "html",
+    }.get(extension, "text")
+
+
+def content_hash(text: str) -> str:
+    """Hash (sha256) do texto normalizado do chunk; igual ao SQL `chunk_content_hash`"""
+    normalized = unicodedata.normalize("NFC", " ".join(text.split()))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+# === Blocos a partir de texto ===
+
+def text_blocks(text: Union[str, Iterable[str]], page: Optional[int] = None, max_tokens: Optional[int] = None) -> Iterator[Block]:
+    """Parágrafos (separados por linha em branco) e títulos Markdown
+
+    Aceita o texto inteiro ou um iterável de linhas (ex: um arquivo aberto).
+    Com `max_tokens`, um parágrafo que passa do orçamento sai em partes: um
+    arquivo sem linhas em branco não vira um único bloco na memória.
+    """
+    paragraph: List[str] = []
+    tokens = 0
+
+    def flush():
+        nonlocal tokens
+        tokens = 0
+        if paragraph:
+            joined = " ".join(paragraph).strip()
+            paragraph.clear()
+            if joined:
+                return Block("paragraph", joined, page=page)
+        return None
+
+    lines = text.splitlines() if isinstance(text, str) else text
+    for line in lines:
+        heading = _MARKDOWN_HEADING.match(line)
+        if heading or not line.strip():
+            block = flush()
+            if block:
+                yield block
+            if heading:
+                yield Block("heading", heading.group(2), page=page, level=len(heading.group(1)))
+            continue
+        paragraph.append(line.strip())
+
+        if max_tokens:
+            tokens += count_tokens(line)
+            if tokens >= max_tokens:
+                yield flush()
+
+    block = flush()
+    if block:
+        yield block
+
+
+def csv_blocks(lines: Iterable[str]) -> Iterator[Block]:
+    """Uma linha do CSV por bloco; a primeira vira cabeçalho ("heading" de nível 0)"""
+    reader = csv.reader(lines)
+    header = None
+
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        if header is None:
+            header = row
+            yield Block("heading", ", ".join(header), level=0)
+            continue
+        if len(row) == len(header):
+            text = "; ".join(f"{name}: {value}" for name, value in zip(header, row) if value.strip())
+        else:
+            text = ", ".join(row)
+        yield Block("row", text)
+
+
+# === Chunking ===
+
+def _split_long_word(word: str, max_tokens: int) -> Iterator[Tuple[str, int]]:
+    """Último recurso: cortar uma "palavra" maior que o limite em pedaços de tamanho fixo"""
+    step = max_tokens * _CHARS_PER_TOKEN
+    for start in range(0, len(word), step):
+        piece = word[start:start + step]
+        size = count_tokens(piece)
+        if size <= max_tokens:
+            yield piece, size
+            continue
+        # Pontuação conta um token por caractere: cortar no limite de caracteres
+        for offset in range(0, len(piece), max_tokens):
+            yield piece[offset:offset + max_tokens], count_tokens(piece[offset:offset + max_tokens])
+
+
+def _split_oversized(text: str, max_tokens: int) -> Iterator[Tuple[str, int]]:
+    """Quebrar um bloco maior que o limite por frases, por palavras e, se preciso, por caracteres; emite (texto, tokens)"""
+    size = count_tokens(text)
+    if size <= max_tokens:
+        yield text, size
+        return
+
+    for sentence in _SENTENCE_END.split(text):
+        size = count_tokens(sentence)
+        if size <= max_tokens:
+            yield sentence, size
+            continue
+
+        words: List[str] = []
+        size = 0
+        for word in sentence.split():
+            word_tokens = count_tokens(word)
+            if words and size + word_tokens > max_tokens:
+                yield " ".join(words), size
+                words, size = [], 0
+            if word_tokens > max_tokens:
+                yield from _split_long_word(word, max_tokens)
+                continue
+            words.append(word)
+            size += word_tokens
+        if words:
+            yield " ".join(words), size
+
+
+def chunk_blocks(blocks: Iterable[Block], profile: ChunkingProfile) -> Iterator[Chunk]:
+    """Agrupar blocos em chunks de até `max_tokens`, sem cortar blocos no meio
+
+    É um gerador: consome os blocos sob demanda, então documentos grandes não
+    ficam inteiros na memória. Cada chunk sempre inclui ao menos uma unidade
+    nova além da sobreposição, garantindo progresso.
+    """
+    units: List[str] = []        # unidades (parágrafos, linhas, frases) do chunk atual
+    sizes: List[int] = []
+    new_units = 0                # unidades que não vieram da sobreposição
+    sections: List[Tuple[int, str]] = []  # títulos abertos (nível, texto), do mais alto ao atual
+    heading: Optional[str] = None         # caminho dos títulos ("Manual › Trocas")
+    inline_headings = False               # chunk atual já traz os títulos no texto (seções juntadas)
+    header_row: Optional[str] = None
+    first_page: Optional[int] = None
+    last_page: Optional[int] = None
+
+    def budget() -> int:
+        # Cabeçalho do CSV ou título da seção também entram no chunk
+        if profile.repeat_header:
+            reserved = count_tokens(header_row) if header_row else 0
+        else:
+            reserved = count_tokens(heading) if heading and profile.heading_context else 0
+        return max(profile.max_tokens - reserved, 1)
+
+    def emit() -> Optional[Chunk]:
+        nonlocal units, sizes, new_units, first_page, inline_headings
+        if not new_units:
+            return None
+
+        parts = list(units)
+        if profile.repeat_header and header_row:
+            parts.insert(0, header_row)
+        elif profile.heading_context and heading and not inline_headings:
+            parts.insert(0, heading)
+
+        metadata: Dict[str, Any] = {}
+        if heading and not profile.repeat_header:
+            metadata["heading"] = heading
+        if first_page is not None:
+            metadata["page_start"] = first_page
+            metadata["page_end"] = last_page
+
+        chunk = Chunk("\n".join(parts), metadata)
+
+        # Sobreposição: repetir as últimas unidades até `overlap_tokens`
+        carried: List[str] = []
+        carried_sizes: List[int] = []
+        total = 0
+        for unit, size in zip(reversed(units), reversed(sizes)):
+            if total + size > profile.overlap_tokens or len(carried) + 1 >= len(units):
+                break
+            carried.insert(0, unit)
+            carried_sizes.insert(0, size)
+            total += size
+
+        units, sizes, new_units = carried, carried_sizes, 0
+        first_page = last_page if carried else None
+        inline_headings = False
+        return chunk
+
+    def add(text: str, size: int, page: Optional[int], limit: int) -> Iterator[Chunk]:
+        nonlocal new_units, first_page, last_page
+        if units and sum(sizes) + size > limit:
+            chunk = emit()
+            if chunk:
+                yield chunk
+            # A sobreposição não pode impedir a unidade nova de caber
+            while units and sum(sizes) + size > limit:
+                units.pop(0)
+                sizes.pop(0)
+        units.append(text)
+        sizes.append(size)
+        new_units += 1
+        if page is not None:
+            first_page = page if first_page is None else first_page
+            last_page = page
+
+    def boundary() -> Iterator[Chunk]:
+        nonlocal units, sizes, new_units, first_page
+        chunk = emit()
+        if chunk:
+            yield chunk
+        units, sizes, new_units, first_page = [], [], 0, None
+
+    for block in blocks:
+        # Seção curta: o próximo título entra no mesmo chunk em vez de fechá-lo
+        merge = block.kind == "heading" and block.level > 0 and new_units > 0 and sum(sizes) < profile.min_tokens
+
+        if block.kind in profile.boundaries and not merge:
+            yield from boundary()
+
+        if block.kind == "heading":
+            if block.level == 0:
+                header_row = block.text
+            else:
+                if merge and profile.heading_context and heading and not inline_headings:
+                    # O título da seção anterior vira parte do texto, antes de ser substituído
+                    units.insert(0, heading)
+                    sizes.insert(0, count_tokens(heading))
+                    inline_headings = True
+                while sections and sections[-1][0] >= block.level:
+                    sections.pop()
+                sections.append((block.level, block.text))
+                heading = " › ".join(text for _, text in sections)
+                if not profile.heading_context or merge:
+                    limit = budget()
+                    yield from add(block.text, count_tokens(block.text), block.page, limit)
+            continue
+
+        if block.kind == "page":
+            continue
+
+        limit = budget()
+        for part, size in _split_oversized(block.text, limit):
+            yield from add(part, size, block.page, limit)
+
+    chunk = emit()
+    if chunk:
+        yield chunk
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from app.config import get_settings
+from app.database import get_supabase
+from app.services import metrics
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+
+def _timestamp(value: str) -> datetime:
+    # Postgres omite zeros finais das frações de segundo: comparar como data, não como texto
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+@dataclass
+class ConversationContext:
+    """Memória usada no prompt: resumo acumulado + mensagens ainda não resumidas (ordem cronológica)"""
+    summary: Optional[str] = None
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+
+
+class ConversationMemory:
+    """Memória de conversa em duas camadas
+
+    - `conversations.context_summary`: resumo incremental de tudo até `summary_until`
+    - mensagens posteriores a `summary_until`: as mais recentes entram literais no prompt
+
+    Quando as mensagens não resumidas passam de `MEMORY_SUMMARY_THRESHOLD`, um
+    resumo é atualizado em segundo plano (resumo anterior + mensagens novas),
+    deixando as `MEMORY_SUMMARY_KEEP_RECENT` últimas de fora. Uma tarefa por
+    conversa; a gravação é condicional a `summary_until`, então réplicas
+    concorrentes não sobrescrevem o trabalho uma da outra.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._ai = None
+        self.summaries = 0
+        self.folded_messages = 0
+        self.failures = 0
+        self.conflicts = 0
+
+    @property
+    def ai(self):
+        # AIEngine compartilhado (import tardio: ai_engine carrega o Gemini)
+        if self._ai is None:
+            from app.services.ai_engine import AIEngine
+            self._ai = AIEngine()
+        return self._ai
+
+    async def fetch_recent(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Mensagens mais recentes da conversa (ordem cronológica)
+
+        Não depende da linha da conversa: roda em paralelo com a busca dela, e
+        `context()` descarta depois o que já está no resumo.
+        """
+        supabase = get_supabase()
+        limit = max(settings.memory_recent_messages, settings.memory_summary_threshold)
+
+        result = await supabase.table("messages").select("id, sender, content, created_at").eq(
+            "conversation_id", conversation_id
+        ).order("created_at", desc=True).limit(limit).execute()
+
+        return list(reversed(result.data or []))
+
+    def context(
+        self,
+        conversation: Dict[str, Any],
+        recent: List[Dict[str, Any]],
+        latest: Optional[Dict[str, Any]] = None
+    ) -> ConversationContext:
+        """Resumo da conversa + mensagens recentes ainda não resumidas
+
+        `latest` é a mensagem recém-gravada, incluída caso a busca tenha rodado antes da gravação.
+        """
+        summary_until = conversation.get("summary_until")
+        if summary_until:
+            until = _timestamp(summary_until)
+            messages = [msg for msg in recent if _timestamp(msg["created_at"]) > until]
+        else:
+            messages = list(recent)
+        if latest and not any(msg["id"] == latest["id"] for msg in messages):
+            messages.append(latest)
+
+        return ConversationContext(summary=conversation.get("context_summary") or None, messages=messages)
+
+    def schedule_summary(self, conversation: Dict[str, Any], context: ConversationContext, new_messages: int = 1):
+        """Disparar a atualização do resumo em segundo plano se o histórico não resumido passou do limite"""
+        if len(context.messages) + new_messages < settings.memory_summary_threshold:
+            return
+
+        conversation_id = conversation["id"]
+        if conversation_id in self._tasks:
+            return
+
+        task = asyncio.create_task(self._summarize(conversation))
+        self._tasks[conversation_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(conversation_id, None))
+
+    async def _summarize(self, conversation: Dict[str, Any]):
+        supabase = get_supabase()
+        conversation_id = conversation["id"]
+        summary_until = conversation.get("summary_until")
+        keep = settings.memory_summary_keep_recent
+
+        try:
+            query = supabase.table("messages").select("id, sender, content, created_at").eq(
+                "conversation_id", conversation_id
+            )
+            if summary_until:
+                query = query.gt("created_at", summary_until)
+            result = await query.order("created_at").limit(settings.memory_summary_batch_size + keep).execute()
+
+            pending = result.data or []
+            folded = pending[:min(settings.memory_summary_batch_size, len(pending) - keep)]
+            if len(pending) < settings.memory_summary_threshold or not folded:
+                return
+
+            summary = await self.ai.update_summary(
+                conversation.get("context_summary"),
+                folded,
+                conversation.get("organization_id")
+            )
+
+            update = supabase.table("conversations").update({
+                "context_summary": summary,
+                "summary_until": folded[-1]["created_at"],
+                "summary_message_count": (conversation.get("summary_message_count") or 0) + len(folded)
+            }).eq("id", conversation_id)
+            if summary_until:
+                update = update.eq("summary_until", summary_until)
+            else:
+                update = update.is_("summary_until", "null")
+            written = await update.execute()
+
+            if not written.data:
+                self.conflicts += 1
+                return
+
+            self.summaries += 1
+            self.folded_messages += len(folded)
+            logger.info(f"🧠 Resumo da conversa {conversation_id} atualizado (+{len(folded)} mensagens)")
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"⚠️ Falha ao resumir conversa {conversation_id}: {e}")
+
+    async def close(self):
+        """Aguardar resumos em andamento (encerramento da aplicação)"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": len(self._tasks),
+            "summaries": self.summaries,
+            "folded_messages": self.folded_messages,
+            "failures": self.failures,
+            "conflicts": self.conflicts
+        }
+
+
+conversation_memory = ConversationMemory()
+
+metrics.register("conversation_memory", conversation_memory.stats)
@@ -0,0 +1,375 @@
+import asyncio
+import logging
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Set
+from urllib.parse import parse_qsl, urldefrag, urlencode, urljoin, urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
+import httpx
+from app.config import get_settings
+from app.services.rate_limiter import TokenBucket
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+# Parâmetros de rastreamento que não mudam o conteúdo da página
+_TRACKING_PARAMS = re.compile(r"^(utm_\w+|gclid|fbclid|mc_cid|mc_eid)$", re.IGNORECASE)
+
+# Limite de URLs lidas de sitemaps (sitemaps índice podem apontar para milhares de arquivos)
+MAX_SITEMAP_URLS = 50000
+MAX_SITEMAP_FILES = 50
+
+# Links guardados por página (para seguir a partir de páginas não modificadas)
+MAX_LINKS_PER_PAGE = 500
+
+
+def normalize_url(url: str) -> Optional[str]:
+    """Forma canônica para deduplicação: sem fragmento, host minúsculo, sem porta padrão nem parâmetros de rastreamento"""
+    url, _ = urldefrag(url.strip())
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return None
+
+    host = parts.hostname.lower()
+    if parts.port and (parts.scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _TRACKING_PARAMS.match(k)])
+    return urlunsplit((parts.scheme, host, parts.path or "/", query, ""))
+
+
+class _LinkParser(HTMLParser):
+    """Coletar hrefs de <a> (e <base href>) sem montar a árvore do documento"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links: List[str] = []
+        self.base: Optional[str] = None
+        self.nofollow = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "a" and attrs.get("href") and "nofollow" not in (attrs.get("rel") or ""):
+            self.links.append(attrs["href"])
+        elif tag == "base" and attrs.get("href") and self.base is None:
+            self.base = attrs["href"]
+        elif tag == "meta" and (attrs.get("name") or "").lower() == "robots":
+            self.nofollow = "nofollow" in (attrs.get("content") or "").lower()
+
+
+def extract_links(html: str, page_url: str) -> List[str]:
+    """Links absolutos e normalizados da página (vazio se a página pede `nofollow`)"""
+    parser = _LinkParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        pass
+
+    if parser.nofollow:
+        return []
+
+    base = urljoin(page_url, parser.base) if parser.base else page_url
+    links = []
+    for href in parser.links:
+        url = normalize_url(urljoin(base, href))
+        if url:
+            links.append(url)
+    return list(dict.fromkeys(links))[:MAX_LINKS_PER_PAGE]
+
+
+@dataclass
+class CrawlConfig:
+    seed_url: str
+    max_depth: int = 2
+    max_pages: int = 500
+    # Domínios permitidos (padrão: o host da URL inicial)
+    allowed_domains: Sequence[str] = ()
+    # Prefixos de caminho incluídos/excluídos (ex: "/ajuda/", "/blog/")
+    include_paths: Sequence[str] = ()
+    exclude_paths: Sequence[str] = ()
+    use_sitemap: bool = True
+    respect_robots: bool = True
+    concurrency: int = settings.crawler_concurrency
+    requests_per_second_per_host: float = settings.crawler_requests_per_second_per_host
+    user_agent: str = settings.crawler_user_agent
+    timeout_seconds: float = settings.crawler_timeout_seconds
+    max_page_bytes: int = settings.crawler_max_page_bytes
+
+    def domains(self) -> Set[str]:
+        if self.allowed_domains:
+            return {domain.lower() for domain in self.allowed_domains}
+        return {urlsplit(self.seed_url).hostname.lower()}
+
+
+@dataclass
+class CrawledPage:
+    url: str
+    depth: int
+    status: int                      # 200, ou 304 se não mudou desde a última visita
+    html: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    links: List[str] = field(default_factory=list)
+
+
+# validators(url) -> {"etag", "last_modified", "links"} da visita anterior, se houver
+ValidatorsFn = Callable[[str], Awaitable[Optional[Dict]]]
+
+
+class SiteCrawler:
+    """Crawler assíncrono com concorrência limitada e cortesia por host
+
+    - um `httpx.AsyncClient` (pool de conexões) para todo o rastreamento
+    - `concurrency` downloads simultâneos; `TokenBucket` por host (respeita Crawl-delay)
+    - robots.txt, sitemap.xml (inclusive índices de sitemaps) e deduplicação de URLs
+    - re-visitas condicionais (If-None-Match / If-Modified-Since): páginas não
+      modificadas voltam como 304 com os links guardados na visita anterior
+
+    As páginas são emitidas conforme chegam; a fila de resultados é limitada,
+    então um consumidor lento (embeddings) segura o ritmo do crawler.
+    """
+
+    def __init__(
+        self,
+        config: CrawlConfig,
+        client: Optional[httpx.AsyncClient] = None,
+        validators: Optional[ValidatorsFn] = None
+    ):
+        self.config = config
+        self.validators = validators
+        self._client = client
+        self._owns_client = client is None
+        self._domains = config.domains()
+        self._seen: Set[str] = set()
+        self._robots: Dict[str, Optional[RobotFileParser]] = {}
+        self._robots_lock = asyncio.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._scheduled = 0
+        self.truncated = False
+        self.stats = {"fetched": 0, "not_modified": 0, "skipped": 0, "errors": 0, "robots_blocked": 0}
+
+    @property
+    def complete(self) -> bool:
+        """Rastreamento sem corte por `max_pages` e sem falhas temporárias (rede, 429, 5xx):
+        uma página não alcançada realmente saiu do site (ou do escopo)"""
+        return not self.truncated and not self.stats["errors"]
+
+    def allowed(self, url: str) -> bool:
+        parts = urlsplit(url)
+        if (parts.hostname or "").lower() not in self._domains:
+            return False
+        path = parts.path or "/"
+        if self.config.include_paths and not any(path.startswith(prefix) for prefix in self.config.include_paths):
+            return False
+        return not any(path.startswith(prefix) for prefix in self.config.exclude_paths)
+
+    async def crawl(self) -> AsyncIterator[CrawledPage]:
+        client = self._client or httpx.AsyncClient(
+            headers={"User-Agent": self.config.user_agent},
+            timeout=self.config.timeout_seconds,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=self.config.concurrency, max_keepalive_connections=self.config.concurrency)
+        )
+        frontier: asyncio.Queue = asyncio.Queue()
+        results: asyncio.Queue = asyncio.Queue(maxsize=self.config.concurrency * 2)
+        workers: List[asyncio.Task] = []
+        done: Optional[asyncio.Task] = None
+
+        try:
+            seed = normalize_url(self.config.seed_url)
+            if seed is None:
+                raise ValueError(f"URL inválida: {self.config.seed_url}")
+            self._enqueue(frontier, seed, 0)
+
+            if self.config.use_sitemap:
+                for url in await self._sitemap_urls(client, seed):
+                    self._enqueue(frontier, url, 1)
+
+            workers = [
+                asyncio.create_task(self._worker(client, frontier, results))
+                for _ in range(self.config.concurrency)
+            ]
+            done = asyncio.create_task(frontier.join())
+
+            while True:
+                get = asyncio.create_task(results.get())
+                finished, _ = await asyncio.wait({get, done}, return_when=asyncio.FIRST_COMPLETED)
+                if get in finished:
+                    yield get.result()
+                    continue
+                get.cancel()
+                # Frontier vazia: drenar o que ainda estiver na fila de resultados
+                while not results.empty():
+                    yield results.get_nowait()
+                break
+        finally:
+            for task in workers + ([done] if done else []):
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if self._owns_client:
+                await client.aclose()
+
+    def _enqueue(self, frontier: asyncio.Queue, url: str, depth: int):
+        if url in self._seen or depth > self.config.max_depth or not self.allowed(url):
+            return
+        if self._scheduled >= self.config.max_pages:
+            self.truncated = True
+            return
+        self._seen.add(url)
+        self._scheduled += 1
+        frontier.put_nowait((url, depth))
+
+    async def _worker(self, client: httpx.AsyncClient, frontier: asyncio.Queue, results: asyncio.Queue):
+        while True:
+            url, depth = await frontier.get()
+            try:
+                page = await self._fetch(client, url, depth)
+                if page is not None:
+                    for link in page.links:
+                        self._enqueue(frontier, link, depth + 1)
+                    await results.put(page)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning(f"⚠️ Falha ao rastrear {url}: {str(e)}")
+            finally:
+                frontier.task_done()
+
+    async def _fetch(self, client: httpx.AsyncClient, url: str, depth: int) -> Optional[CrawledPage]:
+        host = urlsplit(url).netloc
+        robots = await self._robots_for(client, url)
+        if robots is not None and not robots.can_fetch(self.config.user_agent, url):
+            self.stats["robots_blocked"] += 1
+            return None
+
+        await self._bucket(host, robots).acquire()
+
+        previous = await self.validators(url) if self.validators else None
+        headers = {}
+        if previous and previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous and previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+
+        async with client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and previous:
+                self.stats["not_modified"] += 1
+                return CrawledPage(
+                    url, depth, 304,
+                    etag=previous.get("etag"),
+                    last_modified=previous.get("last_modified"),
+                    links=list(previous.get("links") or [])
+                )
+
+            # Falha temporária: a página (e os links dela) pode ainda existir
+            if response.status_code == 429 or response.status_code >= 500:
+                self.stats["errors"] += 1
+                return None
+
+            content_type = response.headers.get("content-type", "")
+            if response.status_code != 200 or "html" not in content_type:
+                self.stats["skipped"] += 1
+                return None
+
+            # Redirecionamento para fora do escopo
+            final_url = normalize_url(str(response.url)) or url
+            if final_url != url and not self.allowed(final_url):
+                self.stats["skipped"] += 1
+                return None
+
+            body = bytearray()
+            async for data in response.aiter_bytes():
+                body.extend(data)
+                if len(body) > self.config.max_page_bytes:
+                    self.stats["skipped"] += 1
+                    logger.info(f"📏 Página acima de {self.config.max_page_bytes} bytes ignorada: {url}")
+                    return None
+
+            html = body.decode(response.encoding or "utf-8", errors="replace")
+            self.stats["fetched"] += 1
+            return CrawledPage(
+                url, depth, 200,
+                html=html,
+                etag=response.headers.get("etag"),
+                last_modified=response.headers.get("last-modified"),
+                links=extract_links(html, str(response.url))
+            )
+
+    def _bucket(self, host: str, robots: Optional[RobotFileParser]) -> TokenBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            rate = self.config.requests_per_second_per_host
+            delay = robots.crawl_delay(self.config.user_agent) if robots is not None else None
+            if delay:
+                rate = min(rate, 1 / float(delay))
+            # Capacidade 1: sem rajadas, intervalo uniforme entre requisições ao mesmo host
+            bucket = self._buckets[host] = TokenBucket(rate, capacity=1)
+        return bucket
+
+    async def _robots_for(self, client: httpx.AsyncClient, url: str) -> Optional[RobotFileParser]:
+        """robots.txt do host (uma busca por host; ausente ou inacessível = tudo permitido)"""
+        if not self.config.respect_robots:
+            return None
+
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        if origin in self._robots:
+            return self._robots[origin]
+
+        async with self._robots_lock:
+            if origin not in self._robots:
+                parser = None
+                try:
+                    response = await client.get(f"{origin}/robots.txt")
+                    if response.status_code == 200:
+                        parser = RobotFileParser()
+                        parser.parse(response.text.splitlines())
+                    elif response.status_code in (401, 403):
+                        # Convenção do RFC 9309: acesso negado ao robots.txt = nada permitido
+                        parser = RobotFileParser()
+                        parser.disallow_all = True
+                except httpx.HTTPError as e:
+                    logger.info(f"🤖 robots.txt indisponível em {origin}: {str(e)}")
+                self._robots[origin] = parser
+
+        return self._robots[origin]
+
+    async def _sitemap_urls(self, client: httpx.AsyncClient, seed: str) -> List[str]:
+        """URLs dos sitemaps declarados no robots.txt (ou /sitemap.xml), seguindo índices de sitemaps"""
+        parts = urlsplit(seed)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        robots = await self._robots_for(client, seed)
+        pending = list((robots.site_maps() if robots is not None else None) or [f"{origin}/sitemap.xml"])
+        visited: Set[str] = set()
+        urls: List[str] = []
+
+        while pending and len(visited) < MAX_SITEMAP_FILES and len(urls) < MAX_SITEMAP_URLS:
+            sitemap = pending.pop(0)
+            if sitemap in visited:
+                continue
+            visited.add(sitemap)
+
+            try:
+                response = await client.get(sitemap)
+                if response.status_code != 200:
+                    continue
+                root = ET.fromstring(response.content)
+            except (httpx.HTTPError, ET.ParseError) as e:
+                logger.info(f"🗺️ Sitemap ignorado ({sitemap}): {str(e)}")
+                continue
+
+            for loc in root.iter():
+                if not loc.tag.endswith("loc") or not loc.text:
+                    continue
+                if root.tag.endswith("sitemapindex"):
+                    pending.append(loc.text.strip())
+                else:
+                    url = normalize_url(loc.text)
+                    if url:
+                        urls.append(url)
+
+        logger.info(f"🗺️ {len(urls)} URLs em {len(visited)} sitemap(s) de {origin}")
+        return urls[:MAX_SITEMAP_URLS]
@@ -1,284 +1,564 @@
+import asyncio
 import google.generativeai as genai
 import httpx
-from typing import List, Dict, Any
+import logging
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Awaitable, Callable, Iterable, Iterator, Optional, Tuple
 from app.config import get_settings
 from app.database import get_supabase
+from app.services.cache import TTLCache
+from app.services.chunk_dedup import chunk_dedup
+from app.services.chunker import Block, Chunk, chunk_blocks, content_hash, csv_blocks, document_type, get_profile, text_blocks
+from app.services.crawler import CrawlConfig, SiteCrawler
+from app.services.embedding_cache import query_embedding_cache
+from app.services.embedding_pipeline import EmbeddingPipeline
+from app.services.html_extractor import html_extractor
+from app.services.pdf_extraction import iter_page_texts
+from app.services.retrieval import retrieve
+from app.services.semantic_cache import knowledge_versions
+from app.services.vector_index import vector_index
 
 settings = get_settings()
 genai.configure(api_key=settings.gemini_api_key)
 
+logger = logging.getLogger(__name__)
+
+# progress(chunks_done, total_chunks)
+ProgressCallback = Callable[[int, Optional[int]], Awaitable[None]]
+
+# Metadados de documentos pai consultados durante a ingestão (retries e jobs concorrentes)
+document_context_cache = TTLCache(maxsize=512, ttl=60)
+
+# Tamanho da prévia salva no documento principal
+PREVIEW_CHARS = 1000
+
+# Página de leitura de chunks existentes
+PAGE_SIZE = 1000
+
+# Exclusão por id (`in.(...)` vai na URL): lotes pequenos como nas consultas do chunk_dedup
+DELETE_BATCH = 100
+
+
+def _windows(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    window: List[Any] = []
+    for item in items:
+        window.append(item)
+        if len(window) >= size:
+            yield window
+            window = []
+    if window:
+        yield window
+
+
+def _docx_heading_level(style_name: str) -> int:
+    """Nível do título para estilos "Heading 2", "Título 2" ou "Title" (0 se não for título)"""
+    name = style_name.lower()
+    if name in ("title", "título"):
+        return 1
+    if name.startswith(("heading", "título")):
+        digits = "".join(ch for ch in name if ch.isdigit())
+        return int(digits) if digits else 1
+    return 0
+
+
+@dataclass
+class IngestionContext:
+    """Dados do documento pai resolvidos uma vez por execução de ingestão"""
+    
+    document_id: str
+    organization_id: str
+    label: str
+    access_level: str = "organization"
+    conversation_id: Optional[str] = None
+    business_rule_ids: List[str] = field(default_factory=list)
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    
+    def chunk_row(
+        self,
+        index: int,
+        content: str,
+        embedding: List[float],
+        metadata: Optional[Dict[str, Any]] = None,
+        content_hash: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Linha de `documents` para um chunk, herdando organização e acesso do documento pai"""
+        return {
+            "organization_id": self.organization_id,
+            "filename": f"{self.label} [Parte {index + 1}]",
+            "content": content,
+            "embedding": embedding,
+            "metadata": metadata or {},
+            "chunk_index": index,
+            "content_hash": content_hash,
+            "parent_document_id": self.document_id,
+            "conversation_id": self.conversation_id,
+            "business_rule_ids": self.business_rule_ids,
+            "access_level": self.access_level,
+            "status": "ready"
+        }
+
 
 class DocumentProcessor:
     """Processador de documentos para vetorização"""
     
     def __init__(self):
-        self.chunk_size = 1000
-        self.chunk_overlap = 200
+        self.embedding_pipeline = EmbeddingPipeline()
     
-    async def process_document(self, document_id: str, content: bytes, filename: str):
-        """Processar documento e criar embeddings"""
+    async def process_document(
+        self,
+        document_id: str,
+        path: str,
+        filename: str,
+        progress: Optional[ProgressCallback] = None
+    ):
+        """Processar (ou reprocessar) documento e criar embeddings
         
-        supabase = get_supabase()
+        `path` é o arquivo em disco: extração, chunking e embeddings correm em
+        streaming, com memória constante independente do tamanho do documento.
+        Reprocessamentos e retomadas de jobs só embeddam chunks novos;
+        `progress(chunks_done, total_chunks)` é chamado após cada janela salva.
+        """
         
-        # Extrair texto baseado no tipo de arquivo
-        text = await self._extract_text(content, filename)
+        # Resolver organização e metadados do documento uma única vez
+        context = await self._load_context(document_id, filename)
         
-        if not text:
-            raise ValueError("Não foi possível extrair texto do documento")
+        # Extrair blocos estruturais e dividir em chunks sob demanda
+        doc_type = document_type(filename)
+        blocks = self._extract_blocks(path, filename, doc_type)
+        chunks = chunk_blocks(blocks, get_profile(doc_type))
         
-        # Dividir em chunks
-        chunks = self._split_text(text)
+        # Gerar embeddings em lote e salvar
+        total, preview = await self._ingest_chunks(context, chunks, progress)
         
-        # Gerar embeddings e salvar
-        import asyncio
-        import logging
-        logger = logging.getLogger(__name__)
-
-        for i, chunk in enumerate(chunks):
-            # Adicionar delay entre chunks para evitar rate limiting
-            if i > 0:
-                await asyncio.sleep(2)  # 2 segundos de pausa entre cada chunk
-                
-            try:
-                embedding = await self._generate_embedding(chunk)
-                
-                supabase.table("documents").insert({
-                    "organization_id": (await self._get_doc_org(document_id)),
-                    "filename": f"{filename} [Parte {i+1}]",
-                    "content": chunk,
-                    "embedding": embedding,
-                    "chunk_index": i,
-                    "parent_document_id": document_id,
-                    "status": "ready"
-                }).execute()
-            except Exception as e:
-                logger.error(f"❌ Falha no chunk {i}: {str(e)}")
-                # Opcional: continuar com outros chunks ou falhar tudo
-                continue
+        if not total:
+            raise ValueError("Não foi possível extrair texto do documento")
         
         # Atualizar documento principal
-        supabase.table("documents").update({
-            "content": text[:1000] + "...",  # Preview
-            "status": "ready",
-            "metadata": {"total_chunks": len(chunks)}
-        }).eq("id", document_id).execute()
+        await self._finalize(context, preview, {"total_chunks": total, "document_type": doc_type})
     
-    async def process_url(self, document_id: str, url: str):
+    async def process_url(
+        self,
+        document_id: str,
+        url: str,
+        progress: Optional[ProgressCallback] = None
+    ):
         """Escanear URL e criar embeddings"""
         
-        supabase = get_supabase()
-        
         # Buscar conteúdo da URL
         async with httpx.AsyncClient() as client:
             response = await client.get(url, follow_redirects=True)
             response.raise_for_status()
             html = response.text
         
-        # Extrair texto do HTML (simplificado)
-        text = self._extract_text_from_html(html)
+        await self._ingest_html(document_id, url, html, {"source_url": url}, progress)
+    
+    async def process_site(
+        self,
+        document_id: str,
+        config: CrawlConfig,
+        progress: Optional[ProgressCallback] = None
+    ):
+        """Rastrear um site a partir de `config.seed_url` e ingerir cada página como documento próprio
+        
+        O documento `document_id` representa o rastreamento; as páginas ficam em
+        documentos "url" marcados com `metadata.site_document_id`, reaproveitados a
+        cada novo rastreamento: páginas não modificadas (304) não são baixadas nem
+        reprocessadas, e páginas alteradas só embeddam os chunks novos. Ao fim de
+        um rastreamento completo (`SiteCrawler.complete`), páginas anteriores que
+        não foram alcançadas são excluídas com seus chunks.
+        """
+        
+        site = await self._load_context(document_id, config.seed_url)
+        pages = await self._site_pages(document_id)
+        counts = {"ingested": 0, "unchanged": 0, "failed": 0}
+        
+        async def validators(url: str) -> Optional[Dict[str, Any]]:
+            page = pages.get(url)
+            return page["metadata"] if page and page.get("status") == "ready" else None
+        
+        crawler = SiteCrawler(config, validators=validators)
+        seen = set()
+        
+        async for page in crawler.crawl():
+            seen.add(page.url)
+            if page.status == 304:
+                counts["unchanged"] += 1
+            else:
+                try:
+                    page_id = await self._site_page_document(site, pages, page.url)
+                    await self._ingest_html(page_id, page.url, page.html, {
+                        "source_url": page.url,
+                        "site_document_id": document_id,
+                        "etag": page.etag,
+                        "last_modified": page.last_modified,
+                        "links": page.links
+                    })
+                    counts["ingested"] += 1
+                except Exception as e:
+                    counts["failed"] += 1
+                    logger.error(f"❌ Falha ao ingerir {page.url}: {str(e)}")
+            
+            # Número de páginas só é conhecido ao fim do rastreamento
+            if progress:
+                await progress(sum(counts.values()), None)
+        
+        total = sum(counts.values())
+        if not total:
+            raise ValueError(f"Nenhuma página rastreada a partir de {config.seed_url}")
+        
+        if progress:
+            await progress(total, total)
+        
+        # Páginas que saíram do site; num rastreamento incompleto elas podem só não ter sido alcançadas
+        removed = [url for url in pages if url not in seen] if crawler.complete else []
+        if removed:
+            await self._remove_site_pages(site, [pages.pop(url)["id"] for url in removed])
+        
+        logger.info(f"🕸️ {config.seed_url}: {counts['ingested']} páginas ingeridas, {counts['unchanged']} sem alteração, {counts['failed']} com falha, {len(removed)} removidas ({crawler.stats})")
+        
+        await self._finalize(site, "\n".join(list(pages)[:50]), {
+            "source_url": config.seed_url,
+            "pages": total,
+            "pages_ingested": counts["ingested"],
+            "pages_unchanged": counts["unchanged"],
+            "pages_failed": counts["failed"],
+            "pages_removed": len(removed),
+            "crawl": crawler.stats
+        })
+    
+    async def _site_pages(self, site_document_id: str) -> Dict[str, Dict[str, Any]]:
+        """Documentos de páginas de rastreamentos anteriores do site, por URL"""
+        
+        supabase = get_supabase()
+        pages: Dict[str, Dict[str, Any]] = {}
+        last_id = None
         
-        if not text:
+        while True:
+            query = supabase.table("documents").select("id, filename, status, metadata").eq(
+                "metadata->>site_document_id", site_document_id
+            ).is_("parent_document_id", "null")
+            if last_id is not None:
+                query = query.gt("id", last_id)
+            result = await query.order("id").limit(PAGE_SIZE).execute()
+            
+            page = result.data or []
+            for row in page:
+                pages[row["filename"]] = row
+            
+            if len(page) < PAGE_SIZE:
+                break
+            last_id = page[-1]["id"]
+        
+        return pages
+    
+    async def _remove_site_pages(self, site: IngestionContext, page_ids: List[str]):
+        """Excluir documentos de páginas (e seus chunks) do banco e do índice vetorial local"""
+        
+        supabase = get_supabase()
+        for start in range(0, len(page_ids), DELETE_BATCH):
+            batch = page_ids[start:start + DELETE_BATCH]
+            await supabase.table("documents").delete().in_("parent_document_id", batch).execute()
+            await supabase.table("documents").delete().in_("id", batch).execute()
+        
+        for page_id in page_ids:
+            vector_index.remove_document(site.organization_id, page_id)
+            document_context_cache.invalidate(page_id)
+    
+    async def _site_page_document(self, site: IngestionContext, pages: Dict[str, Dict[str, Any]], url: str) -> str:
+        """ID do documento da página (criado na primeira visita, com o acesso do documento do site)"""
+        
+        existing = pages.get(url)
+        if existing:
+            return existing["id"]
+        
+        supabase = get_supabase()
+        result = await supabase.table("documents").insert({
+            "organization_id": site.organization_id,
+            "conversation_id": site.conversation_id,
+            "filename": url,
+            "file_type": "url",
+            "business_rule_ids": site.business_rule_ids,
+            "access_level": site.access_level,
+            "status": "processing",
+            "metadata": {"site_document_id": site.document_id}
+        }).execute()
+        
+        pages[url] = result.data[0]
+        return pages[url]["id"]
+    
+    async def _ingest_html(
+        self,
+        document_id: str,
+        url: str,
+        html: str,
+        metadata: Dict[str, Any],
+        progress: Optional[ProgressCallback] = None
+    ):
+        """Extrair texto do HTML, dividir em chunks e ingerir no documento"""
+        
+        # Resolver organização e metadados do documento uma única vez
+        context = await self._load_context(document_id, url)
+        
+        # Extrair títulos e parágrafos do conteúdo principal (CPU: fora do event loop)
+        blocks = await asyncio.to_thread(html_extractor.extract, html)
+        
+        if not blocks:
             raise ValueError("Não foi possível extrair texto da URL")
         
         # Dividir em chunks
-        chunks = self._split_text(text)
+        chunks = chunk_blocks(blocks, get_profile("html"))
         
-        # Gerar embeddings e salvar
-        import asyncio
-        import logging
-        logger = logging.getLogger(__name__)
-
-        for i, chunk in enumerate(chunks):
-            # Adicionar delay entre chunks para evitar rate limiting
-            if i > 0:
-                await asyncio.sleep(2)  # 2 segundos de pausa entre cada chunk
-                
-            try:
-                embedding = await self._generate_embedding(chunk)
-                
-                supabase.table("documents").insert({
-                    "organization_id": (await self._get_doc_org(document_id)),
-                    "filename": f"{url} [Parte {i+1}]",
-                    "content": chunk,
-                    "embedding": embedding,
-                    "chunk_index": i,
-                    "parent_document_id": document_id,
-                    "status": "ready"
-                }).execute()
-            except Exception as e:
-                logger.error(f"❌ Falha no chunk {i} do crawler: {str(e)}")
-                continue
+        # Gerar embeddings em lote e salvar
+        total, preview = await self._ingest_chunks(context, chunks, progress)
         
         # Atualizar documento principal
-        supabase.table("documents").update({
-            "content": text[:1000] + "...",
+        await self._finalize(context, preview, {"total_chunks": total, **metadata})
+    
+    async def _ingest_chunks(
+        self,
+        context: IngestionContext,
+        chunks: Iterable[Chunk],
+        progress: Optional[ProgressCallback] = None
+    ) -> Tuple[int, str]:
+        """Ingestão incremental e endereçada por conteúdo
+        
+        Chunks iguais (posição + hash) aos já salvos do documento são mantidos;
+        os demais reaproveitam embeddings do índice de deduplicação da organização
+        e só o que é realmente novo vai para a API de embeddings. Chunks antigos
+        que não aparecem mais são removidos ao final. Também cobre retomadas de
+        jobs: o que a tentativa anterior salvou é reconhecido e mantido.
+        
+        `chunks` é consumido sob demanda; retorna (total de chunks, prévia do texto).
+        """
+        
+        supabase = get_supabase()
+        existing = await self._existing_chunks(context)
+        state = {"total": 0, "preview": "", "kept": 0, "reused": 0, "embedded": 0, "failed": 0}
+        
+        def pending() -> Iterator[Tuple[int, Chunk, str]]:
+            for chunk in chunks:
+                index = state["total"]
+                state["total"] += 1
+                if len(state["preview"]) < PREVIEW_CHARS:
+                    state["preview"] += chunk.text + "\n"
+                
+                digest = content_hash(chunk.text)
+                ids = existing.get((index, digest))
+                if ids:
+                    ids.pop()
+                    state["kept"] += 1
+                    continue
+                yield index, chunk, digest
+        
+        # Janela = lotes que cabem em voo no pipeline; uma consulta ao índice de deduplicação por janela
+        window_size = self.embedding_pipeline.batch_size * self.embedding_pipeline.max_in_flight
+        
+        windows = _windows(pending(), window_size)
+        
+        while True:
+            # Extração e chunking (CPU e I/O de arquivo) rodam fora do event loop
+            window = await asyncio.to_thread(next, windows, None)
+            if window is None:
+                break
+            
+            embeddings = await chunk_dedup.lookup(context.organization_id, (digest for _, _, digest in window))
+            state["reused"] += sum(1 for _, _, digest in window if digest in embeddings)
+            
+            # Hashes repetidos dentro da janela são embeddados uma vez
+            missing: Dict[str, str] = {}
+            for _, chunk, digest in window:
+                if digest not in embeddings:
+                    missing.setdefault(digest, chunk.text)
+            
+            async for _, digests, vectors in self.embedding_pipeline.run(list(missing), text_of=missing.__getitem__):
+                if vectors is None:
+                    logger.error(f"❌ Falha ao gerar embeddings de {len(digests)} chunks de {context.label}")
+                    continue
+                fresh = dict(zip(digests, vectors))
+                embeddings.update(fresh)
+                state["embedded"] += len(fresh)
+                try:
+                    await chunk_dedup.store(context.organization_id, fresh)
+                except Exception as e:
+                    logger.warning(f"⚠️ Falha ao registrar embeddings no índice de deduplicação: {str(e)}")
+            
+            rows = [
+                context.chunk_row(index, chunk.text, embeddings[digest], chunk.metadata, digest)
+                for index, chunk, digest in window
+                if digest in embeddings
+            ]
+            state["failed"] += len(window) - len(rows)
+            
+            for start in range(0, len(rows), self.embedding_pipeline.batch_size):
+                batch = rows[start:start + self.embedding_pipeline.batch_size]
+                try:
+                    result = await supabase.table("documents").insert(batch).execute()
+                    
+                    # Manter o índice vetorial local (se carregado neste processo) atualizado
+                    vector_index.add_chunks(context.organization_id, [
+                        {**row, "id": inserted["id"]}
+                        for row, inserted in zip(batch, result.data or [])
+                    ])
+                except Exception as e:
+                    state["failed"] += len(batch)
+                    logger.error(f"❌ Falha ao inserir chunks {batch[0]['chunk_index']}-{batch[-1]['chunk_index']} de {context.label}: {str(e)}")
+            
+            # Total só é conhecido ao fim do gerador
+            if progress:
+                await progress(state["total"], None)
+        
+        # Chunks da versão anterior que não existem mais
+        stale = [chunk_id for ids in existing.values() for chunk_id in ids]
+        for start in range(0, len(stale), DELETE_BATCH):
+            await supabase.table("documents").delete().in_("id", stale[start:start + DELETE_BATCH]).execute()
+        vector_index.remove_chunks(context.organization_id, stale)
+        
+        logger.info(
+            f"♻️ {context.label}: {state['total']} chunks ({state['kept']} mantidos, {state['reused']} reaproveitados, "
+            f"{state['embedded']} embeddados, {state['failed']} com falha, {len(stale)} antigos removidos)"
+        )
+        
+        if progress and state["total"]:
+            await progress(state["total"], state["total"])
+        
+        return state["total"], state["preview"]
+    
+    async def _existing_chunks(self, context: IngestionContext) -> Dict[Tuple[int, str], List[str]]:
+        """Chunks já salvos do documento, por (posição, hash)
+        
+        Chunks com acesso ou associações diferentes do documento atual (ou sem
+        hash, anteriores à migração 008) ficam fora e acabam removidos.
+        """
+        
+        supabase = get_supabase()
+        existing: Dict[Tuple[int, str], List[str]] = {}
+        last_id = None
+        
+        while True:
+            query = supabase.table("documents").select(
+                "id, chunk_index, content_hash, conversation_id, business_rule_ids, access_level"
+            ).eq("parent_document_id", context.document_id)
+            if last_id is not None:
+                query = query.gt("id", last_id)
+            result = await query.order("id").limit(PAGE_SIZE).execute()
+            
+            page = result.data or []
+            for row in page:
+                reusable = (
+                    row.get("content_hash")
+                    and row.get("conversation_id") == context.conversation_id
+                    and (row.get("business_rule_ids") or []) == context.business_rule_ids
+                    and (row.get("access_level") or "organization") == context.access_level
+                )
+                key = (row["chunk_index"], row["content_hash"]) if reusable else (-1, "")
+                existing.setdefault(key, []).append(row["id"])
+            
+            if len(page) < PAGE_SIZE:
+                break
+            last_id = page[-1]["id"]
+        
+        # Chave (-1, "") nunca coincide com um chunk novo: tudo nela é removido
+        return existing
+    
+    async def _finalize(self, context: IngestionContext, preview: str, metadata: Dict[str, Any]):
+        """Marcar o documento principal como pronto, preservando os metadados existentes"""
+        
+        supabase = get_supabase()
+        await supabase.table("documents").update({
+            "content": preview[:PREVIEW_CHARS] + "...",  # Preview
             "status": "ready",
-            "metadata": {"total_chunks": len(chunks), "source_url": url}
-        }).eq("id", document_id).execute()
+            "metadata": {**context.metadata, **metadata}
+        }).eq("id", context.document_id).execute()
+        
+        document_context_cache.invalidate(context.document_id)
+        knowledge_versions.invalidate(context.organization_id)
     
     async def search(self, organization_id: str, query: str, limit: int = 5) -> List[Dict[str, Any]]:
         """Buscar documentos similares"""
         
-        embedding = await self._generate_embedding(query)
-        
-        supabase = get_supabase()
-        response = supabase.rpc('search_documents', {
-            'query_embedding': embedding,
-            'org_id': organization_id,
-            'match_threshold': 0.5,
-            'match_count': limit
-        }).execute()
+        embedding = await query_embedding_cache.embed(query)
         
-        return response.data
+        return await retrieve(organization_id, query, embedding, limit=limit, threshold=0.5)
     
-    async def _extract_text(self, content: bytes, filename: str) -> str:
-        """Extrair texto de diferentes formatos"""
+    def _extract_blocks(self, path: str, filename: str, doc_type: str) -> Iterator[Block]:
+        """Extrair blocos estruturais (títulos, parágrafos, linhas de CSV, páginas) do arquivo sob demanda"""
         
-        filename_lower = filename.lower()
+        # Parágrafos de texto corrido saem em partes de até um chunk
+        max_tokens = get_profile(doc_type).max_tokens
         
         try:
-            if filename_lower.endswith('.txt'):
-                return content.decode('utf-8')
+            if doc_type == "csv":
+                # Linha a linha, sem carregar o arquivo
+                with open(path, encoding="utf-8-sig", newline="") as file:
+                    yield from csv_blocks(file)
             
-            elif filename_lower.endswith('.csv'):
-                return content.decode('utf-8')
-            
-            elif filename_lower.endswith('.pdf'):
-                # Usar PyPDF2 para extrair texto de PDF
+            elif doc_type == "pdf":
+                # Páginas extraídas em paralelo (pool de processos), entregues em ordem
                 try:
-                    from PyPDF2 import PdfReader
-                    import io
-                    
-                    pdf_file = io.BytesIO(content)
-                    pdf_reader = PdfReader(pdf_file)
-                    
-                    text_parts = []
-                    for page in pdf_reader.pages:
-                        text_parts.append(page.extract_text())
-                    
-                    return '\n'.join(text_parts)
+                    for number, text in iter_page_texts(path):
+                        yield Block("page", page=number)
+                        yield from text_blocks(text, page=number, max_tokens=max_tokens)
                 except Exception as e:
                     raise ValueError(f"Erro ao processar PDF: {str(e)}")
             
-            elif filename_lower.endswith('.docx'):
-                # Usar python-docx para extrair texto de DOCX
+            elif doc_type == "docx":
+                # Usar python-docx; estilos "Heading N"/"Título N" viram títulos
                 try:
                     from docx import Document
-                    import io
                     
-                    docx_file = io.BytesIO(content)
-                    doc = Document(docx_file)
+                    doc = Document(path)
                     
-                    text_parts = []
                     for paragraph in doc.paragraphs:
-                        text_parts.append(paragraph.text)
-                    
-                    return '\n'.join(text_parts)
+                        text = paragraph.text.strip()
+                        if not text:
+                            continue
+                        level = _docx_heading_level(paragraph.style.name if paragraph.style is not None else "")
+                        if level:
+                            yield Block("heading", text, level=level)
+                        else:
+                            yield Block("paragraph", text)
                 except Exception as e:
                     raise ValueError(f"Erro ao processar DOCX: {str(e)}")
             
+            elif doc_type == "html":
+                with open(path, encoding="utf-8", errors="ignore") as file:
+                    html = file.read()
+                yield from html_extractor.extract(html)
+            
+            elif filename.lower().endswith(('.txt', '.md', '.markdown')):
+                with open(path, encoding="utf-8") as file:
+                    yield from text_blocks(file, max_tokens=max_tokens)
+            
             else:
                 # Tentar decodificar como texto simples
-                return content.decode('utf-8', errors='ignore')
+                with open(path, encoding="utf-8", errors="ignore") as file:
+                    yield from text_blocks(file, max_tokens=max_tokens)
                 
         except UnicodeDecodeError:
             raise ValueError(f"Não foi possível decodificar o arquivo {filename}")
+        except ValueError:
+            raise
         except Exception as e:
             raise ValueError(f"Erro ao processar arquivo {filename}: {str(e)}")
     
-    def _extract_text_from_html(self, html: str) -> str:
-        """Extrair texto de HTML usando BeautifulSoup"""
-        try:
-            from bs4 import BeautifulSoup
-            
-            soup = BeautifulSoup(html, 'html.parser')
-            
-            # Remover scripts e styles
-            for script in soup(["script", "style"]):
-                script.decompose()
-            
-            # Extrair texto
-            text = soup.get_text()
-            
-            # Limpar espaços extras
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = '\n'.join(chunk for chunk in chunks if chunk)
-            
-            return text
-        except Exception as e:
-            # Fallback para regex se BeautifulSoup falhar
-            import re
-            html = re.sub(r'<script[^>]*>.*?</script>', '', html, flags=re.DOTALL | re.IGNORECASE)
-            html = re.sub(r'<style[^>]*>.*?</style>', '', html, flags=re.DOTALL | re.IGNORECASE)
-            text = re.sub(r'<[^>]+>', ' ', html)
-            text = re.sub(r'\s+', ' ', text).strip()
-            return text
-    
-    def _split_text(self, text: str) -> List[str]:
-        """Dividir texto em chunks"""
-        
-        chunks = []
-        start = 0
-        
-        while start < len(text):
-            end = start + self.chunk_size
-            
-            if end < len(text):
-                # Tentar encontrar fim de frase
-                last_period = text.rfind('.', start, end)
-                if last_period > start + self.chunk_size // 2:
-                    end = last_period + 1
-            
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
-            
-            start = end - self.chunk_overlap
-        
-        return chunks
-    
-    async def _generate_embedding(self, text: str) -> List[float]:
-        """Gerar embedding usando Gemini com retry e rate limiting"""
-        import asyncio
-        import logging
-        from google.api_core import exceptions
-        
-        logger = logging.getLogger(__name__)
-        
-        # Retry mechanism
-        max_retries = 5
-        base_delay = 2  # segundos
-        
-        for attempt in range(max_retries):
-            try:
-                result = genai.embed_content(
-                    model="models/embedding-001",
-                    content=text,
-                    task_type="retrieval_document"
-                )
-                return result['embedding']
-                
-            except exceptions.ResourceExhausted as e:
-                # Quota excedida (429)
-                delay = base_delay * (2 ** attempt)  # Exponential backoff: 2, 4, 8, 16...
-                if delay > 60: delay = 60
-                
-                logger.warning(f"⚠️ Quota do Gemini excedida. Aguardando {delay}s antes de tentar novamente (Tentativa {attempt+1}/{max_retries})")
-                await asyncio.sleep(delay)
-                
-            except Exception as e:
-                logger.error(f"❌ Erro ao gerar embedding: {str(e)}")
-                if attempt == max_retries - 1:
-                    raise e
-                await asyncio.sleep(1)
+    async def _load_context(self, document_id: str, label: str) -> IngestionContext:
+        """Resolver organização, nível de acesso e metadados do documento (uma consulta por ingestão)"""
         
-        raise Exception("Falha ao gerar embedding após várias tentativas")
-    
-    async def _get_doc_org(self, document_id: str) -> str:
-        """Buscar organization_id do documento"""
+        async def load() -> Dict[str, Any]:
+            supabase = get_supabase()
+            result = await supabase.table("documents").select(
+                "organization_id, conversation_id, business_rule_ids, access_level, metadata"
+            ).eq("id", document_id).single().execute()
+            return result.data
         
-        supabase = get_supabase()
-        result = supabase.table("documents").select("organization_id").eq("id", document_id).single().execute()
+        document = await document_context_cache.get_or_load(document_id, load)
         
-        return result.data["organization_id"]
+        return IngestionContext(
+            document_id=document_id,
+            organization_id=document["organization_id"],
+            label=label,
+            access_level=document.get("access_level") or "organization",
+            conversation_id=document.get("conversation_id"),
+            business_rule_ids=document.get("business_rule_ids") or [],
+            metadata=document.get("metadata") or {}
+        )
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Any, Dict, List, Optional
+from app.config import get_settings
+from app.services import metrics
+from app.services.cache import TTLCache
+from app.services.embedding_pipeline import EMBEDDING_MODEL, EmbedFn, gemini_embed
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Normalizar texto para a chave do cache ("  Oi!! " -> "oi")"""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return text.rstrip(" .!?…") or text
+
+
+class DiskEmbeddingStore:
+    """Camada persistente opcional (SQLite) para sobreviver a reinícios e ser compartilhada entre processos"""
+
+    def __init__(self, path: str, ttl: Optional[float]):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "key TEXT PRIMARY KEY, embedding BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # Uma conexão por thread do pool de asyncio.to_thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, key: str) -> Optional[List[float]]:
+        row = self._connect().execute(
+            "SELECT embedding, created_at FROM query_embeddings WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is None:
+            return None
+        if self.ttl and row[1] + self.ttl <= time.time():
+            return None
+        return array("f", row[0]).tolist()
+
+    def _set(self, key: str, embedding: List[float]):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (key, embedding, created_at) VALUES (?, ?, ?)",
+                (key, array("f", embedding).tobytes(), time.time())
+            )
+
+    async def get(self, key: str) -> Optional[List[float]]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, embedding: List[float]):
+        await asyncio.to_thread(self._set, key, embedding)
+
+
+class QueryEmbeddingCache:
+    """Cache de embeddings de perguntas: LRU+TTL em memória, single-flight e disco opcional.
+
+    Compartilhado pela busca do DocumentProcessor e pelo RAG do AIEngine;
+    mensagens repetidas ("oi", "obrigado") não chegam à API do Gemini.
+    """
+
+    def __init__(
+        self,
+        embed_fn: EmbedFn = gemini_embed,
+        maxsize: int = 10000,
+        ttl: Optional[float] = 86400.0,
+        disk: Optional[DiskEmbeddingStore] = None
+    ):
+        self.embed_fn = embed_fn
+        self.disk = disk
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk_hits = 0
+        self.api_calls = 0
+
+    @staticmethod
+    def key(text: str, task_type: str) -> str:
+        return hashlib.sha256(f"{EMBEDDING_MODEL}|{task_type}|{text}".encode("utf-8")).hexdigest()
+
+    async def embed(self, text: str, task_type: str = "retrieval_query") -> List[float]:
+        normalized = normalize_query(text)
+        key = self.key(normalized, task_type)
+
+        return await self._memory.get_or_load(key, lambda: self._load(key, normalized, task_type))
+
+    async def _load(self, key: str, text: str, task_type: str) -> List[float]:
+        if self.disk is not None:
+            try:
+                embedding = await self.disk.get(key)
+                if embedding is not None:
+                    self.disk_hits += 1
+                    return embedding
+            except Exception as e:
+                logger.warning(f"⚠️ Erro ao ler cache de embeddings em disco: {str(e)}")
+
+        self.api_calls += 1
+        embedding = (await self.embed_fn([text], task_type))[0]
+
+        if self.disk is not None:
+            try:
+                await self.disk.set(key, embedding)
+            except Exception as e:
+                logger.warning(f"⚠️ Erro ao gravar cache de embeddings em disco: {str(e)}")
+
+        return embedding
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._memory.stats(),
+            "disk": self.disk is not None,
+            "disk_hits": self.disk_hits,
+            "api_calls": self.api_calls
+        }
+
+
+query_embedding_cache = QueryEmbeddingCache(
+    maxsize=settings.embedding_cache_maxsize,
+    ttl=settings.embedding_cache_ttl_seconds,
+    disk=DiskEmbeddingStore(settings.embedding_cache_path, settings.embedding_cache_disk_ttl_seconds)
+    if settings.embedding_cache_path else None
+)
+
+metrics.register("query_embedding_cache", query_embedding_cache.stats)
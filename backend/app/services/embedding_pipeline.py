@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, List, Optional, Tuple
+import google.generativeai as genai
+from google.api_core import exceptions
+from app.config import get_settings
+from app.services.rate_limiter import TokenBucket
+
+settings = get_settings()
+genai.configure(api_key=settings.gemini_api_key)
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "models/embedding-001"
+
+EmbedFn = Callable[[List[str], str], Awaitable[List[List[float]]]]
+
+# Quota do Gemini é por chave de API: um único bucket compartilhado por todas as ingestões
+embedding_rate_limiter = TokenBucket.per_minute(
+    settings.embedding_requests_per_minute,
+    burst=settings.embedding_max_in_flight
+)
+
+
+async def gemini_embed(texts: List[str], task_type: str) -> List[List[float]]:
+    """Backend padrão: uma requisição batchEmbedContents ao Gemini (executada em thread)"""
+    result = await asyncio.to_thread(
+        genai.embed_content,
+        model=EMBEDDING_MODEL,
+        content=texts,
+        task_type=task_type
+    )
+    return result["embedding"]
+
+
+class EmbeddingPipeline:
+    """Pipeline de embeddings em lote com rate limiting e número limitado de lotes em voo"""
+
+    def __init__(
+        self,
+        embed_fn: EmbedFn = gemini_embed,
+        batch_size: int = None,
+        max_in_flight: int = None,
+        rate_limiter: Optional[TokenBucket] = None,
+        max_retries: int = 5,
+        base_delay: float = 2.0
+    ):
+        self.embed_fn = embed_fn
+        self.batch_size = batch_size or settings.embedding_batch_size
+        self.max_in_flight = max_in_flight or settings.embedding_max_in_flight
+        self.rate_limiter = rate_limiter or embedding_rate_limiter
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+
+    async def embed(self, texts: List[str], task_type: str = "retrieval_document") -> List[List[float]]:
+        """Gerar embeddings de um lote com retry e backoff exponencial"""
+
+        for attempt in range(self.max_retries):
+            await self.rate_limiter.acquire()
+
+            try:
+                embeddings = await self.embed_fn(texts, task_type)
+                if len(embeddings) != len(texts):
+                    raise ValueError(f"Esperados {len(texts)} embeddings, recebidos {len(embeddings)}")
+                return embeddings
+
+            except exceptions.ResourceExhausted:
+                # Quota excedida (429)
+                delay = min(self.base_delay * (2 ** attempt), 60)
+                logger.warning(f"⚠️ Quota do Gemini excedida. Aguardando {delay}s antes de tentar novamente (Tentativa {attempt+1}/{self.max_retries})")
+                await asyncio.sleep(delay)
+
+            except Exception as e:
+                logger.error(f"❌ Erro ao gerar embeddings do lote: {str(e)}")
+                if attempt == self.max_retries - 1:
+                    raise
+                await asyncio.sleep(1)
+
+        raise Exception("Falha ao gerar embeddings após várias tentativas")
+
+    async def run(
+        self,
+        chunks: Iterable[Any],
+        task_type: str = "retrieval_document",
+        text_of: Optional[Callable[[Any], str]] = None
+    ) -> AsyncIterator[Tuple[int, List[Any], Optional[List[List[float]]]]]:
+        """Embeddar chunks em lotes, emitindo (índice inicial, chunks, embeddings) na ordem original.
+
+        `chunks` pode ser um gerador (consumido sob demanda); se os itens não forem
+        strings, `text_of(item)` fornece o texto a embeddar.
+        Lotes que falham após todas as tentativas são emitidos com embeddings `None`
+        para que o chamador possa registrar e seguir com os demais.
+        """
+
+        pending = deque()
+
+        async def embed_batch(items: List[Any]) -> Optional[List[List[float]]]:
+            texts = [text_of(item) for item in items] if text_of else items
+            try:
+                return await self.embed(texts, task_type)
+            except Exception as e:
+                logger.error(f"❌ Lote de {len(texts)} chunks descartado: {str(e)}")
+                return None
+
+        try:
+            for start, texts in self._batches(chunks):
+                pending.append((start, texts, asyncio.create_task(embed_batch(texts))))
+
+                if len(pending) >= self.max_in_flight:
+                    start, texts, task = pending.popleft()
+                    yield start, texts, await task
+
+            while pending:
+                start, texts, task = pending.popleft()
+                yield start, texts, await task
+        finally:
+            for _, _, task in pending:
+                task.cancel()
+
+    def _batches(self, chunks: Iterable[str]):
+        batch = []
+        start = 0
+
+        for i, chunk in enumerate(chunks):
+            if not batch:
+                start = i
+            batch.append(chunk)
+
+            if len(batch) >= self.batch_size:
+                yield start, batch
+                batch = []
+
+        if batch:
+            yield start, batch
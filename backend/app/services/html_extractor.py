@@ -0,0 +1,310 @@
+import logging
+import re
+from typing import Callable, Dict, List, Optional
+from app.config import get_settings
+from app.services.chunker import Block, text_blocks
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+# Elementos que nunca são conteúdo
+_DROP_TAGS = (
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "embed",
+    "nav", "aside", "button", "select", "input", "textarea", "dialog", "menu"
+)
+
+# <form> com menos texto que isso é formulário de verdade (busca, login, newsletter); acima,
+# é contêiner da página (ASP.NET WebForms envolve o <body> inteiro em <form id="form1">)
+MAX_FORM_CHARS = 200
+
+# Mesmas heurísticas do Readability (unlikelyCandidates / okMaybeItsACandidate), mais banners de cookies
+_UNLIKELY = re.compile(
+    r"-ad-|ad-break|agegate|banner|breadcrumb|combx|comment|community|consent|cookie|cover-wrap|disqus|extra|"
+    r"footer|gdpr|header|legends|menu|modal|newsletter|pager|pagination|popup|related|remark|replies|rss|share|"
+    r"shoutbox|sidebar|skyscraper|social|sponsor|subscribe|supplemental|toolbar|yom-remote",
+    re.IGNORECASE
+)
+_MAYBE_CANDIDATE = re.compile(r"and|article|body|column|content|main|shadow", re.IGNORECASE)
+_BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "complementary", "search", "dialog", "alert", "menu", "menubar"}
+
+_HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+_BLOCK_TAGS = {
+    "address", "article", "blockquote", "body", "dd", "details", "div", "dl", "dt", "fieldset", "figcaption",
+    "figure", "footer", "header", "hr", "li", "main", "ol", "p", "pre", "section", "summary", "table",
+    "tbody", "td", "tfoot", "th", "thead", "tr", "ul", "br"
+} | set(_HEADINGS)
+
+# Pontuação inicial por tag (Readability)
+_TAG_SCORES = {"div": 5, "pre": 3, "td": 3, "blockquote": 3, "address": -3, "ol": -3, "ul": -3, "dl": -3,
+               "dd": -3, "dt": -3, "li": -3, "form": -3, "th": -5}
+
+# Conteúdo principal (<main>/<article>) com menos texto que isso não é confiável
+MIN_MAIN_CONTENT_CHARS = 200
+
+
+def _clean(text: str) -> str:
+    return " ".join(text.split())
+
+
+class SoupExtractor:
+    """Backend legado: BeautifulSoup com `html.parser` (Python puro), texto da página inteira"""
+
+    name = "bs4"
+
+    def extract(self, html: str) -> List[Block]:
+        return list(text_blocks(self.extract_text(html)))
+
+    def extract_text(self, html: str) -> str:
+        try:
+            from bs4 import BeautifulSoup
+
+            soup = BeautifulSoup(html, 'html.parser')
+
+            # Remover scripts e styles
+            for script in soup(["script", "style"]):
+                script.decompose()
+
+            # Extrair texto
+            text = soup.get_text()
+
+            # Limpar espaços extras
+            lines = (line.strip() for line in text.splitlines())
+            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+            text = '\n'.join(chunk for chunk in chunks if chunk)
+
+            return text
+        except Exception:
+            # Fallback para regex se BeautifulSoup falhar
+            html = re.sub(r'<script[^>]*>.*?</script>', '', html, flags=re.DOTALL | re.IGNORECASE)
+            html = re.sub(r'<style[^>]*>.*?</style>', '', html, flags=re.DOTALL | re.IGNORECASE)
+            text = re.sub(r'<[^>]+>', ' ', html)
+            text = re.sub(r'\s+', ' ', text).strip()
+            return text
+
+
+class LxmlExtractor:
+    """Backend rápido: parser C do libxml2 (lxml), remoção de boilerplate e detecção do conteúdo principal
+
+    1. descarta navegação, formulários (os com pouco texto), scripts e elementos com cara de boilerplate
+       (classe/id/role de menu, rodapé, banner de cookies, compartilhamento...)
+    2. usa <main>/<article> quando existem; senão pontua os contêineres pelo
+       texto dos parágrafos (estilo Readability) e fica com o melhor e os irmãos relevantes
+    3. emite títulos e parágrafos como blocos estruturais para o chunker
+
+    Se a limpeza deixar menos de MIN_MAIN_CONTENT_CHARS de texto (ex: artigo
+    dentro de `<div class="header-comments">`), extrai de novo sem o filtro por
+    classe/id, como o Readability ao desligar suas heurísticas.
+    """
+
+    name = "lxml"
+
+    def __init__(self, main_content: bool = True):
+        self.main_content = main_content
+
+    def extract(self, html: str) -> List[Block]:
+        if not html or not html.strip():
+            return []
+
+        blocks = self._extract(html, unlikely=True)
+        if self._text_length(blocks) >= MIN_MAIN_CONTENT_CHARS:
+            return blocks
+
+        # Pouco texto: o filtro por classe/id pode ter removido o conteúdo real
+        relaxed = self._extract(html, unlikely=False)
+        return relaxed if self._text_length(relaxed) > self._text_length(blocks) else blocks
+
+    @staticmethod
+    def _text_length(blocks: List[Block]) -> int:
+        return sum(len(block.text) for block in blocks if block.kind != "heading")
+
+    def _extract(self, html: str, unlikely: bool) -> List[Block]:
+        from lxml import etree, html as lxml_html
+
+        try:
+            document = lxml_html.document_fromstring(html)
+        except (etree.ParserError, ValueError):
+            return []
+
+        title = _clean(document.findtext(".//title") or "")
+        etree.strip_elements(document, etree.Comment, *_DROP_TAGS, with_tail=False)
+        self._drop_boilerplate(document, unlikely)
+
+        body = document.find("body")
+        if body is None:
+            body = document
+        roots = self._main_content(body) if self.main_content else [body]
+
+        blocks: List[Block] = []
+        for root in roots:
+            self._walk(root, blocks)
+
+        if title and not any(block.kind == "heading" and block.level == 1 for block in blocks):
+            blocks.insert(0, Block("heading", title, level=1))
+
+        return blocks
+
+    def extract_text(self, html: str) -> str:
+        return "\n".join(block.text for block in self.extract(html))
+
+    def _drop_boilerplate(self, document, unlikely: bool = True):
+        doomed = []
+        for element in document.iter():
+            if not isinstance(element.tag, str) or element.tag in ("html", "body", "main", "article"):
+                continue
+
+            if element.get("hidden") is not None or element.get("aria-hidden") == "true":
+                doomed.append(element)
+                continue
+            if (element.get("role") or "").lower() in _BOILERPLATE_ROLES:
+                doomed.append(element)
+                continue
+            if element.tag in ("header", "footer") and element.getparent() is not None and element.getparent().tag == "body":
+                doomed.append(element)
+                continue
+            if element.tag == "form" and len(_clean(element.text_content())) < MAX_FORM_CHARS:
+                doomed.append(element)
+                continue
+
+            if not unlikely:
+                continue
+            signature = f"{element.get('class') or ''} {element.get('id') or ''}"
+            if signature.strip() and _UNLIKELY.search(signature) and not _MAYBE_CANDIDATE.search(signature):
+                doomed.append(element)
+
+        for element in doomed:
+            if element.getparent() is not None:
+                element.drop_tree()
+
+    def _main_content(self, body) -> List:
+        # Marcação semântica explícita
+        marked = [
+            element for element in body.iter("main", "article")
+        ] + body.xpath(".//*[@role='main']")
+        if marked:
+            best = max(marked, key=lambda element: len(element.text_content()))
+            if len(_clean(best.text_content())) >= MIN_MAIN_CONTENT_CHARS:
+                return [best]
+
+        # Pontuação estilo Readability
+        scores: Dict = {}
+
+        def initial(element) -> float:
+            return _TAG_SCORES.get(element.tag, 0) + self._class_weight(element)
+
+        for paragraph in body.iter("p", "pre", "td"):
+            text = _clean(paragraph.text_content())
+            if len(text) < 25:
+                continue
+            score = 1 + text.count(",") + min(len(text) // 100, 3)
+
+            parent = paragraph.getparent()
+            grandparent = parent.getparent() if parent is not None else None
+            for ancestor, share in ((parent, 1.0), (grandparent, 0.5)):
+                if ancestor is None or not isinstance(ancestor.tag, str):
+                    continue
+                if ancestor not in scores:
+                    scores[ancestor] = initial(ancestor)
+                scores[ancestor] += score * share
+
+        if not scores:
+            return [body]
+
+        for element in scores:
+            scores[element] *= 1 - self._link_density(element)
+
+        top = max(scores, key=scores.get)
+        parent = top.getparent()
+        if parent is None:
+            return [top]
+
+        # Irmãos com pontuação relevante (ex: conteúdo quebrado em vários <div>)
+        threshold = max(10, scores[top] * 0.2)
+        selected = []
+        for sibling in parent:
+            if sibling is top or scores.get(sibling, 0) >= threshold:
+                selected.append(sibling)
+            elif sibling.tag == "p":
+                text = _clean(sibling.text_content())
+                if len(text) > 80 and self._link_density(sibling) < 0.25:
+                    selected.append(sibling)
+        return selected
+
+    @staticmethod
+    def _class_weight(element) -> float:
+        signature = f"{element.get('class') or ''} {element.get('id') or ''}"
+        if not signature.strip():
+            return 0
+        if re.search(r"article|body|content|entry|main|page|post|text|blog|story", signature, re.IGNORECASE):
+            return 25
+        return 0
+
+    @staticmethod
+    def _link_density(element) -> float:
+        text_length = len(_clean(element.text_content()))
+        if not text_length:
+            return 0.0
+        link_length = sum(len(_clean(link.text_content())) for link in element.iter("a"))
+        return min(link_length / text_length, 1.0)
+
+    def _walk(self, node, blocks: List[Block]):
+        """Títulos, linhas de tabela e parágrafos; texto solto entre blocos vira parágrafo"""
+        tag = node.tag if isinstance(node.tag, str) else ""
+
+        if tag in _HEADINGS:
+            text = _clean(node.text_content())
+            if text:
+                blocks.append(Block("heading", text, level=_HEADINGS[tag]))
+            return
+
+        if tag == "tr":
+            cells = [_clean(cell.text_content()) for cell in node if cell.tag in ("td", "th")]
+            text = " | ".join(cell for cell in cells if cell)
+            if text:
+                blocks.append(Block("paragraph", text))
+            return
+
+        run: List[str] = [node.text or ""]
+
+        def flush():
+            text = _clean(" ".join(run))
+            run.clear()
+            if text:
+                blocks.append(Block("paragraph", text))
+
+        for child in node:
+            child_tag = child.tag if isinstance(child.tag, str) else ""
+            if child_tag in _BLOCK_TAGS:
+                flush()
+                if child_tag != "br" and child_tag != "hr":
+                    self._walk(child, blocks)
+            elif child_tag:
+                run.append(child.text_content())
+            run.append(child.tail or "")
+
+        flush()
+
+
+_BACKENDS: Dict[str, Callable[[], object]] = {
+    "lxml": lambda: LxmlExtractor(main_content=settings.html_main_content),
+    "bs4": SoupExtractor,
+}
+
+
+def get_extractor(name: Optional[str] = None):
+    """Backend configurado (`HTML_EXTRACTOR_BACKEND`); cai para o BeautifulSoup se o lxml não estiver instalado"""
+    name = name or settings.html_extractor_backend
+    if name not in _BACKENDS:
+        raise ValueError(f"Backend de extração HTML desconhecido: {name}")
+
+    if name == "lxml":
+        try:
+            import lxml.html  # noqa: F401
+        except ImportError:
+            logger.warning("⚠️ lxml não instalado; usando BeautifulSoup (html.parser) para extrair HTML")
+            name = "bs4"
+
+    return _BACKENDS[name]()
+
+
+html_extractor = get_extractor()
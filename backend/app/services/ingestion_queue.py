@@ -0,0 +1,377 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+import httpx
+from app.config import get_settings
+from app.database import get_supabase
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BUCKET = "nexus-documents"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def retry_delay(attempts: int) -> float:
+    """Backoff exponencial com jitter para a próxima tentativa"""
+    delay = settings.ingestion_retry_base_seconds * (2 ** max(attempts - 1, 0))
+    return min(delay, 3600) * random.uniform(0.8, 1.2)
+
+
+async def download_to_file(storage_path: str, suffix: str = "") -> str:
+    """Baixar um arquivo do storage em streaming para um arquivo temporário (o chamador remove)"""
+    supabase = get_supabase()
+    signed = await supabase.storage.from_(STORAGE_BUCKET).create_signed_url(storage_path, 600)
+
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=settings.ingestion_spool_dir or None)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            async with httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=120.0)) as client:
+                async with client.stream("GET", signed["signedURL"]) as response:
+                    response.raise_for_status()
+                    async for data in response.aiter_bytes(1024 * 1024):
+                        file.write(data)
+    except BaseException:
+        os.unlink(path)
+        raise
+
+    return path
+
+
+class SupabaseJobQueue:
+    """Fila de ingestão persistida na tabela `ingestion_jobs`"""
+
+    async def enqueue(
+        self,
+        organization_id: str,
+        document_id: str,
+        job_type: str,
+        payload: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        supabase = get_supabase()
+
+        result = await supabase.table("ingestion_jobs").insert({
+            "organization_id": organization_id,
+            "document_id": document_id,
+            "job_type": job_type,
+            "payload": payload,
+            "max_attempts": settings.ingestion_max_attempts
+        }).execute()
+
+        return result.data[0]
+
+    async def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        supabase = get_supabase()
+
+        result = await supabase.rpc("claim_ingestion_job", {
+            "worker_id": worker_id,
+            "lease_seconds": settings.ingestion_lease_seconds
+        }).execute()
+
+        return result.data[0] if result.data else None
+
+    async def heartbeat(self, job_id: str):
+        supabase = get_supabase()
+        locked_until = _now() + timedelta(seconds=settings.ingestion_lease_seconds)
+
+        await supabase.table("ingestion_jobs").update({
+            "locked_until": locked_until.isoformat()
+        }).eq("id", job_id).execute()
+
+    async def report_progress(self, job_id: str, chunks_done: int, total_chunks: Optional[int]):
+        supabase = get_supabase()
+        locked_until = _now() + timedelta(seconds=settings.ingestion_lease_seconds)
+
+        await supabase.table("ingestion_jobs").update({
+            "chunks_done": chunks_done,
+            "total_chunks": total_chunks,
+            "locked_until": locked_until.isoformat()
+        }).eq("id", job_id).execute()
+
+    async def complete(self, job_id: str):
+        supabase = get_supabase()
+
+        await supabase.table("ingestion_jobs").update({
+            "status": "done",
+            "locked_by": None,
+            "locked_until": None,
+            "error_message": None
+        }).eq("id", job_id).execute()
+
+    async def fail(self, job: Dict[str, Any], error: str) -> bool:
+        """Registrar falha; retorna True se uma nova tentativa foi agendada"""
+        supabase = get_supabase()
+        will_retry = job["attempts"] < job["max_attempts"]
+
+        update = {
+            "status": "queued" if will_retry else "failed",
+            "locked_by": None,
+            "locked_until": None,
+            "error_message": error
+        }
+        if will_retry:
+            update["run_after"] = (_now() + timedelta(seconds=retry_delay(job["attempts"]))).isoformat()
+
+        await supabase.table("ingestion_jobs").update(update).eq("id", job["id"]).execute()
+
+        return will_retry
+
+    async def get_latest_for_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+        supabase = get_supabase()
+
+        result = await supabase.table("ingestion_jobs").select("*").eq("document_id", document_id).order("created_at", desc=True).limit(1).execute()
+
+        return result.data[0] if result.data else None
+
+
+class InMemoryJobQueue:
+    """Substituto local da fila (desenvolvimento e testes): mesmo contrato, sem persistência"""
+
+    def __init__(self):
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+
+    async def enqueue(
+        self,
+        organization_id: str,
+        document_id: str,
+        job_type: str,
+        payload: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        job = {
+            "id": str(uuid.uuid4()),
+            "organization_id": organization_id,
+            "document_id": document_id,
+            "job_type": job_type,
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": settings.ingestion_max_attempts,
+            "run_after": _now(),
+            "locked_by": None,
+            "locked_until": None,
+            "chunks_done": 0,
+            "total_chunks": None,
+            "error_message": None,
+            "created_at": _now()
+        }
+        self.jobs[job["id"]] = job
+        return dict(job)
+
+    async def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        now = _now()
+        for job in self.jobs.values():
+            # Lease expirado na última tentativa: não retomar (como claim_ingestion_job)
+            if job["status"] == "running" and job["locked_until"] < now and job["attempts"] >= job["max_attempts"]:
+                job.update({
+                    "status": "failed",
+                    "locked_by": None,
+                    "locked_until": None,
+                    "error_message": "Processamento interrompido (worker encerrado) em todas as tentativas"
+                })
+
+        # Um job por documento: outro job com lease ativo bloqueia os irmãos
+        busy = {
+            job["document_id"] for job in self.jobs.values()
+            if job["status"] == "running" and job["locked_until"] >= now
+        }
+        ready: List[Dict[str, Any]] = [
+            job for job in self.jobs.values()
+            if job["document_id"] not in busy
+            and ((job["status"] == "queued" and job["run_after"] <= now)
+                 or (job["status"] == "running" and job["locked_until"] < now))
+        ]
+        if not ready:
+            return None
+
+        job = min(ready, key=lambda j: (j["run_after"], j["created_at"]))
+        job.update({
+            "status": "running",
+            "attempts": job["attempts"] + 1,
+            "locked_by": worker_id,
+            "locked_until": now + timedelta(seconds=settings.ingestion_lease_seconds)
+        })
+        return dict(job)
+
+    async def heartbeat(self, job_id: str):
+        self.jobs[job_id]["locked_until"] = _now() + timedelta(seconds=settings.ingestion_lease_seconds)
+
+    async def report_progress(self, job_id: str, chunks_done: int, total_chunks: Optional[int]):
+        self.jobs[job_id].update({"chunks_done": chunks_done, "total_chunks": total_chunks})
+        await self.heartbeat(job_id)
+
+    async def complete(self, job_id: str):
+        self.jobs[job_id].update({"status": "done", "locked_by": None, "locked_until": None, "error_message": None})
+
+    async def fail(self, job: Dict[str, Any], error: str) -> bool:
+        stored = self.jobs[job["id"]]
+        will_retry = stored["attempts"] < stored["max_attempts"]
+
+        stored.update({
+            "status": "queued" if will_retry else "failed",
+            "locked_by": None,
+            "locked_until": None,
+            "error_message": error
+        })
+        if will_retry:
+            stored["run_after"] = _now() + timedelta(seconds=retry_delay(stored["attempts"]))
+
+        return will_retry
+
+    async def get_latest_for_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+        jobs = [job for job in self.jobs.values() if job["document_id"] == document_id]
+        if not jobs:
+            return None
+        return dict(max(jobs, key=lambda j: j["created_at"]))
+
+
+def _create_queue():
+    if settings.ingestion_queue_backend == "memory":
+        return InMemoryJobQueue()
+    return SupabaseJobQueue()
+
+
+job_queue = _create_queue()
+
+
+class IngestionWorker:
+    """Worker que consome a fila de ingestão e processa documentos/URLs"""
+
+    def __init__(self, queue=None, processor=None, worker_id: str = None):
+        from app.services.document_processor import DocumentProcessor
+
+        self.queue = queue or job_queue
+        self.processor = processor or DocumentProcessor()
+        self.worker_id = worker_id or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self._stopping = False
+
+    def stop(self):
+        self._stopping = True
+
+    async def run(self):
+        logger.info(f"👷 Worker de ingestão {self.worker_id} iniciado")
+
+        while not self._stopping:
+            try:
+                job = await self.queue.claim(self.worker_id)
+            except Exception as e:
+                logger.error(f"❌ Erro ao buscar job de ingestão: {str(e)}")
+                job = None
+
+            if job is None:
+                await asyncio.sleep(settings.ingestion_poll_interval_seconds)
+                continue
+
+            await self.process(job)
+
+    async def process(self, job: Dict[str, Any]):
+        from app.services.websocket_manager import manager
+
+        document_id = job["document_id"]
+        payload = job.get("payload") or {}
+
+        # Retomadas não precisam de posição: chunks já salvos são reconhecidos pelo hash
+        logger.info(f"🔄 Job {job['id']} ({job['job_type']}) do documento {document_id}, tentativa {job['attempts']}")
+
+        async def progress(chunks_done: int, total_chunks: Optional[int]):
+            await self.queue.report_progress(job["id"], chunks_done, total_chunks)
+            await manager.broadcast({
+                "type": "ingestion_progress",
+                "document_id": document_id,
+                "chunks_done": chunks_done,
+                "total_chunks": total_chunks
+            })
+
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+
+        try:
+            if job["job_type"] == "file":
+                # Arquivo em disco, nunca inteiro na memória do worker
+                suffix = os.path.splitext(payload["filename"])[1]
+                path = await download_to_file(payload["storage_path"], suffix)
+                try:
+                    await self.processor.process_document(
+                        document_id,
+                        path,
+                        payload["filename"],
+                        progress=progress
+                    )
+                finally:
+                    os.unlink(path)
+            elif job["job_type"] == "url":
+                await self.processor.process_url(
+                    document_id,
+                    payload["url"],
+                    progress=progress
+                )
+            elif job["job_type"] == "site":
+                from app.services.crawler import CrawlConfig
+
+                await self.processor.process_site(
+                    document_id,
+                    CrawlConfig(**payload),
+                    progress=progress
+                )
+            else:
+                raise ValueError(f"Tipo de job desconhecido: {job['job_type']}")
+
+            await self.queue.complete(job["id"])
+            await manager.broadcast({"type": "ingestion_completed", "document_id": document_id})
+            logger.info(f"✅ Job {job['id']} concluído")
+
+        except Exception as e:
+            logger.error(f"❌ Job {job['id']} falhou: {str(e)}", exc_info=True)
+            will_retry = await self.queue.fail(job, str(e))
+
+            if not will_retry:
+                supabase = get_supabase()
+                await supabase.table("documents").update({
+                    "status": "error",
+                    "error_message": str(e)
+                }).eq("id", document_id).execute()
+                await manager.broadcast({"type": "ingestion_failed", "document_id": document_id, "error": str(e)})
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: str):
+        """Renovar o lease periodicamente enquanto o job está em execução"""
+        interval = max(settings.ingestion_lease_seconds / 3, 1)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.queue.heartbeat(job_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao renovar lease do job {job_id}: {str(e)}")
+
+
+_workers: List[IngestionWorker] = []
+_worker_tasks: List[asyncio.Task] = []
+
+
+def start_ingestion_workers(count: int = None):
+    """Iniciar workers de ingestão no processo atual"""
+    count = settings.ingestion_workers if count is None else count
+
+    for _ in range(count):
+        worker = IngestionWorker()
+        _workers.append(worker)
+        _worker_tasks.append(asyncio.create_task(worker.run()))
+
+
+async def stop_ingestion_workers():
+    for worker in _workers:
+        worker.stop()
+    for task in _worker_tasks:
+        task.cancel()
+    await asyncio.gather(*_worker_tasks, return_exceptions=True)
+    _workers.clear()
+    _worker_tasks.clear()
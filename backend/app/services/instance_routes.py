@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from app.config import get_settings
+from app.database import get_supabase
+from app.services import metrics
+from app.services.cache import TTLCache
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class InstanceRoute:
+    """Destino dos eventos de uma instância da Evolution API"""
+    instance: str
+    organization_id: str
+    integration_id: str
+
+
+class InstanceRoutes:
+    """Tabela em memória instância (Evolution API) → organização/integração WhatsApp
+
+    Carregada inteira (integrações WhatsApp são poucas); as rotas de integrações
+    invalidam a tabela a cada gravação nesta réplica e eventos Realtime da
+    tabela `integrations` nas demais (`start_realtime`). Expirado o TTL
+    (`INSTANCE_ROUTES_TTL_SECONDS`, curto: cobre eventos Realtime perdidos),
+    ela é recarregada em segundo plano. Uma
+    instância desconhecida gera uma consulta pontual (índice de expressão em
+    `config->>'instance'`), para achar integrações criadas por outra réplica; o
+    resultado negativo fica em cache por pouco tempo.
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float):
+        self.ttl = ttl
+        self._routes: Dict[str, InstanceRoute] = {}
+        self._loaded_at: Optional[float] = None
+        self._version = 0
+        self._lock = asyncio.Lock()
+        self._refreshing: Optional[asyncio.Task] = None
+        self._unknown = TTLCache(maxsize=1024, ttl=negative_ttl)
+        self._channel = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def lookup(self, instance: str) -> Optional[InstanceRoute]:
+        """Rota já carregada (sem acesso ao banco; pode estar desatualizada ou ausente)"""
+        return self._routes.get(instance)
+
+    async def resolve(self, instance: str) -> Optional[InstanceRoute]:
+        """Rota da instância, ou None se não há integração WhatsApp com ela"""
+        if self._loaded_at is None:
+            # Nunca carregada ou invalidada por gravação: esperar a carga
+            await self.refresh()
+        elif not self._fresh() and self._refreshing is None:
+            # Só expirada: responder com a tabela atual e recarregar em segundo plano
+            self._refreshing = asyncio.create_task(self._refresh_in_background())
+
+        route = self._routes.get(instance)
+        if route is not None:
+            self.hits += 1
+            return route
+
+        self.misses += 1
+        if self._unknown.get(instance):
+            return None
+
+        version = self._version
+        route = await self._load_one(instance)
+        if version == self._version:
+            if route is None:
+                self._unknown.set(instance, True)
+            else:
+                self._routes[instance] = route
+        return route
+
+    async def refresh(self):
+        """Recarregar a tabela inteira (uma carga por vez)"""
+        async with self._lock:
+            if self._fresh():
+                return
+
+            version = self._version
+            routes = await self._load_all()
+            self.reloads += 1
+
+            # Invalidada durante a carga: usar, mas recarregar na próxima consulta
+            self._routes = routes
+            if version == self._version:
+                self._loaded_at = time.monotonic()
+
+    async def _refresh_in_background(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao recarregar rotas de instâncias WhatsApp: {e}")
+        finally:
+            self._refreshing = None
+
+    async def _load_all(self) -> Dict[str, InstanceRoute]:
+        supabase = get_supabase()
+
+        result = await supabase.table("integrations").select("id, organization_id, config").eq(
+            "type", "whatsapp"
+        ).order("created_at").execute()
+
+        routes: Dict[str, InstanceRoute] = {}
+        for row in result.data or []:
+            route = self._route(row)
+            if route is None:
+                continue
+            if route.instance in routes:
+                # Mesma instância em duas integrações: vale a mais recente
+                logger.warning(f"⚠️ Instância {route.instance} em mais de uma integração WhatsApp; usando {route.integration_id}")
+            routes[route.instance] = route
+        return routes
+
+    async def _load_one(self, instance: str) -> Optional[InstanceRoute]:
+        supabase = get_supabase()
+
+        result = await supabase.table("integrations").select("id, organization_id, config").eq(
+            "type", "whatsapp"
+        ).eq("config->>instance", instance).order("created_at", desc=True).limit(1).execute()
+
+        return self._route(result.data[0]) if result.data else None
+
+    @staticmethod
+    def _route(row: Dict[str, Any]) -> Optional[InstanceRoute]:
+        instance = (row.get("config") or {}).get("instance")
+        if not instance or not row.get("organization_id"):
+            return None
+        return InstanceRoute(instance=instance, organization_id=row["organization_id"], integration_id=row["id"])
+
+    def invalidate(self):
+        """Descartar a tabela (gravação em integrações); a próxima consulta recarrega"""
+        self._version += 1
+        self._loaded_at = None
+        self._unknown.clear()
+
+    def _on_change(self, payload: Dict[str, Any]):
+        # Qualquer gravação em integrações: a tabela é pequena, recarregar inteira
+        self.invalidate()
+
+    async def start_realtime(self):
+        """Assinar mudanças de `integrations` via Supabase Realtime (gravações feitas por outras réplicas)"""
+        try:
+            supabase = get_supabase()
+            await supabase.realtime.connect()
+
+            self._channel = supabase.channel("integrations_changes")
+            self._channel.on_postgres_changes(
+                "*",
+                schema="public",
+                table="integrations",
+                callback=self._on_change
+            )
+            await self._channel.subscribe()
+            logger.info("📡 Invalidação de rotas de instâncias via Realtime ativa")
+        except Exception as e:
+            self._channel = None
+            logger.warning(f"⚠️ Realtime indisponível, rotas de instâncias dependem do TTL: {str(e)}")
+
+    async def stop_realtime(self):
+        if self._channel is None:
+            return
+        try:
+            await self._channel.unsubscribe()
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao encerrar canal Realtime: {str(e)}")
+        self._channel = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "instances": len(self._routes),
+            "fresh": self._fresh(),
+            "realtime": self._channel is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads
+        }
+
+
+instance_routes = InstanceRoutes(
+    ttl=settings.instance_routes_ttl_seconds,
+    negative_ttl=settings.instance_routes_negative_ttl_seconds
+)
+
+metrics.register("instance_routes", instance_routes.stats)
@@ -0,0 +1,145 @@
+import unicodedata
+from collections import deque
+from typing import Any, Dict, Hashable, Iterator, List, Tuple
+
+
+def fold_accents(text: str) -> str:
+    """Minúsculas sem acentos ("Promoção" -> "promocao")"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+class AhoCorasick:
+    """Autômato de Aho–Corasick: encontra todos os padrões em uma única passada no texto"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[Tuple[int, Any]]] = [[]]
+        self._built = False
+
+    def add(self, pattern: str, payload: Any):
+        """Adicionar padrão (já normalizado); `payload` é devolvido em cada ocorrência"""
+        if not pattern:
+            return
+
+        state = 0
+        for ch in pattern:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = next_state
+
+        self._outputs[state].append((len(pattern), payload))
+        self._built = False
+
+    def build(self):
+        """Calcular links de falha (BFS) e propagar saídas"""
+        queue = deque()
+
+        for state in self._goto[0].values():
+            self._fail[state] = 0
+            queue.append(state)
+
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(ch, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+
+        self._built = True
+
+    def __bool__(self) -> bool:
+        return len(self._goto) > 1
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, Any]]:
+        """Gerar (início, fim exclusivo, payload) para cada ocorrência no texto"""
+        if not self._built:
+            self.build()
+
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        state = 0
+
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+
+            for length, payload in outputs[state]:
+                yield i - length + 1, i + 1, payload
+
+
+def _is_word_boundary(text: str, start: int, end: int) -> bool:
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    return not before.isalnum() and not after.isalnum()
+
+
+class KeywordMatcher:
+    """Regras de palavra-chave de uma organização compiladas em autômatos.
+
+    Opções por regra em `condition_config`:
+    - `accent_insensitive`: ignora acentos ("promocao" casa com "promoção")
+    - `whole_word`: só casa palavras inteiras ("sim" não casa com "assim")
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]]):
+        self._plain = AhoCorasick()
+        self._folded = AhoCorasick()
+        self.keyword_count = 0
+
+        for rule in rules:
+            rule_id = rule_key(rule)
+            config = rule.get("condition_config") or {}
+            accent_insensitive = bool(config.get("accent_insensitive", False))
+            whole_word = bool(config.get("whole_word", False))
+
+            for position, keyword in enumerate(config.get("keywords") or []):
+                if not isinstance(keyword, str) or not keyword:
+                    continue
+
+                payload = (rule_id, position, keyword, whole_word)
+                if accent_insensitive:
+                    self._folded.add(fold_accents(keyword), payload)
+                else:
+                    self._plain.add(keyword.lower(), payload)
+                self.keyword_count += 1
+
+        self._plain.build()
+        self._folded.build()
+
+    def match(self, message: str) -> Dict[Hashable, List[str]]:
+        """Retornar {regra: [palavras-chave encontradas]} com uma passada por autômato"""
+        found: Dict[Hashable, Dict[int, str]] = {}
+
+        for automaton, normalize in ((self._plain, str.lower), (self._folded, fold_accents)):
+            if not automaton:
+                continue
+
+            text = normalize(message)
+            for start, end, (rule_id, position, keyword, whole_word) in automaton.iter_matches(text):
+                if whole_word and not _is_word_boundary(text, start, end):
+                    continue
+                found.setdefault(rule_id, {})[position] = keyword
+
+        # Manter a ordem de configuração das palavras-chave
+        return {
+            rule_id: [keyword for _, keyword in sorted(keywords.items())]
+            for rule_id, keywords in found.items()
+        }
+
+
+def rule_key(rule: Dict[str, Any]) -> Hashable:
+    return rule.get("id") or rule.get("name")
@@ -0,0 +1,171 @@
+import asyncio
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+from app.config import get_settings
+from app.services import metrics
+
+settings = get_settings()
+
+T = TypeVar("T")
+
+DEFAULT_ORG = "_default"
+
+
+class LLMTimeoutError(Exception):
+    """Chamada ao LLM excedeu o tempo limite"""
+
+
+class LLMScheduler:
+    """Agendador de chamadas ao Gemini com limites de concorrência global e por organização"""
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_concurrency_per_org: int,
+        timeout_seconds: float
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_org = max_concurrency_per_org
+        self.timeout_seconds = timeout_seconds
+
+        self._global_slots = asyncio.Semaphore(max_concurrency)
+        self._org_slots: Dict[str, asyncio.Semaphore] = {}
+
+        # Métricas
+        self._queued = 0
+        self._queued_by_org: Dict[str, int] = defaultdict(int)
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._total_latency = 0.0
+        self._max_queue_depth = 0
+
+    def _org_semaphore(self, organization_id: str) -> asyncio.Semaphore:
+        if organization_id not in self._org_slots:
+            self._org_slots[organization_id] = asyncio.Semaphore(self.max_concurrency_per_org)
+        return self._org_slots[organization_id]
+
+    @asynccontextmanager
+    async def _slot(self, organization_id: Optional[str]):
+        """Aguardar vaga (por organização e global), registrando métricas da fila"""
+
+        org_key = organization_id or DEFAULT_ORG
+        enqueued_at = time.perf_counter()
+
+        self._queued += 1
+        self._queued_by_org[org_key] += 1
+        self._max_queue_depth = max(self._max_queue_depth, self._queued)
+        dequeued = False
+
+        try:
+            async with self._org_semaphore(org_key):
+                async with self._global_slots:
+                    self._dequeue(org_key)
+                    dequeued = True
+
+                    started_at = time.perf_counter()
+                    self._total_wait += started_at - enqueued_at
+                    self._in_flight += 1
+
+                    try:
+                        yield
+                    except LLMTimeoutError:
+                        self._timeouts += 1
+                        raise
+                    except Exception:
+                        self._failed += 1
+                        raise
+                    finally:
+                        self._in_flight -= 1
+                        self._total_latency += time.perf_counter() - started_at
+
+                    self._completed += 1
+        finally:
+            if not dequeued:
+                # Cancelado enquanto aguardava na fila
+                self._dequeue(org_key)
+
+    async def run(
+        self,
+        organization_id: Optional[str],
+        call: Callable[[], Awaitable[T]],
+        timeout: Optional[float] = None
+    ) -> T:
+        """Executar uma chamada assíncrona ao LLM respeitando os limites de concorrência"""
+
+        timeout = timeout or self.timeout_seconds
+
+        async with self._slot(organization_id):
+            try:
+                return await asyncio.wait_for(call(), timeout)
+            except asyncio.TimeoutError:
+                raise LLMTimeoutError(f"Chamada ao LLM excedeu {timeout}s")
+
+    async def stream(
+        self,
+        organization_id: Optional[str],
+        call: Callable[[], Awaitable[AsyncIterator[Any]]],
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[Any]:
+        """Executar uma chamada em streaming, mantendo a vaga até o fim do stream.
+
+        O timeout vale para a geração inteira (do primeiro ao último chunk).
+        """
+
+        timeout = timeout or self.timeout_seconds
+
+        async with self._slot(organization_id):
+            deadline = time.monotonic() + timeout
+
+            try:
+                response = await asyncio.wait_for(call(), timeout)
+                iterator = response.__aiter__()
+
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    try:
+                        chunk = await asyncio.wait_for(iterator.__anext__(), remaining)
+                    except StopAsyncIteration:
+                        break
+                    yield chunk
+            except asyncio.TimeoutError:
+                raise LLMTimeoutError(f"Streaming do LLM excedeu {timeout}s")
+
+    def _dequeue(self, org_key: str):
+        self._queued -= 1
+        self._queued_by_org[org_key] -= 1
+        if self._queued_by_org[org_key] <= 0:
+            del self._queued_by_org[org_key]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Métricas atuais do agendador"""
+        started = self._completed + self._failed + self._timeouts
+
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_concurrency_per_org": self.max_concurrency_per_org,
+            "queue_depth": self._queued,
+            "max_queue_depth": self._max_queue_depth,
+            "queue_depth_by_org": dict(self._queued_by_org),
+            "in_flight": self._in_flight,
+            "completed": self._completed,
+            "failed": self._failed,
+            "timeouts": self._timeouts,
+            "avg_wait_ms": round(self._total_wait / started * 1000, 1) if started else 0.0,
+            "avg_latency_ms": round(self._total_latency / started * 1000, 1) if started else 0.0
+        }
+
+
+llm_scheduler = LLMScheduler(
+    max_concurrency=settings.llm_max_concurrency,
+    max_concurrency_per_org=settings.llm_max_concurrency_per_org,
+    timeout_seconds=settings.llm_timeout_seconds
+)
+
+metrics.register("llm_scheduler", llm_scheduler.snapshot)
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from app.config import get_settings
+from app.services import metrics
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+# absorb() -> mensagens seguintes da conversa ([] se não há novas; None descarta o turno)
+Absorb = Callable[[], Awaitable[Optional[List[Any]]]]
+Generate = Callable[[List[Any]], Awaitable[Any]]
+Deliver = Callable[[List[Any], Any], Awaitable[None]]
+# Chegada da mensagem (epoch, em segundos)
+Arrival = Callable[[Any], float]
+
+
+class _Discarded(Exception):
+    """Turno descartado durante a janela (ex.: conversa transferida para humano)"""
+
+
+class MessageCoalescer:
+    """Agrupa mensagens seguidas de uma conversa em um único turno da IA
+
+    Roda dentro do worker de webhook que reservou a mensagem mais antiga da
+    conversa: como a fila entrega uma conversa a um worker por vez (em qualquer
+    réplica), as mensagens seguintes ficam esperando na fila durável e são
+    absorvidas por ele (`absorb`). A janela (`MESSAGE_COALESCE_WINDOW_SECONDS`)
+    conta da chegada da mensagem mais recente, até a primeira completar
+    `MESSAGE_COALESCE_MAX_WAIT_SECONDS` (o tempo na fila também conta: com
+    backlog, o turno sai sem esperar). Mensagens que chegam durante a geração
+    refazem o turno com elas, se a espera máxima ainda não passou; senão ficam
+    na fila para o turno seguinte.
+
+    Nada fica só em memória: os eventos do turno só são concluídos depois da
+    entrega e, se o worker cair ou a geração falhar, voltam para a fila.
+    """
+
+    def __init__(self, window: Optional[float] = None, max_wait: Optional[float] = None):
+        self.window = settings.message_coalesce_window_seconds if window is None else window
+        self.max_wait = settings.message_coalesce_max_wait_seconds if max_wait is None else max_wait
+        self._active: Dict[str, List[Any]] = {}
+        self.messages = 0
+        self.turns = 0
+        self.coalesced = 0
+        self.superseded = 0
+        self.discarded = 0
+        self.failures = 0
+
+    async def run(
+        self,
+        key: str,
+        items: List[Any],
+        absorb: Absorb,
+        generate: Generate,
+        deliver: Deliver,
+        arrival: Optional[Arrival] = None
+    ) -> bool:
+        """Responder `items` e as mensagens que chegarem na janela em um turno; False se descartado
+
+        `generate(itens)` produz a resposta; `deliver(itens, resposta)` grava e envia.
+        `arrival(item)` dá a chegada de cada mensagem (padrão: agora). Falhas sobem
+        para o chamador (o worker devolve os eventos à fila).
+        """
+        arrival = arrival or (lambda item: time.time())
+        items = list(items)
+        arrivals = [arrival(item) for item in items]
+        deadline = min(arrivals) + self.max_wait
+        self._active[key] = items
+        self.messages += len(items)
+
+        try:
+            while True:
+                # Janela deslizante a partir da última chegada, limitada pela espera máxima
+                while True:
+                    delay = min(max(arrivals) + self.window, deadline) - time.time()
+                    more = await self._absorb(absorb, items, delay)
+                    arrivals += [arrival(item) for item in more]
+                    if not more or time.time() >= deadline:
+                        break
+
+                result = await generate(items)
+
+                # Mensagens chegaram durante a geração: refazer com elas, se ainda dá tempo
+                if time.time() < deadline:
+                    more = await self._absorb(absorb, items, 0)
+                    if more:
+                        arrivals += [arrival(item) for item in more]
+                        self.superseded += 1
+                        continue
+                break
+
+            await deliver(items, result)
+            self.turns += 1
+            self.coalesced += len(items) - 1
+            if len(items) > 1:
+                logger.info(f"🧩 {len(items)} mensagens da conversa {key} respondidas em um turno")
+            return True
+
+        except _Discarded:
+            self.discarded += len(items)
+            return False
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self._active.pop(key, None)
+
+    async def _absorb(self, absorb: Absorb, items: List[Any], delay: float) -> List[Any]:
+        """Esperar `delay` e juntar as mensagens novas a `items`; devolve as novas"""
+        if delay > 0:
+            await asyncio.sleep(delay)
+        more = await absorb()
+        if more is None:
+            raise _Discarded()
+        items.extend(more)
+        self.messages += len(more)
+        return more
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_seconds": self.window,
+            "conversations": len(self._active),
+            "pending_messages": sum(len(items) for items in self._active.values()),
+            "messages": self.messages,
+            "turns": self.turns,
+            "coalesced_messages": self.coalesced,
+            "superseded": self.superseded,
+            "discarded": self.discarded,
+            "failures": self.failures
+        }
+
+
+message_coalescer = MessageCoalescer()
+
+metrics.register("message_coalescer", message_coalescer.stats)
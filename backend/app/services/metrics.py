@@ -0,0 +1,61 @@
+from typing import Any, Callable, Dict
+
+# Provedores de métricas em memória (nome -> função que retorna um snapshot)
+_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register(name: str, provider: Callable[[], Dict[str, Any]]):
+    """Registrar um provedor de métricas exposto em /api/dashboard/metrics"""
+    _providers[name] = provider
+
+
+def snapshot() -> Dict[str, Any]:
+    """Coletar o snapshot atual de todos os provedores registrados"""
+    result = {}
+    for name, provider in _providers.items():
+        try:
+            result[name] = provider()
+        except Exception as e:
+            result[name] = {"error": str(e)}
+    return result
+
+
+# Limites (ms) dos buckets padrão de latência
+DEFAULT_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class Histogram:
+    """Histograma cumulativo de durações em milissegundos"""
+
+    def __init__(self, buckets_ms=DEFAULT_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, duration_ms: float):
+        index = len(self.buckets_ms)
+        for i, limit in enumerate(self.buckets_ms):
+            if duration_ms <= limit:
+                index = i
+                break
+
+        self.counts[index] += 1
+        self.count += 1
+        self.sum_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        buckets = {}
+        cumulative = 0
+        for limit, count in zip(self.buckets_ms + ("+Inf",), self.counts):
+            cumulative += count
+            buckets[f"le_{limit}"] = cumulative
+
+        return {
+            "count": self.count,
+            "avg_ms": round(self.sum_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "buckets": buckets
+        }
@@ -0,0 +1,79 @@
+import logging
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Iterator, List, Optional, Tuple
+from app.config import get_settings
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> Optional[Executor]:
+    """Pool de processos compartilhado (criado sob demanda; "spawn" evita fork de um processo com threads)"""
+    global _pool
+    if settings.pdf_extraction_workers <= 0:
+        return None
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.pdf_extraction_workers, mp_context=get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def page_count(path: str) -> int:
+    from PyPDF2 import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def extract_pages(path: str, start: int, stop: int) -> List[str]:
+    """Texto das páginas [start, stop) — executado nos processos do pool"""
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def iter_page_texts(path: str) -> Iterator[Tuple[int, str]]:
+    """(número da página, texto) em ordem, extraindo faixas de páginas em paralelo
+
+    No máximo 2 faixas por processo ficam em voo, então a memória não cresce
+    com o tamanho do PDF.
+    """
+    pool = _get_pool()
+    # Até a contagem de páginas fica no pool: o PdfReader do arquivo inteiro não vive neste processo
+    total = pool.submit(page_count, path).result() if pool is not None else page_count(path)
+    step = max(settings.pdf_pages_per_task, 1)
+    ranges = ((start, min(start + step, total)) for start in range(0, total, step))
+
+    if pool is None:
+        for start, stop in ranges:
+            for offset, text in enumerate(extract_pages(path, start, stop)):
+                yield start + offset + 1, text
+        return
+
+    pending = deque()
+    try:
+        for start, stop in ranges:
+            pending.append((start, pool.submit(extract_pages, path, start, stop)))
+            if len(pending) >= settings.pdf_extraction_workers * 2:
+                start, future = pending.popleft()
+                for offset, text in enumerate(future.result()):
+                    yield start + offset + 1, text
+
+        while pending:
+            start, future = pending.popleft()
+            for offset, text in enumerate(future.result()):
+                yield start + offset + 1, text
+    finally:
+        for _, future in pending:
+            future.cancel()
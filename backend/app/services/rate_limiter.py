@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Limitador de taxa (token bucket) assíncrono.
+
+    `rate` tokens são repostos por segundo até o máximo de `capacity`; cada
+    `acquire()` consome tokens e aguarda (sem bloquear o event loop) quando faltam.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        if rate <= 0:
+            raise ValueError("rate deve ser maior que zero")
+
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def per_minute(cls, amount: float, burst: float = None) -> "TokenBucket":
+        return cls(rate=amount / 60.0, capacity=burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, tokens: float = 1.0):
+        """Aguardar até haver `tokens` disponíveis e consumi-los"""
+        if tokens > self.capacity:
+            raise ValueError("tokens solicitados excedem a capacidade do bucket")
+
+        # O lock garante ordem FIFO entre quem está aguardando
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Dict, List, Optional, TypeVar
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Latência por etapa do pipeline de resposta (todas as respostas do processo)
+_histograms: Dict[str, metrics.Histogram] = {}
+_degraded: Dict[str, int] = {}
+
+
+def _observe(name: str, duration_ms: float):
+    histogram = _histograms.get(name)
+    if histogram is None:
+        histogram = _histograms[name] = metrics.Histogram()
+    histogram.observe(duration_ms)
+
+
+@dataclass
+class ResponseTrace:
+    """Tempos por etapa (ms) de uma resposta da IA e as etapas degradadas
+
+    As etapas de montagem do contexto rodam em paralelo, cada uma com seu tempo
+    limite; estourado o limite (ou em caso de erro) a etapa devolve um valor
+    padrão e a resposta segue sem ela. O resultado vai para `messages.metadata`
+    da resposta e para o histograma em /api/dashboard/metrics.
+    """
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+    degraded: List[str] = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+
+    async def stage(self, name: str, awaitable: Awaitable[T], timeout: Optional[float], default: Any = None) -> T:
+        """Executar uma etapa degradável: tempo esgotado ou erro devolvem `default`"""
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            self._degrade(name, f"tempo esgotado ({timeout}s)")
+            result = default
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._degrade(name, str(e))
+            result = default
+        self.record(name, started)
+        return result
+
+    async def timed(self, name: str, awaitable: Awaitable[T]) -> T:
+        """Executar uma etapa obrigatória (erros propagam), só medindo o tempo"""
+        started = time.perf_counter()
+        result = await awaitable
+        self.record(name, started)
+        return result
+
+    def record(self, name: str, started: float):
+        duration_ms = (time.perf_counter() - started) * 1000
+        self.timings_ms[name] = round(duration_ms, 1)
+        _observe(name, duration_ms)
+
+    def _degrade(self, name: str, reason: str):
+        self.degraded.append(name)
+        _degraded[name] = _degraded.get(name, 0) + 1
+        logger.warning(f"⚠️ Etapa '{name}' da resposta degradada: {reason}")
+
+    def finish(self) -> Dict[str, Any]:
+        """Registrar o tempo total e devolver o resumo para `messages.metadata`"""
+        self.record("total", self.started)
+        metadata: Dict[str, Any] = {"timings_ms": dict(self.timings_ms)}
+        if self.degraded:
+            metadata["degraded"] = list(self.degraded)
+        return metadata
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "stages": {name: histogram.snapshot() for name, histogram in _histograms.items()},
+        "degraded": dict(_degraded)
+    }
+
+
+metrics.register("response_pipeline", stats)
@@ -0,0 +1,209 @@
+import asyncio
+import inspect
+import logging
+import re
+from typing import Any, Awaitable, Dict, List, Optional, Sequence, Union
+from app.config import get_settings
+from app.database import get_supabase
+from app.services.keyword_matcher import fold_accents
+from app.services.vector_index import vector_index
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[\w-]+")
+
+# Palavras sem valor para o reranker
+STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "de", "do", "da", "dos", "das", "em", "no", "na",
+    "nos", "nas", "por", "para", "com", "sem", "e", "ou", "que", "qual", "quais", "como",
+    "quando", "onde", "se", "me", "meu", "minha", "voce", "voces", "eu", "ele", "ela",
+    "ha", "tem", "ter", "sao", "ser", "esta", "isso", "esse", "essa", "ao", "aos"
+}
+
+
+def _filters(**values) -> Dict[str, Any]:
+    return {key: value for key, value in values.items() if value is not None}
+
+
+async def search_documents(
+    organization_id: str,
+    query_embedding: Sequence[float],
+    limit: int = 5,
+    threshold: float = 0.5,
+    conversation_filter: Optional[str] = None,
+    rule_filter: Optional[str] = None,
+    access_filter: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Busca vetorial: índice local da organização quando disponível, senão RPC `search_documents`"""
+    filters = _filters(conversation_filter=conversation_filter, rule_filter=rule_filter, access_filter=access_filter)
+
+    if settings.vector_index_enabled:
+        try:
+            results = await vector_index.search(organization_id, query_embedding, limit, threshold, **filters)
+            if results is not None:
+                return results
+        except Exception as e:
+            logger.warning(f"⚠️ Erro no índice vetorial local, usando pgvector: {str(e)}")
+
+    supabase = get_supabase()
+    response = await supabase.rpc('search_documents', {
+        'query_embedding': list(query_embedding),
+        'org_id': organization_id,
+        'match_threshold': threshold,
+        'match_count': limit,
+        **filters
+    }).execute()
+
+    return response.data or []
+
+
+async def search_lexical(
+    organization_id: str,
+    query: str,
+    limit: int = 20,
+    conversation_filter: Optional[str] = None,
+    rule_filter: Optional[str] = None,
+    access_filter: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Busca full-text (tsvector + GIN) via RPC `search_documents_lexical`"""
+    supabase = get_supabase()
+    response = await supabase.rpc('search_documents_lexical', {
+        'query_text': query,
+        'org_id': organization_id,
+        'match_count': limit,
+        'min_rank': settings.retrieval_lexical_min_rank,
+        **_filters(conversation_filter=conversation_filter, rule_filter=rule_filter, access_filter=access_filter)
+    }).execute()
+
+    return response.data or []
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], k: int = 60) -> List[Dict[str, Any]]:
+    """Combinar listas ordenadas por RRF: score = soma de 1 / (k + posição)"""
+    fused: Dict[str, Dict[str, Any]] = {}
+
+    for ranking in rankings:
+        for position, document in enumerate(ranking, start=1):
+            entry = fused.get(document["id"])
+            if entry is None:
+                entry = fused[document["id"]] = {**document, "score": 0.0}
+            else:
+                # Manter campos de ambas as buscas (ex: similarity e rank)
+                for key, value in document.items():
+                    entry.setdefault(key, value)
+            entry["score"] += 1.0 / (k + position)
+
+    return sorted(fused.values(), key=lambda d: d["score"], reverse=True)
+
+
+def _terms(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall(fold_accents(text)) if token not in STOPWORDS and len(token) > 1]
+
+
+def _codes(terms) -> set:
+    """Termos com dígitos (códigos de produto, SKUs)"""
+    return {term for term in terms if any(ch.isdigit() for ch in term)}
+
+
+def supported_lexical(query: str, vector_results: List[Dict[str, Any]], lexical_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Resultados léxicos que a busca vetorial confirma (acima do threshold) ou que contêm um código da pergunta
+
+    A busca léxica sozinha não tem limiar de relevância: sem este filtro, uma
+    mensagem fora do assunto ("oi, tudo bem?") traria chunks quaisquer pela
+    fusão. Ela reordena os resultados vetoriais e só acrescenta os códigos
+    exatos, que são o que a busca vetorial costuma perder.
+    """
+    vector_ids = {document["id"] for document in vector_results}
+    codes = _codes(_terms(query))
+
+    return [
+        document for document in lexical_results
+        if document["id"] in vector_ids or (codes and codes & set(_terms(document.get("content") or "")))
+    ]
+
+
+def rerank(query: str, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Reranker local barato: score RRF + cobertura dos termos da pergunta + códigos exatos.
+
+    Códigos (termos com letras e dígitos, ex: "AB-1234") presentes literalmente
+    no chunk pesam mais, já que são o que a busca vetorial costuma perder.
+    """
+    terms = set(_terms(query))
+    if not terms or not documents:
+        return documents
+
+    codes = _codes(terms)
+    top_score = max(d["score"] for d in documents) or 1.0
+
+    for document in documents:
+        content_terms = set(_terms(document.get("content") or ""))
+        coverage = len(terms & content_terms) / len(terms)
+        code_hits = len(codes & content_terms) / len(codes) if codes else 0.0
+
+        document["rerank_score"] = 0.5 * document["score"] / top_score + 0.3 * coverage + 0.2 * code_hits
+
+    return sorted(documents, key=lambda d: d["rerank_score"], reverse=True)
+
+
+async def retrieve(
+    organization_id: str,
+    query: str,
+    query_embedding: Union[Optional[Sequence[float]], Awaitable[Optional[Sequence[float]]]],
+    limit: int = 5,
+    threshold: float = 0.5,
+    conversation_filter: Optional[str] = None,
+    rule_filter: Optional[str] = None,
+    access_filter: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Recuperar chunks para uma pergunta segundo `retrieval_mode` ("vector" ou "hybrid")
+
+    No modo híbrido, busca vetorial e léxica rodam em paralelo sobre um conjunto
+    maior de candidatos, são combinadas por RRF e, opcionalmente, reordenadas
+    pelo reranker local. A léxica só acrescenta o que a vetorial confirma ou
+    códigos exatos (`supported_lexical`); sem embedding ou se a vetorial
+    falhar, ela é usada sozinha (com o rank mínimo da RPC).
+
+    `query_embedding` pode ser uma tarefa ainda em andamento: a busca léxica
+    começa sem esperar pelo embedding da pergunta.
+    """
+    filters = _filters(conversation_filter=conversation_filter, rule_filter=rule_filter, access_filter=access_filter)
+
+    if settings.retrieval_mode != "hybrid":
+        if inspect.isawaitable(query_embedding):
+            query_embedding = await query_embedding
+        if query_embedding is None:
+            return []
+        return await search_documents(organization_id, query_embedding, limit, threshold, **filters)
+
+    candidates = limit * settings.retrieval_candidate_multiplier
+
+    async def vector() -> Optional[List[Dict[str, Any]]]:
+        embedding = await query_embedding if inspect.isawaitable(query_embedding) else query_embedding
+        if embedding is None:
+            return None
+        return await search_documents(organization_id, embedding, candidates, threshold, **filters)
+
+    vector_results, lexical_results = await asyncio.gather(
+        vector(),
+        search_lexical(organization_id, query, candidates, **filters),
+        return_exceptions=True
+    )
+
+    if isinstance(vector_results, list) and isinstance(lexical_results, list):
+        lexical_results = supported_lexical(query, vector_results, lexical_results)
+
+    rankings = []
+    for name, results in (("vetorial", vector_results), ("léxica", lexical_results)):
+        if isinstance(results, Exception):
+            logger.warning(f"⚠️ Busca {name} falhou: {str(results)}")
+        elif results:
+            rankings.append(results)
+
+    fused = reciprocal_rank_fusion(rankings, k=settings.retrieval_rrf_k)
+
+    if settings.retrieval_reranker_enabled:
+        fused = rerank(query, fused)
+
+    return fused[:limit]
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+from app.config import get_settings
+from app.database import get_supabase
+from app.services import metrics
+from app.services.cache import TTLCache
+from app.services.keyword_matcher import KeywordMatcher
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledRuleSet:
+    """Regras ativas de uma organização, pré-processadas para avaliação e para o prompt"""
+
+    def __init__(self, organization_id: str, rules: List[Dict[str, Any]], version: int):
+        self.organization_id = organization_id
+        self.version = version
+
+        # Ordenadas por prioridade (maior primeiro), como na consulta original
+        self.rules = sorted(rules, key=lambda r: r.get("priority") or 0, reverse=True)
+
+        self.by_condition: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for rule in self.rules:
+            self.by_condition[rule["condition_type"]].append(rule)
+
+        # Todas as palavras-chave da organização em um único autômato
+        self.keyword_matcher = KeywordMatcher(self.by_condition.get("keyword", []))
+
+        self.prompt_text = "\n".join(
+            f"- {rule['name']}: {rule.get('description') or 'Sem descrição'}"
+            for rule in self.rules
+        )
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+
+class RulesCache:
+    """Cache em memória das regras compiladas por organização.
+
+    Invalidado pelas rotas de regras e por eventos Realtime da tabela
+    `business_rules`; o TTL é apenas uma rede de segurança.
+    """
+
+    def __init__(self, ttl: float):
+        self._cache = TTLCache(maxsize=1024, ttl=ttl)
+        self._versions: Dict[str, int] = defaultdict(int)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._last_known: Dict[str, CompiledRuleSet] = {}
+        self._channel = None
+
+    def version(self, organization_id: str) -> int:
+        """Versão das regras da organização (incrementada a cada invalidação)"""
+        return self._versions[organization_id]
+
+    async def get(self, organization_id: str) -> CompiledRuleSet:
+        rule_set = self._cache.get(organization_id)
+        if rule_set is not None:
+            return rule_set
+
+        # Uma única carga por organização mesmo com várias mensagens simultâneas
+        lock = self._locks.setdefault(organization_id, asyncio.Lock())
+        async with lock:
+            rule_set = self._cache.get(organization_id)
+            if rule_set is not None:
+                return rule_set
+
+            version = self.version(organization_id)
+            rule_set = await self._load(organization_id, version)
+            self._last_known[organization_id] = rule_set
+
+            # Só armazenar se nenhuma invalidação ocorreu durante a carga
+            if version == self.version(organization_id):
+                self._cache.set(organization_id, rule_set)
+
+            return rule_set
+
+    def last_known(self, organization_id: str) -> Optional[CompiledRuleSet]:
+        """Últimas regras carregadas, mesmo expiradas ou invalidadas (degradação quando o banco não responde)"""
+        return self._last_known.get(organization_id)
+
+    async def _load(self, organization_id: str, version: int) -> CompiledRuleSet:
+        supabase = get_supabase()
+
+        result = await supabase.table("business_rules").select("*").eq("organization_id", organization_id).eq("is_active", True).order("priority", desc=True).execute()
+
+        return CompiledRuleSet(organization_id, result.data or [], version)
+
+    def invalidate(self, organization_id: Optional[str] = None):
+        """Descartar regras compiladas de uma organização (ou de todas)"""
+        if organization_id is None:
+            for org_id in list(self._versions):
+                self._versions[org_id] += 1
+            self._cache.clear()
+            return
+
+        self._versions[organization_id] += 1
+        self._cache.invalidate(organization_id)
+
+    def _on_change(self, payload: Dict[str, Any]):
+        data = payload.get("data", payload) if isinstance(payload, dict) else {}
+        record = data.get("record") or data.get("new") or {}
+        old_record = data.get("old_record") or data.get("old") or {}
+
+        organization_ids = {r.get("organization_id") for r in (record, old_record) if r.get("organization_id")}
+
+        if not organization_ids:
+            self.invalidate()
+            return
+
+        for organization_id in organization_ids:
+            self.invalidate(organization_id)
+
+    async def start_realtime(self):
+        """Assinar mudanças de `business_rules` via Supabase Realtime para invalidar o cache"""
+        try:
+            supabase = get_supabase()
+            await supabase.realtime.connect()
+
+            self._channel = supabase.channel("business_rules_changes")
+            self._channel.on_postgres_changes(
+                "*",
+                schema="public",
+                table="business_rules",
+                callback=self._on_change
+            )
+            await self._channel.subscribe()
+            logger.info("📡 Invalidação de regras via Realtime ativa")
+        except Exception as e:
+            self._channel = None
+            logger.warning(f"⚠️ Realtime indisponível, cache de regras depende do TTL: {str(e)}")
+
+    async def stop_realtime(self):
+        if self._channel is None:
+            return
+        try:
+            await self._channel.unsubscribe()
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao encerrar canal Realtime: {str(e)}")
+        self._channel = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), "realtime": self._channel is not None}
+
+
+rules_cache = RulesCache(ttl=settings.rules_cache_ttl_seconds)
+
+metrics.register("rules_cache", rules_cache.stats)
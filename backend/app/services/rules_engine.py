@@ -1,121 +1,217 @@
+import hashlib
+import time
+from app.config import get_settings
 from app.database import get_supabase
-from typing import Dict, Any, List
-from datetime import datetime, time
+from app.services import metrics
+from app.services.cache import TTLCache
+from app.services.rules_cache import rules_cache
+from app.services.blacklist_index import blacklist_index
+from app.services.keyword_matcher import rule_key
+from typing import Dict, Any, Hashable, List, Set
+from datetime import datetime
+
+settings = get_settings()
+
+
+# Custo relativo de cada condição: avaliadas das mais baratas para as mais caras
+CONDITION_COSTS = {
+    "time": 0,
+    "keyword": 0,
+    "blacklist": 1,   # índice em memória (carga única por organização)
+    "vip": 2,         # consulta ao banco
+    "sentiment": 3,   # chamada ao LLM
+}
+
+# Sentimento memoizado pelo hash da mensagem
+sentiment_cache = TTLCache(maxsize=4096, ttl=settings.sentiment_cache_ttl_seconds)
+
+
+class _MessageFacts:
+    """Fatos derivados de uma mensagem, calculados no máximo uma vez por avaliação"""
+    
+    def __init__(self, organization_id: str, phone: str, message: str, rule_set):
+        self.organization_id = organization_id
+        self.phone = phone
+        self.message = message
+        self.rule_set = rule_set
+        self._keyword_matches = None
+        self._client_tags = None
+        self._sentiment = None
+    
+    def keyword_matches(self) -> Dict[Hashable, List[str]]:
+        if self._keyword_matches is None:
+            self._keyword_matches = self.rule_set.keyword_matcher.match(self.message)
+        return self._keyword_matches
+    
+    async def client_tags(self) -> List[Set[str]]:
+        if self._client_tags is None:
+            supabase = get_supabase()
+            
+            # Buscar conversas anteriores do cliente
+            conversations = await supabase.table("conversations").select("tags").eq("organization_id", self.organization_id).eq("client_phone", self.phone).execute()
+            
+            self._client_tags = [set(conv.get("tags") or []) for conv in conversations.data or []]
+        return self._client_tags
+    
+    async def sentiment(self, ai) -> Dict[str, Any]:
+        if self._sentiment is None:
+            key = hashlib.sha256(self.message.strip().lower().encode("utf-8")).hexdigest()
+            try:
+                self._sentiment = await sentiment_cache.get_or_load(
+                    key,
+                    lambda: ai.analyze_sentiment(self.message, self.organization_id, raise_errors=True)
+                )
+            except Exception:
+                # Falha do LLM: neutro só nesta avaliação, sem ficar em cache
+                from app.services.ai_engine import NEUTRAL_SENTIMENT
+                self._sentiment = dict(NEUTRAL_SENTIMENT)
+        return self._sentiment
 
 
 class RulesEngine:
     """Motor de Regras para avaliação de condições e ações"""
     
+    def __init__(self):
+        self._ai = None
+        self._timings: Dict[Hashable, Dict[str, Any]] = {}
+        metrics.register("rules_engine", self.stats)
+    
+    @property
+    def ai(self):
+        # AIEngine compartilhado (import tardio: ai_engine carrega o Gemini)
+        if self._ai is None:
+            from app.services.ai_engine import AIEngine
+            self._ai = AIEngine()
+        return self._ai
+    
     async def evaluate(
         self,
         organization_id: str,
         phone: str,
         message: str
     ) -> Dict[str, Any]:
-        """Avaliar todas as regras para uma mensagem"""
+        """Avaliar todas as regras para uma mensagem
         
-        supabase = get_supabase()
+        Retorna a regra de maior prioridade que casar, como antes, mas avalia as
+        condições por faixa de custo: uma condição cara só é avaliada se estiver
+        acima (em prioridade) de todas as regras baratas que já casaram.
+        """
         
-        # Buscar regras ativas ordenadas por prioridade
-        rules = supabase.table("business_rules").select("*").eq("organization_id", organization_id).eq("is_active", True).order("priority", desc=True).execute()
+        # Regras ativas compiladas, ordenadas por prioridade (cache em memória)
+        rule_set = await rules_cache.get(organization_id)
         
-        if not rules.data:
+        if not rule_set:
             return {"action": "continue", "context": {}}
         
-        # Avaliar cada regra
-        for rule in rules.data:
-            result = await self._evaluate_rule(rule, phone, message, organization_id)
-            
-            if result["matched"]:
-                return {
-                    "action": rule["action_type"],
-                    "action_config": rule["action_config"],
-                    "rule_name": rule["name"],
-                    "context": result.get("context", {})
-                }
+        facts = _MessageFacts(organization_id, phone, message, rule_set)
+        
+        # Índice (em ordem de prioridade) da melhor regra encontrada até agora
+        limit = len(rule_set.rules)
+        best = None
+        
+        for cost in sorted(set(CONDITION_COSTS.values())):
+            for index, rule in enumerate(rule_set.rules[:limit]):
+                if CONDITION_COSTS.get(rule["condition_type"], 0) != cost:
+                    continue
+                
+                result = await self._timed(rule, self._evaluate_rule(rule, facts))
+                
+                if result["matched"]:
+                    limit = index
+                    best = (rule, result)
+                    break
+        
+        if best is None:
+            return {"action": "continue", "context": {}}
         
-        return {"action": "continue", "context": {}}
+        rule, result = best
+        return {
+            "action": rule["action_type"],
+            "action_config": rule["action_config"],
+            "rule_name": rule["name"],
+            "context": result.get("context", {})
+        }
     
-    async def _evaluate_rule(
-        self,
-        rule: Dict[str, Any],
-        phone: str,
-        message: str,
-        organization_id: str
-    ) -> Dict[str, Any]:
+    async def _timed(self, rule: Dict[str, Any], evaluation) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            return await evaluation
+        finally:
+            key = rule_key(rule)
+            entry = self._timings.get(key)
+            if entry is None:
+                entry = self._timings[key] = {
+                    "name": rule.get("name"),
+                    "condition_type": rule.get("condition_type"),
+                    "histogram": metrics.Histogram()
+                }
+            entry["histogram"].observe((time.perf_counter() - started) * 1000)
+    
+    async def _evaluate_rule(self, rule: Dict[str, Any], facts: _MessageFacts) -> Dict[str, Any]:
         """Avaliar uma regra específica"""
         
         condition_type = rule["condition_type"]
         condition_config = rule["condition_config"]
         
-        if condition_type == "blacklist":
-            return await self._check_blacklist(phone, condition_config, organization_id)
+        if condition_type == "keyword":
+            return self._check_keywords(rule, facts.keyword_matches())
         
-        elif condition_type == "vip":
-            return await self._check_vip(phone, condition_config, organization_id)
+        elif condition_type == "blacklist":
+            return await self._check_blacklist(facts.phone, condition_config, facts.organization_id)
         
-        elif condition_type == "keyword":
-            return self._check_keywords(message, condition_config)
+        elif condition_type == "vip":
+            return self._check_vip(await facts.client_tags(), condition_config)
         
         elif condition_type == "time":
             return self._check_business_hours(condition_config)
         
         elif condition_type == "sentiment":
-            from app.services.ai_engine import AIEngine
-            ai = AIEngine()
-            sentiment = await ai.analyze_sentiment(message)
+            sentiment = await facts.sentiment(self.ai)
             return self._check_sentiment(sentiment, condition_config)
         
         return {"matched": False}
     
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sentiment_cache": sentiment_cache.stats(),
+            "rules": {
+                str(key): {
+                    "name": entry["name"],
+                    "condition_type": entry["condition_type"],
+                    **entry["histogram"].snapshot()
+                }
+                for key, entry in self._timings.items()
+            }
+        }
+    
     async def _check_blacklist(
         self,
         phone: str,
         config: Dict[str, Any],
         organization_id: str
     ) -> Dict[str, Any]:
-        """Verificar se número está na blacklist"""
-        
-        supabase = get_supabase()
+        """Verificar se número está na blacklist (índice em memória por organização)"""
         
-        # Buscar blacklists da organização
-        blacklists = supabase.table("blacklists").select("phone_numbers").eq("organization_id", organization_id).execute()
-        
-        for bl in blacklists.data or []:
-            if phone in (bl.get("phone_numbers") or []):
-                return {"matched": True, "context": {"reason": "blacklist"}}
+        if await blacklist_index.contains(organization_id, phone):
+            return {"matched": True, "context": {"reason": "blacklist"}}
         
         return {"matched": False}
     
-    async def _check_vip(
-        self,
-        phone: str,
-        config: Dict[str, Any],
-        organization_id: str
-    ) -> Dict[str, Any]:
-        """Verificar se cliente é VIP"""
-        
-        supabase = get_supabase()
+    def _check_vip(self, client_tags: List[Set[str]], config: Dict[str, Any]) -> Dict[str, Any]:
+        """Verificar se cliente é VIP (tags das conversas anteriores)"""
         
-        # Buscar conversas anteriores do cliente
-        conversations = supabase.table("conversations").select("tags").eq("organization_id", organization_id).eq("client_phone", phone).execute()
+        vip_tags = set(config.get("tags", ["vip", "premium"]))
         
-        vip_tags = config.get("tags", ["vip", "premium"])
-        
-        for conv in conversations.data or []:
-            tags = conv.get("tags") or []
-            if any(tag in vip_tags for tag in tags):
+        for tags in client_tags:
+            if tags & vip_tags:
                 return {"matched": True, "context": {"is_vip": True}}
         
         return {"matched": False}
     
-    def _check_keywords(self, message: str, config: Dict[str, Any]) -> Dict[str, Any]:
-        """Verificar presença de palavras-chave"""
-        
-        keywords = config.get("keywords", [])
-        message_lower = message.lower()
+    def _check_keywords(self, rule: Dict[str, Any], keyword_matches: Dict[Hashable, List[str]]) -> Dict[str, Any]:
+        """Verificar presença de palavras-chave (resultado do autômato da organização)"""
         
-        matched_keywords = [kw for kw in keywords if kw.lower() in message_lower]
+        matched_keywords = keyword_matches.get(rule_key(rule))
         
         if matched_keywords:
             return {"matched": True, "context": {"keywords": matched_keywords}}
@@ -0,0 +1,177 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from app.config import get_settings
+from app.database import get_supabase
+from app.services import metrics
+from app.services.cache import TTLCache
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+# (versão da base de conhecimento, versão das regras) usada ao gerar a resposta
+Versions = Tuple[int, int]
+
+
+class KnowledgeVersions:
+    """Versão da base de conhecimento por organização.
+
+    Mantida pelo banco (tabela `knowledge_versions`, incrementada por triggers em
+    `documents`), já que a ingestão roda em outro processo. A leitura fica em
+    cache por alguns segundos; escritas feitas neste processo invalidam na hora.
+    """
+
+    def __init__(self, ttl: float):
+        self._cache = TTLCache(maxsize=4096, ttl=ttl)
+
+    async def get(self, organization_id: str) -> int:
+        return await self._cache.get_or_load(organization_id, lambda: self._load(organization_id))
+
+    async def _load(self, organization_id: str) -> int:
+        supabase = get_supabase()
+
+        result = await supabase.table("knowledge_versions").select("version").eq("organization_id", organization_id).limit(1).execute()
+
+        return result.data[0]["version"] if result.data else 0
+
+    def invalidate(self, organization_id: Optional[str] = None):
+        if organization_id is None:
+            self._cache.clear()
+        else:
+            self._cache.invalidate(organization_id)
+
+
+@dataclass
+class _Entry:
+    answer: str
+    versions: Versions
+    variant: str
+    created_at: float = field(default_factory=time.monotonic)
+    hits: int = 0
+
+
+class _OrgEntries:
+    """Respostas de uma organização com os embeddings normalizados em uma matriz"""
+
+    def __init__(self):
+        self.entries: List[_Entry] = []
+        self.vectors: Optional[np.ndarray] = None
+
+    def remove(self, keep: np.ndarray):
+        self.entries = [entry for entry, kept in zip(self.entries, keep) if kept]
+        self.vectors = self.vectors[keep] if self.entries else None
+
+
+class SemanticCache:
+    """Cache de respostas por similaridade do embedding da pergunta.
+
+    Uma resposta é reaproveitada quando a pergunta nova tem similaridade de
+    cosseno >= `threshold` com uma pergunta já respondida, na mesma variante
+    (ex: cliente VIP) e com as mesmas versões de conhecimento e regras.
+    Entradas de versões antigas são descartadas na consulta seguinte.
+    """
+
+    def __init__(self, threshold: float, max_entries_per_org: int, ttl: float):
+        self.threshold = threshold
+        self.max_entries_per_org = max_entries_per_org
+        self.ttl = ttl
+        self._orgs: Dict[str, _OrgEntries] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidated = 0
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _prune(self, org: _OrgEntries, versions: Versions):
+        now = time.monotonic()
+        keep = np.array([
+            entry.versions == versions and (not self.ttl or now - entry.created_at < self.ttl)
+            for entry in org.entries
+        ], dtype=bool)
+
+        if not keep.all():
+            self.invalidated += int((~keep).sum())
+            org.remove(keep)
+
+    def lookup(self, organization_id: str, embedding: Sequence[float], versions: Versions, variant: str = "") -> Optional[str]:
+        """Retornar resposta em cache para uma pergunta semelhante, se houver"""
+        org = self._orgs.get(organization_id)
+        vector = self._normalize(embedding)
+
+        if org is not None and vector is not None:
+            self._prune(org, versions)
+
+        if org is None or vector is None or not org.entries or vector.shape[0] != org.vectors.shape[1]:
+            self.misses += 1
+            return None
+
+        similarities = org.vectors @ vector
+        for index in np.argsort(-similarities):
+            if similarities[index] < self.threshold:
+                break
+            entry = org.entries[index]
+            if entry.variant == variant:
+                entry.hits += 1
+                self.hits += 1
+                return entry.answer
+
+        self.misses += 1
+        return None
+
+    def store(self, organization_id: str, embedding: Sequence[float], answer: str, versions: Versions, variant: str = ""):
+        vector = self._normalize(embedding)
+        if vector is None or not answer:
+            return
+
+        org = self._orgs.setdefault(organization_id, _OrgEntries())
+        if org.vectors is not None and org.vectors.shape[1] != vector.shape[0]:
+            org.entries, org.vectors = [], None
+
+        org.entries.append(_Entry(answer=answer, versions=versions, variant=variant))
+        org.vectors = vector[None, :] if org.vectors is None else np.vstack([org.vectors, vector])
+
+        # Despejar as entradas menos usadas (e, no empate, as mais antigas)
+        overflow = len(org.entries) - self.max_entries_per_org
+        if overflow > 0:
+            ranked = sorted(range(len(org.entries)), key=lambda i: (org.entries[i].hits, org.entries[i].created_at))
+            keep = np.ones(len(org.entries), dtype=bool)
+            keep[ranked[:overflow]] = False
+            org.remove(keep)
+            self.evictions += overflow
+
+    def invalidate(self, organization_id: Optional[str] = None):
+        if organization_id is None:
+            self._orgs.clear()
+        else:
+            self._orgs.pop(organization_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "organizations": len(self._orgs),
+            "entries": sum(len(org.entries) for org in self._orgs.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidated": self.invalidated
+        }
+
+
+knowledge_versions = KnowledgeVersions(ttl=settings.knowledge_version_ttl_seconds)
+
+semantic_cache = SemanticCache(
+    threshold=settings.semantic_cache_threshold,
+    max_entries_per_org=settings.semantic_cache_max_entries_per_org,
+    ttl=settings.semantic_cache_ttl_seconds
+)
+
+metrics.register("semantic_cache", semantic_cache.stats)
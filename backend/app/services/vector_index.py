@@ -0,0 +1,448 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+import numpy as np
+from app.config import get_settings
+from app.database import get_supabase
+from app.services import metrics
+from app.services.cache import TTLCache
+from app.services.semantic_cache import knowledge_versions
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+# Página de leitura do PostgREST
+PAGE_SIZE = 1000
+
+# Colunas devolvidas nos resultados (mesmo formato do RPC search_documents)
+RESULT_FIELDS = ("id", "filename", "content", "conversation_id", "business_rule_ids", "access_level")
+
+# Colunas mantidas em memória: o conteúdo é buscado só para os resultados
+ROW_FIELDS = tuple(field for field in RESULT_FIELDS if field != "content") + ("parent_document_id",)
+
+# Buscas por id no PostgREST (`in.(...)`): URLs longas são recusadas
+CONTENT_BATCH = 100
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _parse_embedding(value: Any) -> Optional[List[float]]:
+    # pgvector chega pelo PostgREST como texto "[0.1,0.2,...]"
+    if isinstance(value, str):
+        value = json.loads(value)
+    return value or None
+
+
+def _parse_page(page: List[Dict[str, Any]]) -> tuple:
+    """Linhas (sem conteúdo) e matriz float32 de uma página; roda fora do event loop"""
+    rows: List[Dict[str, Any]] = []
+    vectors: List[np.ndarray] = []
+    for row in page:
+        embedding = _parse_embedding(row.get("embedding"))
+        if not embedding:
+            continue
+        vector = np.asarray(embedding, dtype=np.float32)
+        if vectors and vector.shape != vectors[0].shape:
+            continue
+        rows.append({field: row.get(field) for field in ROW_FIELDS})
+        vectors.append(vector)
+    return rows, (np.stack(vectors) if vectors else None)
+
+
+class IVFPartition:
+    """Partição IVF: k-means esférico sobre uma amostra; busca só nas `nprobe` listas mais próximas"""
+
+    def __init__(self, vectors: np.ndarray, nlist: int, iterations: int = 8, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(vectors), nlist * 64)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assignment == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize_rows(centroids)
+
+        self.centroids = centroids
+        self.lists: List[List[np.ndarray]] = [[] for _ in range(nlist)]
+        self.assign(vectors, offset=0)
+
+    def assign(self, vectors: np.ndarray, offset: int):
+        """Distribuir vetores (posições a partir de `offset`) entre as listas"""
+        for start in range(0, len(vectors), 8192):
+            block = vectors[start:start + 8192]
+            assignment = np.argmax(block @ self.centroids.T, axis=1)
+            for c in np.unique(assignment):
+                self.lists[c].append(np.flatnonzero(assignment == c) + offset + start)
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        nprobe = min(nprobe, len(self.centroids))
+        nearest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        parts = [part for c in nearest for part in self.lists[c]]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+
+class OrgVectorIndex:
+    """Vetores normalizados (float32) dos chunks de uma organização, com IVF para bases grandes"""
+
+    def __init__(self, organization_id: str, dimensions: int, version: int):
+        self.organization_id = organization_id
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self._vectors = np.empty((0, dimensions), dtype=np.float32)
+        self._alive = np.empty(0, dtype=bool)
+        self._rows: List[Dict[str, Any]] = []
+        self._positions: Dict[str, int] = {}
+        self._ivf: Optional[IVFPartition] = None
+        self.used_at = time.monotonic()
+
+    @property
+    def dimensions(self) -> int:
+        return self._vectors.shape[1]
+
+    @property
+    def resident(self) -> int:
+        """Vetores ocupando memória (inclusive os marcados como removidos)"""
+        return self._vectors.shape[0]
+
+    @property
+    def size(self) -> int:
+        return int(self._alive.sum())
+
+    def add(self, rows: Sequence[Dict[str, Any]], embeddings: np.ndarray):
+        """Acrescentar chunks (linhas de `documents` + embeddings na mesma ordem)"""
+        if not len(rows):
+            return
+
+        offset = len(self._rows)
+        vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+
+        self._vectors = np.vstack([self._vectors, vectors])
+        self._alive = np.concatenate([self._alive, np.ones(len(rows), dtype=bool)])
+
+        for i, row in enumerate(rows):
+            previous = self._positions.get(row["id"])
+            if previous is not None:
+                self._alive[previous] = False
+            self._positions[row["id"]] = offset + i
+            self._rows.append({field: row.get(field) for field in ROW_FIELDS})
+
+        if self._ivf is not None:
+            self._ivf.assign(vectors, offset)
+
+    def build_ivf(self, min_vectors: int):
+        count = len(self._rows)
+        self._ivf = IVFPartition(self._vectors, nlist=int(np.sqrt(count))) if count >= min_vectors else None
+
+    def remove_document(self, document_id: str) -> int:
+        """Marcar como removidos o documento e seus chunks"""
+        removed = 0
+        for position, row in enumerate(self._rows):
+            if self._alive[position] and document_id in (row["id"], row.get("parent_document_id")):
+                self._alive[position] = False
+                self._positions.pop(row["id"], None)
+                removed += 1
+        return removed
+
+    def remove_ids(self, ids: Iterable[str]) -> int:
+        removed = 0
+        for row_id in ids:
+            position = self._positions.pop(row_id, None)
+            if position is not None and self._alive[position]:
+                self._alive[position] = False
+                removed += 1
+        return removed
+
+    def search(
+        self,
+        query: np.ndarray,
+        limit: int,
+        threshold: float,
+        nprobe: int,
+        conversation_filter: Optional[str] = None,
+        rule_filter: Optional[str] = None,
+        access_filter: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        if self._ivf is not None:
+            candidates = self._ivf.candidates(query, nprobe)
+            candidates = candidates[self._alive[candidates]]
+        else:
+            candidates = np.flatnonzero(self._alive)
+
+        if not len(candidates):
+            return []
+
+        similarities = self._vectors[candidates] @ query
+        keep = similarities > threshold
+        candidates, similarities = candidates[keep], similarities[keep]
+
+        results = []
+        for i in np.argsort(-similarities):
+            row = self._rows[candidates[i]]
+            if conversation_filter and row.get("conversation_id") != conversation_filter:
+                continue
+            if rule_filter and rule_filter not in (row.get("business_rule_ids") or []):
+                continue
+            if access_filter and row.get("access_level") != access_filter:
+                continue
+
+            result = {field: row.get(field) for field in RESULT_FIELDS}
+            result["similarity"] = float(similarities[i])
+            results.append(result)
+            if len(results) >= limit:
+                break
+
+        return results
+
+
+class VectorIndexRegistry:
+    """Índices vetoriais locais por organização, com o pgvector como fonte da verdade.
+
+    A primeira busca de uma organização dispara a carga em background e devolve
+    None (o chamador usa o RPC). Depois disso as buscas são locais; mudanças na
+    base (versão em `knowledge_versions`) disparam recarga em background, no
+    máximo uma a cada `reload_interval`, servindo o índice anterior enquanto isso.
+    Chunks inseridos ou removidos neste processo são aplicados na hora.
+
+    Só vetores (float32) e metadados ficam residentes; o conteúdo dos chunks é
+    buscado para os resultados (com cache LRU). O total de vetores do processo
+    é limitado por `max_total_vectors`: cargas novas despejam os índices usados
+    há mais tempo e, sem espaço, a organização fica no pgvector.
+    """
+
+    def __init__(
+        self,
+        max_vectors: int,
+        ivf_min_vectors: int,
+        nprobe: int,
+        reload_interval: float,
+        max_total_vectors: Optional[int] = None,
+        content_cache_size: int = 4096
+    ):
+        self.max_vectors = max_vectors
+        self.max_total_vectors = max_total_vectors or max_vectors
+        self.ivf_min_vectors = ivf_min_vectors
+        self.nprobe = nprobe
+        self.reload_interval = reload_interval
+        self._indexes: Dict[str, OrgVectorIndex] = {}
+        self._loading: Dict[str, asyncio.Task] = {}
+        self._oversized: Dict[str, float] = {}
+        self._reserved: Dict[str, int] = {}
+        self._contents = TTLCache(maxsize=content_cache_size, ttl=None)
+        self.local_searches = 0
+        self.fallbacks = 0
+        self.evictions = 0
+        self.search_histogram = metrics.Histogram()
+
+    async def search(
+        self,
+        organization_id: str,
+        query_embedding: Sequence[float],
+        limit: int,
+        threshold: float,
+        **filters
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Buscar localmente; None se o índice da organização ainda não está disponível"""
+        index = self._indexes.get(organization_id)
+
+        try:
+            version = await knowledge_versions.get(organization_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Versão da base indisponível, usando pgvector: {str(e)}")
+            self.fallbacks += 1
+            return None
+
+        if index is None or (index.version != version and time.monotonic() - index.loaded_at >= self.reload_interval):
+            self._schedule_load(organization_id, version)
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if index is None or query.shape[0] != index.dimensions:
+            self.fallbacks += 1
+            return None
+
+        started = time.perf_counter()
+        index.used_at = time.monotonic()
+        norm = np.linalg.norm(query)
+        results = index.search(query / norm if norm else query, limit, threshold, self.nprobe, **filters)
+        self.search_histogram.observe((time.perf_counter() - started) * 1000)
+        self.local_searches += 1
+
+        return await self._with_content(results)
+
+    async def _with_content(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Preencher `content` dos resultados; chunks removidos entretanto saem da lista"""
+        contents: Dict[str, str] = {}
+        missing = []
+        for result in results:
+            content = self._contents.get(result["id"])
+            if content is None:
+                missing.append(result["id"])
+            else:
+                contents[result["id"]] = content
+
+        if missing:
+            supabase = get_supabase()
+            for start in range(0, len(missing), CONTENT_BATCH):
+                response = await supabase.table("documents").select("id, content").in_(
+                    "id", missing[start:start + CONTENT_BATCH]
+                ).execute()
+                for row in response.data or []:
+                    contents[row["id"]] = row.get("content") or ""
+                    self._contents.set(row["id"], contents[row["id"]])
+
+        return [{**result, "content": contents[result["id"]]} for result in results if result["id"] in contents]
+
+    def _resident(self) -> int:
+        return sum(index.resident for index in self._indexes.values())
+
+    def _reserve(self, organization_id: str, vectors: int) -> bool:
+        """Reservar espaço no orçamento global para uma carga; despeja índices pouco usados se preciso"""
+        def used() -> int:
+            return self._resident() + sum(self._reserved.values())
+
+        while used() + vectors > self.max_total_vectors:
+            candidates = [
+                (index.used_at, org_id) for org_id, index in self._indexes.items()
+                if org_id != organization_id and org_id not in self._loading
+            ]
+            if not candidates:
+                return False
+            _, victim = min(candidates)
+            self._indexes.pop(victim)
+            self.evictions += 1
+            logger.info(f"📐 Índice vetorial da org {victim} despejado (orçamento de {self.max_total_vectors} vetores)")
+
+        self._reserved[organization_id] = self._reserved.get(organization_id, 0) + vectors
+        return True
+
+    def _schedule_load(self, organization_id: str, version: int):
+        if organization_id in self._loading:
+            return
+
+        # Organizações acima do limite ficam no pgvector; reavaliar só após o intervalo
+        checked_at = self._oversized.get(organization_id)
+        if checked_at is not None and time.monotonic() - checked_at < self.reload_interval:
+            return
+
+        task = asyncio.create_task(self._load(organization_id, version))
+        self._loading[organization_id] = task
+        task.add_done_callback(lambda _: self._loading.pop(organization_id, None))
+
+    async def _load(self, organization_id: str, version: int):
+        started = time.perf_counter()
+        try:
+            supabase = get_supabase()
+            rows: List[Dict[str, Any]] = []
+            matrices: List[np.ndarray] = []
+            last_id = None
+
+            while True:
+                query = supabase.table("documents").select(
+                    "id, filename, embedding, conversation_id, business_rule_ids, access_level, parent_document_id"
+                ).eq("organization_id", organization_id).eq("status", "ready").not_.is_("embedding", "null")
+                if last_id is not None:
+                    query = query.gt("id", last_id)
+                result = await query.order("id").limit(PAGE_SIZE).execute()
+
+                page = result.data or []
+                # Cada página vira float32 na hora (e o JSON é lido fora do event loop)
+                page_rows, matrix = await asyncio.to_thread(_parse_page, page)
+                if matrix is not None and matrices and matrix.shape[1] != matrices[0].shape[1]:
+                    raise ValueError(f"dimensões diferentes no índice ({matrix.shape[1]} x {matrices[0].shape[1]})")
+
+                if len(rows) + len(page_rows) > self.max_vectors or (
+                    page_rows and not self._reserve(organization_id, len(page_rows))
+                ):
+                    self._oversized[organization_id] = time.monotonic()
+                    self._indexes.pop(organization_id, None)
+                    logger.info(
+                        f"📐 Org {organization_id} excede {self.max_vectors} vetores ou o orçamento do processo; "
+                        f"busca fica no pgvector"
+                    )
+                    return
+
+                rows.extend(page_rows)
+                if matrix is not None:
+                    matrices.append(matrix)
+
+                if len(page) < PAGE_SIZE:
+                    break
+                last_id = page[-1]["id"]
+
+            if not rows:
+                self._indexes.pop(organization_id, None)
+                return
+
+            index = OrgVectorIndex(organization_id, matrices[0].shape[1], version)
+            await asyncio.to_thread(index.add, rows, np.concatenate(matrices))
+            del matrices[:]
+            await asyncio.to_thread(index.build_ivf, self.ivf_min_vectors)
+
+            self._oversized.pop(organization_id, None)
+            self._indexes[organization_id] = index
+            logger.info(f"📐 Índice vetorial carregado: org {organization_id} ({index.size} vetores, {time.perf_counter() - started:.1f}s)")
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao carregar índice vetorial da org {organization_id}: {str(e)}")
+        finally:
+            self._reserved.pop(organization_id, None)
+
+    def add_chunks(self, organization_id: str, rows: Iterable[Dict[str, Any]]):
+        """Aplicar chunks recém-inseridos (com `id` e `embedding`) a um índice já carregado"""
+        index = self._indexes.get(organization_id)
+        if index is None:
+            return
+
+        rows = [row for row in rows if row.get("id") and row.get("embedding")]
+        if rows:
+            index.add(rows, np.asarray([row["embedding"] for row in rows], dtype=np.float32))
+
+    def remove_document(self, organization_id: str, document_id: str):
+        index = self._indexes.get(organization_id)
+        if index is not None:
+            index.remove_document(document_id)
+
+    def remove_chunks(self, organization_id: str, chunk_ids: Iterable[str]):
+        chunk_ids = list(chunk_ids)
+        for chunk_id in chunk_ids:
+            self._contents.invalidate(chunk_id)
+
+        index = self._indexes.get(organization_id)
+        if index is not None:
+            index.remove_ids(chunk_ids)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "organizations": len(self._indexes),
+            "vectors": sum(index.size for index in self._indexes.values()),
+            "resident_vectors": self._resident(),
+            "max_total_vectors": self.max_total_vectors,
+            "loading": len(self._loading),
+            "local_searches": self.local_searches,
+            "fallbacks": self.fallbacks,
+            "evictions": self.evictions,
+            "content_cache_hits": self._contents.hits,
+            "search_ms": self.search_histogram.snapshot()
+        }
+
+
+vector_index = VectorIndexRegistry(
+    max_vectors=settings.vector_index_max_vectors,
+    ivf_min_vectors=settings.vector_index_ivf_min_vectors,
+    nprobe=settings.vector_index_nprobe,
+    reload_interval=settings.vector_index_reload_interval_seconds,
+    max_total_vectors=settings.vector_index_max_total_vectors,
+    content_cache_size=settings.vector_index_content_cache_size
+)
+
+metrics.register("vector_index", vector_index.stats)
@@ -0,0 +1,531 @@
+import asyncio
+import itertools
+import logging
+import random
+import socket
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+from app.config import get_settings
+from app.database import get_supabase
+from app.services import metrics
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookBackpressure(Exception):
+    """Fila sem capacidade para gravar o evento agora: o remetente deve tentar de novo"""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def retry_delay(attempts: int) -> float:
+    """Backoff exponencial com jitter para a próxima tentativa"""
+    delay = settings.webhook_retry_base_seconds * (2 ** max(attempts - 1, 0))
+    return min(delay, 300) * random.uniform(0.8, 1.2)
+
+
+class SupabaseWebhookQueue:
+    """Fila de eventos persistida na tabela `webhook_events`
+
+    `claim` reserva no máximo um evento por `ordering_key` (o mais antigo
+    pendente), então eventos de uma conversa saem em ordem de chegada.
+    """
+
+    async def enqueue(
+        self,
+        instance: str,
+        event_key: str,
+        ordering_key: str,
+        payload: Dict[str, Any],
+        source: str = "evolution"
+    ) -> Optional[Dict[str, Any]]:
+        """Gravar o evento; retorna None se a mesma chave já foi recebida"""
+        supabase = get_supabase()
+
+        result = await supabase.table("webhook_events").upsert(
+            {
+                "source": source,
+                "instance": instance,
+                "event_key": event_key,
+                "ordering_key": ordering_key,
+                "payload": payload,
+                "max_attempts": settings.webhook_max_attempts
+            },
+            on_conflict="source,instance,event_key",
+            ignore_duplicates=True
+        ).execute()
+
+        return result.data[0] if result.data else None
+
+    async def claim(self, worker_id: str, limit: int) -> List[Dict[str, Any]]:
+        supabase = get_supabase()
+
+        result = await supabase.rpc("claim_webhook_events", {
+            "worker_id": worker_id,
+            "lease_seconds": settings.webhook_lease_seconds,
+            "max_events": limit
+        }).execute()
+
+        return result.data or []
+
+    async def claim_followers(self, worker_id: str, head: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+        """Reservar os próximos eventos pendentes da conversa de `head` (reservada por este worker), em ordem
+
+        Também renova o lease dos eventos que o worker já segura na conversa.
+        """
+        supabase = get_supabase()
+
+        result = await supabase.rpc("claim_webhook_followers", {
+            "worker_id": worker_id,
+            "head_id": head["id"],
+            "lease_seconds": settings.webhook_lease_seconds,
+            "max_events": limit
+        }).execute()
+
+        return result.data or []
+
+    async def heartbeat(self, worker_id: str, event_ids: List[str]):
+        """Renovar o lease dos eventos que o worker ainda segura"""
+        supabase = get_supabase()
+        locked_until = _now() + timedelta(seconds=settings.webhook_lease_seconds)
+
+        await supabase.table("webhook_events").update({
+            "locked_until": locked_until.isoformat()
+        }).in_("id", event_ids).eq("locked_by", worker_id).eq("status", "running").execute()
+
+    async def complete(self, event_id: str):
+        supabase = get_supabase()
+
+        await supabase.table("webhook_events").update({
+            "status": "done",
+            "locked_by": None,
+            "locked_until": None,
+            "error_message": None
+        }).eq("id", event_id).execute()
+
+    async def fail(self, event: Dict[str, Any], error: str) -> bool:
+        """Registrar falha; retorna True se uma nova tentativa foi agendada"""
+        supabase = get_supabase()
+        will_retry = event["attempts"] < event["max_attempts"]
+
+        update = {
+            "status": "queued" if will_retry else "failed",
+            "locked_by": None,
+            "locked_until": None,
+            "error_message": error
+        }
+        if will_retry:
+            update["run_after"] = (_now() + timedelta(seconds=retry_delay(event["attempts"]))).isoformat()
+
+        await supabase.table("webhook_events").update(update).eq("id", event["id"]).execute()
+
+        return will_retry
+
+    async def purge(self, older_than: datetime):
+        """Remover eventos concluídos (a janela de deduplicação é a retenção)"""
+        supabase = get_supabase()
+
+        await supabase.table("webhook_events").delete().in_("status", ["done", "failed"]).lt(
+            "updated_at", older_than.isoformat()
+        ).execute()
+
+
+class InMemoryWebhookQueue:
+    """Substituto local da fila (desenvolvimento e testes): mesmo contrato, sem persistência"""
+
+    def __init__(self):
+        self.events: Dict[str, Dict[str, Any]] = {}
+        # Eventos pendentes por ordering_key, em ordem de chegada (a cabeça é a única reservável)
+        self._lanes: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._keys: Set[tuple] = set()
+        self._sequence = itertools.count()
+
+    async def enqueue(
+        self,
+        instance: str,
+        event_key: str,
+        ordering_key: str,
+        payload: Dict[str, Any],
+        source: str = "evolution"
+    ) -> Optional[Dict[str, Any]]:
+        if (source, instance, event_key) in self._keys:
+            return None
+        self._keys.add((source, instance, event_key))
+
+        event = {
+            "id": str(uuid.uuid4()),
+            "source": source,
+            "instance": instance,
+            "event_key": event_key,
+            "ordering_key": ordering_key,
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": settings.webhook_max_attempts,
+            "run_after": _now(),
+            "locked_by": None,
+            "locked_until": None,
+            "error_message": None,
+            "created_at": _now(),
+            "updated_at": _now(),
+            "sequence": next(self._sequence)
+        }
+        self.events[event["id"]] = event
+        self._lanes.setdefault(ordering_key, deque()).append(event)
+        return dict(event)
+
+    async def claim(self, worker_id: str, limit: int) -> List[Dict[str, Any]]:
+        now = _now()
+
+        # Lease expirado na última tentativa: falha definitiva (como claim_webhook_events)
+        for lane in list(self._lanes.values()):
+            head = lane[0]
+            if head["status"] == "running" and head["locked_until"] < now and head["attempts"] >= head["max_attempts"]:
+                head.update({
+                    "status": "failed",
+                    "locked_by": None,
+                    "locked_until": None,
+                    "error_message": "Processamento interrompido (worker encerrado) em todas as tentativas",
+                    "updated_at": now
+                })
+                self._settle(head)
+
+        heads = (lane[0] for lane in self._lanes.values())
+        ready = sorted(
+            (
+                event for event in heads
+                if (event["status"] == "queued" and event["run_after"] <= now)
+                or (event["status"] == "running" and event["locked_until"] < now)
+            ),
+            key=lambda e: e["sequence"]
+        )[:limit]
+
+        for event in ready:
+            event.update({
+                "status": "running",
+                "attempts": event["attempts"] + 1,
+                "locked_by": worker_id,
+                "locked_until": now + timedelta(seconds=settings.webhook_lease_seconds)
+            })
+        return [dict(event) for event in ready]
+
+    async def claim_followers(self, worker_id: str, head: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+        now = _now()
+        lane = self._lanes.get(head["ordering_key"])
+        stored = self.events.get(head["id"])
+        if not lane or stored is not lane[0] or stored["locked_by"] != worker_id or stored["locked_until"] < now:
+            return []
+
+        # Pendentes, ou do turno de um worker que caiu (lease expirado, ainda com tentativas)
+        followers = [
+            event for event in list(lane)[1:]
+            if event["status"] == "queued"
+            or (event["status"] == "running" and event["locked_until"] < now and event["attempts"] < event["max_attempts"])
+        ][:limit]
+        locked_until = now + timedelta(seconds=settings.webhook_lease_seconds)
+        for event in lane:
+            # Eventos já reservados pelo turno (a cabeça inclusive) vencem junto com os novos
+            if event["status"] == "running" and event["locked_by"] == worker_id:
+                event["locked_until"] = locked_until
+        for event in followers:
+            event.update({
+                "status": "running",
+                "attempts": event["attempts"] + 1,
+                "locked_by": worker_id,
+                "locked_until": locked_until
+            })
+        return [dict(event) for event in followers]
+
+    async def heartbeat(self, worker_id: str, event_ids: List[str]):
+        locked_until = _now() + timedelta(seconds=settings.webhook_lease_seconds)
+        for event_id in event_ids:
+            event = self.events.get(event_id)
+            if event and event["status"] == "running" and event["locked_by"] == worker_id:
+                event["locked_until"] = locked_until
+
+    def _settle(self, event: Dict[str, Any]):
+        lane = self._lanes.get(event["ordering_key"])
+        # Já pode ter saído da fila (lease esgotado e falhado por outro claim)
+        if lane and any(pending is event for pending in lane):
+            lane.remove(event)
+            if not lane:
+                del self._lanes[event["ordering_key"]]
+
+    async def complete(self, event_id: str):
+        self._settle(self.events[event_id])
+        self.events[event_id].update({
+            "status": "done", "locked_by": None, "locked_until": None, "error_message": None, "updated_at": _now()
+        })
+
+    async def fail(self, event: Dict[str, Any], error: str) -> bool:
+        stored = self.events[event["id"]]
+        will_retry = stored["attempts"] < stored["max_attempts"]
+
+        stored.update({
+            "status": "queued" if will_retry else "failed",
+            "locked_by": None,
+            "locked_until": None,
+            "error_message": error,
+            "updated_at": _now()
+        })
+        if will_retry:
+            stored["run_after"] = _now() + timedelta(seconds=retry_delay(stored["attempts"]))
+        else:
+            self._settle(stored)
+
+        return will_retry
+
+    async def purge(self, older_than: datetime):
+        for event_id, event in list(self.events.items()):
+            if event["status"] in ("done", "failed") and event["updated_at"] < older_than:
+                del self.events[event_id]
+                self._keys.discard((event["source"], event["instance"], event["event_key"]))
+
+
+def _create_queue():
+    if settings.webhook_queue_backend == "memory":
+        return InMemoryWebhookQueue()
+    return SupabaseWebhookQueue()
+
+
+webhook_queue = _create_queue()
+
+
+class WebhookIntake:
+    """Entrada do webhook: grava o evento de forma durável antes do ack
+
+    No máximo `WEBHOOK_INTAKE_MAX_CONCURRENCY` gravações simultâneas; quem não
+    consegue vaga em `WEBHOOK_INTAKE_WAIT_SECONDS` recebe `WebhookBackpressure`
+    (503 com Retry-After), em vez de acumular requisições no processo.
+    """
+
+    def __init__(self, queue=None):
+        self.queue = queue or webhook_queue
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._listeners: List[Callable[[], None]] = []
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+
+    def on_enqueue(self, listener: Callable[[], None]):
+        """Avisar os workers locais de que há evento novo (sem esperar o próximo poll)"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    async def submit(self, instance: str, event_key: str, ordering_key: str, payload: Dict[str, Any]) -> bool:
+        """Gravar o evento; False se for reentrega de um evento já recebido"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(settings.webhook_intake_max_concurrency)
+
+        if self._slots.locked():
+            try:
+                await asyncio.wait_for(self._slots.acquire(), settings.webhook_intake_wait_seconds)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise WebhookBackpressure("fila de webhooks sem capacidade no momento")
+        else:
+            await self._slots.acquire()
+
+        try:
+            event = await self.queue.enqueue(instance, event_key, ordering_key, payload)
+        finally:
+            self._slots.release()
+
+        if event is None:
+            self.duplicates += 1
+            return False
+
+        self.accepted += 1
+        for listener in self._listeners:
+            listener()
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"accepted": self.accepted, "duplicates": self.duplicates, "rejected": self.rejected}
+
+
+webhook_intake = WebhookIntake()
+
+
+class WebhookBatch:
+    """Evento reservado por um worker mais os seguintes da mesma conversa que o handler absorveu
+
+    São concluídos juntos quando o handler termina e devolvidos à fila juntos se
+    ele falhar; enquanto isso a conversa fica reservada a este worker.
+    """
+
+    def __init__(self, queue, worker_id: str, head: Dict[str, Any]):
+        self.queue = queue
+        self.worker_id = worker_id
+        self.head = head
+        self.events: List[Dict[str, Any]] = [head]
+
+    async def absorb(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Reservar os eventos que chegaram depois da cabeça (lista vazia se não há novos); renova o lease do lote"""
+        followers = await self.queue.claim_followers(self.worker_id, self.head, limit)
+        self.events.extend(followers)
+        return followers
+
+
+class WebhookWorkerPool:
+    """Consome a fila de webhooks com até `WEBHOOK_WORKERS` eventos em paralelo
+
+    Reserva só o que cabe nas vagas livres (a fila durável absorve os picos) e
+    nunca mais de um evento por conversa, que é o que garante a ordem. O handler
+    recebe o evento e o `WebhookBatch` dele, para absorver os eventos seguintes
+    da conversa.
+    """
+
+    def __init__(self, handler: Callable[[Dict[str, Any], WebhookBatch], Awaitable[None]], queue=None, concurrency: int = None, worker_id: str = None):
+        self.handler = handler
+        self.queue = queue or webhook_queue
+        self.concurrency = concurrency or settings.webhook_workers
+        self.worker_id = worker_id or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self._running: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._last_purge = _now()
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def notify(self):
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+
+    async def run(self):
+        logger.info(f"📨 Workers de webhook {self.worker_id} iniciados ({self.concurrency} em paralelo)")
+
+        while not self._stopping:
+            free = self.concurrency - len(self._running)
+            events: List[Dict[str, Any]] = []
+            if free > 0:
+                try:
+                    events = await self.queue.claim(self.worker_id, free)
+                except Exception as e:
+                    logger.error(f"❌ Erro ao reservar eventos de webhook: {str(e)}")
+
+            for event in events:
+                task = asyncio.create_task(self.process(event))
+                self._running.add(task)
+                task.add_done_callback(self._finished)
+
+            await self._purge_old()
+
+            # Espera evento novo, vaga livre ou o próximo poll (eventos de outras réplicas e retentativas)
+            if not events or len(self._running) >= self.concurrency:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), settings.webhook_poll_interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def _finished(self, task: asyncio.Task):
+        self._running.discard(task)
+        # Vaga livre; o fim de um evento também libera o próximo da mesma conversa
+        self._wakeup.set()
+
+    async def process(self, event: Dict[str, Any]):
+        batch = WebhookBatch(self.queue, self.worker_id, event)
+        heartbeat = asyncio.create_task(self._heartbeat(batch))
+        try:
+            await self.handler(event, batch)
+        except Exception as e:
+            logger.error(f"❌ Evento de webhook {event['id']} falhou: {str(e)}", exc_info=True)
+            # Seguintes absorvidos voltam junto (a cabeça por último: a conversa só é liberada no fim)
+            for failed in reversed(batch.events):
+                try:
+                    if await self.queue.fail(failed, str(e)):
+                        self.retried += 1
+                    else:
+                        self.failed += 1
+                except Exception as fail_error:
+                    logger.error(f"❌ Erro ao registrar falha do evento {failed['id']}: {str(fail_error)}")
+            return
+        finally:
+            heartbeat.cancel()
+
+        for done in reversed(batch.events):
+            await self.queue.complete(done["id"])
+            self.processed += 1
+
+    async def _heartbeat(self, batch: WebhookBatch):
+        """Renovar o lease do lote enquanto o handler roda (geração e envio podem passar do lease)"""
+        interval = max(settings.webhook_lease_seconds / 3, 1)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.queue.heartbeat(self.worker_id, [event["id"] for event in batch.events])
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao renovar lease do evento {batch.head['id']}: {str(e)}")
+
+    async def _purge_old(self):
+        now = _now()
+        if now - self._last_purge < timedelta(hours=1):
+            return
+        self._last_purge = now
+        try:
+            await self.queue.purge(now - timedelta(hours=settings.webhook_retention_hours))
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao limpar eventos de webhook antigos: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._running),
+            "concurrency": self.concurrency,
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed
+        }
+
+
+_pool: Optional[WebhookWorkerPool] = None
+_pool_task: Optional[asyncio.Task] = None
+
+
+def start_webhook_workers(handler: Callable[[Dict[str, Any], WebhookBatch], Awaitable[None]], concurrency: int = None):
+    """Iniciar o pool de workers de webhook no processo atual"""
+    global _pool, _pool_task
+
+    concurrency = settings.webhook_workers if concurrency is None else concurrency
+    if concurrency <= 0:
+        return
+
+    _pool = WebhookWorkerPool(handler, concurrency=concurrency)
+    webhook_intake.on_enqueue(_pool.notify)
+    _pool_task = asyncio.create_task(_pool.run())
+
+
+async def stop_webhook_workers():
+    """Parar de reservar eventos e aguardar os que estão em processamento"""
+    global _pool, _pool_task
+
+    if _pool is None:
+        return
+
+    webhook_intake.remove_listener(_pool.notify)
+    _pool.stop()
+    await asyncio.gather(_pool_task, return_exceptions=True)
+    _pool = _pool_task = None
+
+
+def stats() -> Dict[str, Any]:
+    return {"intake": webhook_intake.stats(), "workers": _pool.stats() if _pool else None}
+
+
+metrics.register("webhook_queue", stats)
@@ -1,10 +1,12 @@
-from typing import List, Dict
+from typing import List, Dict, Set
 from fastapi import WebSocket
 
 class ConnectionManager:
     def __init__(self):
         # Maps client_id -> List of WebSockets
         self.active_connections: Dict[str, List[WebSocket]] = {}
+        # Maps conversation_id -> Set of client_ids inscritos
+        self.conversation_subscribers: Dict[str, Set[str]] = {}
 
     async def connect(self, websocket: WebSocket, client_id: str):
         await websocket.accept()
@@ -19,13 +21,51 @@ class ConnectionManager:
                 self.active_connections[client_id].remove(websocket)
             if not self.active_connections[client_id]:
                 del self.active_connections[client_id]
+                self._drop_subscriptions(client_id)
         print(f"Client {client_id} disconnected.")
 
+    def subscribe(self, client_id: str, conversation_id: str):
+        """Inscrever cliente para receber eventos incrementais de uma conversa"""
+        self.conversation_subscribers.setdefault(conversation_id, set()).add(client_id)
+
+    def unsubscribe(self, client_id: str, conversation_id: str):
+        subscribers = self.conversation_subscribers.get(conversation_id)
+        if subscribers is not None:
+            subscribers.discard(client_id)
+            if not subscribers:
+                del self.conversation_subscribers[conversation_id]
+
+    def _drop_subscriptions(self, client_id: str):
+        for conversation_id in list(self.conversation_subscribers):
+            self.unsubscribe(client_id, conversation_id)
+
+    async def handle_client_message(self, message: dict, client_id: str):
+        """Tratar mensagens enviadas pelo cliente (subscribe/unsubscribe de conversas)"""
+        message_type = message.get("type")
+        conversation_id = message.get("conversation_id")
+
+        if not conversation_id:
+            return
+
+        if message_type == "subscribe":
+            self.subscribe(client_id, conversation_id)
+        elif message_type == "unsubscribe":
+            self.unsubscribe(client_id, conversation_id)
+
     async def send_personal_message(self, message: dict, client_id: str):
         if client_id in self.active_connections:
             for connection in self.active_connections[client_id]:
                 await connection.send_json(message)
 
+    async def send_to_conversation(self, conversation_id: str, message: dict):
+        """Enviar evento apenas aos clientes inscritos na conversa (ex: message_delta)"""
+        for client_id in list(self.conversation_subscribers.get(conversation_id, ())):
+            for connection in list(self.active_connections.get(client_id, [])):
+                try:
+                    await connection.send_json(message)
+                except Exception as e:
+                    print(f"Error sending to {client_id}: {e}")
+
     async def broadcast(self, message: dict):
         """Broadcast to ALL connected clients (e.g. dashboard updates)"""
         for client_id, connections in self.active_connections.items():
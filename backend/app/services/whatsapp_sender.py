@@ -0,0 +1,597 @@
+import asyncio
+import itertools
+import logging
+import random
+import re
+import socket
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set
+import httpx
+from app.config import get_settings
+from app.database import get_supabase
+from app.services import metrics
+from app.services.rate_limiter import TokenBucket
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+# Status de entrega do WhatsApp (Evolution API v2 em texto, v1 numérico) → status do envio
+PROVIDER_STATUS = {
+    "ERROR": "failed", 0: "failed",
+    "PENDING": "queued", 1: "queued",
+    "SERVER_ACK": "sent", 2: "sent",
+    "DELIVERY_ACK": "delivered", 3: "delivered",
+    "READ": "read", 4: "read",
+    "PLAYED": "read", 5: "read"
+}
+# Um callback só avança o status (callbacks chegam fora de ordem)
+STATUS_RANK = {"queued": 0, "sent": 1, "delivered": 2, "read": 3, "failed": 4}
+
+PRIORITY_REPLY = 0
+PRIORITY_CAMPAIGN = 1
+
+
+class EvolutionError(Exception):
+    """Falha de envio pela Evolution API; `retryable` indica se vale tentar de novo"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retryable: bool = True, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _after(seconds: float) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds)).isoformat()
+
+
+def normalize_phone(phone: str) -> str:
+    """Número só com dígitos (remove JID, +, espaços e pontuação)"""
+    return re.sub(r"\D", "", phone.split("@", 1)[0])
+
+
+def retry_delay(attempts: int, retry_after: Optional[float] = None) -> float:
+    """Backoff exponencial com jitter (ou o Retry-After do servidor, com jitter)"""
+    if retry_after is not None:
+        return retry_after * random.uniform(1.0, 1.2)
+    delay = settings.whatsapp_send_retry_base_seconds * (2 ** max(attempts - 1, 0))
+    return min(delay, 60) * random.uniform(0.5, 1.5)
+
+
+class EvolutionClient:
+    """Cliente da Evolution API com pool de conexões compartilhado (um por processo)"""
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None, client: Optional[httpx.AsyncClient] = None):
+        self.base_url = (base_url or settings.evolution_api_url).rstrip("/")
+        self.api_key = settings.evolution_api_key if api_key is None else api_key
+        self._client = client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            connections = settings.whatsapp_send_max_connections
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"apikey": self.api_key},
+                timeout=settings.whatsapp_send_timeout_seconds,
+                limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+            )
+        return self._client
+
+    async def send_text(self, instance: str, phone: str, text: str) -> Optional[str]:
+        """Enviar texto; retorna o key.id da mensagem no WhatsApp"""
+        try:
+            response = await self.client.post(f"/message/sendText/{instance}", json={"number": phone, "text": text})
+        except httpx.HTTPError as e:
+            raise EvolutionError(f"{type(e).__name__}: {e}")
+
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = response.headers.get("Retry-After")
+            raise EvolutionError(
+                f"HTTP {response.status_code}",
+                status_code=response.status_code,
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None
+            )
+        if response.status_code >= 400:
+            raise EvolutionError(f"HTTP {response.status_code}: {response.text[:200]}", status_code=response.status_code, retryable=False)
+
+        data = response.json()
+        return (data.get("key") or {}).get("id") if isinstance(data, dict) else None
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class DeliveryLog:
+    """Registro dos envios e dos callbacks de status (`outbound_messages` / `outbound_status_events`)"""
+
+    async def create(self, messages: List["OutboundMessage"]):
+        supabase = get_supabase()
+
+        for start in range(0, len(messages), 500):
+            batch = messages[start:start + 500]
+            result = await supabase.table("outbound_messages").insert([
+                {
+                    "organization_id": message.organization_id,
+                    "message_id": message.message_id,
+                    "campaign_id": message.campaign_id,
+                    "instance": message.instance,
+                    "phone": message.phone,
+                    "content": message.text
+                }
+                for message in batch
+            ]).execute()
+            for message, row in zip(batch, result.data or []):
+                message.id = row["id"]
+
+    async def claim(self, worker_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Reservar envios de campanha pendentes (de qualquer réplica, inclusive encerradas)"""
+        supabase = get_supabase()
+
+        result = await supabase.rpc("claim_outbound_messages", {
+            "worker_id": worker_id,
+            "lease_seconds": settings.whatsapp_send_lease_seconds,
+            "max_messages": limit
+        }).execute()
+
+        return result.data or []
+
+    async def sent(self, message: "OutboundMessage"):
+        supabase = get_supabase()
+
+        await supabase.table("outbound_messages").update({
+            "status": "sent",
+            "attempts": message.attempts,
+            "provider_message_id": message.provider_message_id,
+            "error_message": None,
+            "sent_at": _now(),
+            "locked_by": None,
+            "locked_until": None
+        }).eq("id", message.id).execute()
+
+    async def failed(self, message: "OutboundMessage", error: str):
+        supabase = get_supabase()
+
+        await supabase.table("outbound_messages").update({
+            "status": "failed",
+            "attempts": message.attempts,
+            "error_message": error[:1000],
+            "locked_by": None,
+            "locked_until": None
+        }).eq("id", message.id).execute()
+
+    async def retry(self, message: "OutboundMessage", delay: float, error: str):
+        """Devolver o envio reservado para nova tentativa depois de `delay` (por qualquer réplica)"""
+        supabase = get_supabase()
+
+        await supabase.table("outbound_messages").update({
+            "attempts": message.attempts,
+            "error_message": error[:1000],
+            "run_after": _after(delay),
+            "locked_by": None,
+            "locked_until": None
+        }).eq("id", message.id).execute()
+
+    async def release(self, message_ids: List[str]):
+        """Liberar envios reservados que não chegaram a sair (encerramento da aplicação)"""
+        supabase = get_supabase()
+
+        await supabase.table("outbound_messages").update({
+            "locked_by": None,
+            "locked_until": None
+        }).in_("id", message_ids).eq("status", "queued").execute()
+
+    async def status(self, instance: str, provider_message_id: str, status: str, provider_status: Any, payload: Dict[str, Any]):
+        supabase = get_supabase()
+
+        event = supabase.table("outbound_status_events").insert({
+            "instance": instance,
+            "provider_message_id": provider_message_id,
+            "status": str(provider_status),
+            "payload": payload
+        }).execute()
+
+        update: Dict[str, Any] = {"status": status}
+        if status == "delivered":
+            update["delivered_at"] = _now()
+        elif status == "read":
+            update["read_at"] = _now()
+        elif status == "failed":
+            update["error_message"] = "Falha informada pelo WhatsApp"
+        previous = [name for name, rank in STATUS_RANK.items() if rank < STATUS_RANK[status]]
+        advance = supabase.table("outbound_messages").update(update).eq(
+            "instance", instance
+        ).eq("provider_message_id", provider_message_id).in_("status", previous).execute()
+
+        await asyncio.gather(event, advance)
+
+    async def campaign(self, campaign_id: str) -> List[Dict[str, Any]]:
+        supabase = get_supabase()
+
+        result = await supabase.table("outbound_messages").select("status").eq("campaign_id", campaign_id).execute()
+        return result.data or []
+
+
+@dataclass
+class OutboundMessage:
+    """Envio pendente na fila de uma instância"""
+    instance: str
+    phone: str
+    text: str
+    priority: int = PRIORITY_REPLY
+    organization_id: Optional[str] = None
+    message_id: Optional[str] = None
+    campaign_id: Optional[str] = None
+    id: Optional[str] = None
+    status: str = "queued"
+    attempts: int = 0
+    provider_message_id: Optional[str] = None
+    error: Optional[str] = None
+    # Reservado de `outbound_messages` (campanha): novas tentativas voltam para a tabela
+    claimed: bool = False
+    future: Optional[asyncio.Future] = field(default=None, repr=False)
+
+
+class SharedTokenBucket:
+    """Token bucket de uma instância guardado no Supabase (`take_send_token`)
+
+    O ritmo vale para a soma das réplicas. Se o banco não responder, cai para
+    um bucket local (ritmo por réplica) até a próxima aquisição.
+    """
+
+    def __init__(self, instance: str, rate: float, capacity: Optional[float] = None):
+        self.instance = instance
+        self.local = TokenBucket(rate, capacity)
+        self.rate = self.local.rate
+        self.capacity = self.local.capacity
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def per_minute(cls, instance: str, amount: float, burst: Optional[float] = None) -> "SharedTokenBucket":
+        return cls(instance, rate=amount / 60.0, capacity=burst)
+
+    async def acquire(self):
+        # Um pedido por vez por processo (ordem FIFO, como no TokenBucket)
+        async with self._lock:
+            while True:
+                try:
+                    wait = await self._take()
+                except Exception as e:
+                    logger.warning(f"⚠️ Ritmo compartilhado da instância {self.instance} indisponível, usando o local: {e}")
+                    await self.local.acquire()
+                    return
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+    async def _take(self) -> float:
+        """0 se consumiu um envio; senão, segundos até haver um"""
+        supabase = get_supabase()
+
+        result = await supabase.rpc("take_send_token", {
+            "bucket_instance": self.instance,
+            "rate_per_second": self.rate,
+            "burst": self.capacity
+        }).execute()
+
+        return float(result.data or 0)
+
+
+class _InstanceLane:
+    """Fila de envio de uma instância: prioridade (respostas antes de campanhas),
+    token bucket com o ritmo permitido pelo WhatsApp e poucas requisições simultâneas"""
+
+    def __init__(self, sender: "WhatsAppSender", instance: str):
+        self.sender = sender
+        self.instance = instance
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self.bucket = sender._bucket(instance)
+        self.slots = asyncio.Semaphore(settings.whatsapp_send_concurrency)
+        self._retrying: Dict[int, asyncio.TimerHandle] = {}
+        self._sequence = itertools.count()
+        self._running: Set[asyncio.Task] = set()
+        self._task = asyncio.create_task(self._run())
+
+    def put(self, message: OutboundMessage):
+        self.queue.put_nowait((message.priority, next(self._sequence), message))
+
+    def retry_later(self, message: OutboundMessage, delay: float):
+        key = next(self._sequence)
+
+        def requeue():
+            self._retrying.pop(key, None)
+            self.put(message)
+
+        self._retrying[key] = asyncio.get_running_loop().call_later(delay, requeue)
+
+    async def _run(self):
+        while True:
+            _, _, message = await self.queue.get()
+            await self.slots.acquire()
+            try:
+                await self.bucket.acquire()
+            except BaseException:
+                self.slots.release()
+                raise
+            task = asyncio.create_task(self.sender._attempt(self, message))
+            self._running.add(task)
+            task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task):
+        self._running.discard(task)
+        self.slots.release()
+
+    async def close(self) -> List[OutboundMessage]:
+        """Parar a fila; retorna os envios reservados de `outbound_messages` que não saíram"""
+        for handle in self._retrying.values():
+            handle.cancel()
+        self._retrying.clear()
+        self._task.cancel()
+        await asyncio.gather(self._task, *self._running, return_exceptions=True)
+
+        # Quem aguarda um envio que não vai mais sair não fica pendurado
+        leftovers = []
+        while not self.queue.empty():
+            _, _, message = self.queue.get_nowait()
+            if message.claimed:
+                leftovers.append(message)
+            elif message.future and not message.future.done():
+                message.future.cancel()
+        return leftovers
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": self.queue.qsize(), "sending": len(self._running), "retrying": len(self._retrying)}
+
+
+class WhatsAppSender:
+    """Envio de mensagens pelo WhatsApp (Evolution API)
+
+    - um `httpx.AsyncClient` (pool de conexões) para todas as instâncias
+    - uma fila por instância com limite de ritmo (`WHATSAPP_SEND_RATE_PER_MINUTE`);
+      respostas de atendimento passam na frente das campanhas
+    - falhas temporárias (rede, 429, 5xx) tentam de novo com backoff e jitter;
+      429 respeita o Retry-After
+    - cada envio é registrado em `outbound_messages`; os callbacks
+      `messages.update` atualizam o status (entregue, lida)
+
+    Com `WHATSAPP_SEND_BACKEND=supabase`, o ritmo por instância é um bucket
+    compartilhado pelas réplicas (`SharedTokenBucket`) e campanhas só são
+    gravadas em `outbound_messages`: cada réplica reserva com lease até
+    `WHATSAPP_CAMPAIGN_PREFETCH` envios por vez (`start`), então um deploy não
+    perde os que ainda não saíram. Com "memory", tudo fica no processo.
+    """
+
+    def __init__(self, client: Optional[EvolutionClient] = None, log: Optional[DeliveryLog] = None, backend: Optional[str] = None):
+        self.client = client or EvolutionClient()
+        self.log = log or DeliveryLog()
+        self.durable = (backend or settings.whatsapp_send_backend) != "memory"
+        self.worker_id = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self._lanes: Dict[str, _InstanceLane] = {}
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._claimed = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.status_updates = 0
+
+    def _bucket(self, instance: str):
+        if self.durable:
+            return SharedTokenBucket.per_minute(instance, settings.whatsapp_send_rate_per_minute, settings.whatsapp_send_burst)
+        return TokenBucket.per_minute(settings.whatsapp_send_rate_per_minute, settings.whatsapp_send_burst)
+
+    def _lane(self, instance: str) -> _InstanceLane:
+        lane = self._lanes.get(instance)
+        if lane is None:
+            lane = self._lanes[instance] = _InstanceLane(self, instance)
+        return lane
+
+    async def send(
+        self,
+        instance: str,
+        phone: str,
+        text: str,
+        organization_id: Optional[str] = None,
+        message_id: Optional[str] = None
+    ) -> OutboundMessage:
+        """Enviar uma resposta e aguardar o resultado (após as novas tentativas)"""
+        message = OutboundMessage(
+            instance=instance,
+            phone=normalize_phone(phone),
+            text=text,
+            organization_id=organization_id,
+            message_id=message_id,
+            future=asyncio.get_running_loop().create_future()
+        )
+        await self._register([message])
+        self._lane(instance).put(message)
+        return await message.future
+
+    async def send_bulk(
+        self,
+        instance: str,
+        phones: Iterable[str],
+        text: str,
+        organization_id: Optional[str] = None,
+        campaign_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Enfileirar uma campanha (mesma fila e limites das respostas, com prioridade menor)
+
+        No modo durável, os envios só são gravados; as réplicas os reservam no ritmo permitido.
+        """
+        campaign_id = campaign_id or str(uuid.uuid4())
+        recipients = list(dict.fromkeys(filter(None, (normalize_phone(phone) for phone in phones))))
+        messages = [
+            OutboundMessage(
+                instance=instance,
+                phone=phone,
+                text=text,
+                priority=PRIORITY_CAMPAIGN,
+                organization_id=organization_id,
+                campaign_id=campaign_id
+            )
+            for phone in recipients
+        ]
+
+        if self.durable:
+            # Sem o registro não há campanha: o erro sobe para a rota
+            await self.log.create(messages)
+            self._wakeup.set()
+        else:
+            await self._register(messages)
+            lane = self._lane(instance)
+            for message in messages:
+                lane.put(message)
+
+        logger.info(f"📣 Campanha {campaign_id}: {len(messages)} mensagens na fila da instância {instance}")
+        return {"campaign_id": campaign_id, "queued": len(messages)}
+
+    def start(self):
+        """Começar a reservar campanhas pendentes (inclusive as deixadas por réplicas encerradas)"""
+        if self.durable and self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def _dispatch(self):
+        prefetch = settings.whatsapp_campaign_prefetch
+        while True:
+            rows: List[Dict[str, Any]] = []
+            free = prefetch - self._claimed
+            if free > 0:
+                try:
+                    rows = await self.log.claim(self.worker_id, free)
+                except Exception as e:
+                    logger.error(f"❌ Erro ao reservar envios de campanha: {str(e)}")
+
+            for row in rows:
+                self._claimed += 1
+                self._lane(row["instance"]).put(OutboundMessage(
+                    instance=row["instance"],
+                    phone=row["phone"],
+                    text=row["content"],
+                    priority=PRIORITY_CAMPAIGN,
+                    organization_id=row.get("organization_id"),
+                    campaign_id=row.get("campaign_id"),
+                    id=row["id"],
+                    attempts=row.get("attempts") or 0,
+                    claimed=True
+                ))
+
+            # Espera campanha nova, vaga livre ou o próximo poll (campanhas de outras réplicas e retentativas)
+            if not rows or self._claimed >= prefetch:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), settings.whatsapp_campaign_poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    def _unclaim(self, message: OutboundMessage):
+        if message.claimed:
+            message.claimed = False
+            self._claimed -= 1
+            self._wakeup.set()
+
+    async def _register(self, messages: List[OutboundMessage]):
+        # Sem o registro o envio segue (o atendimento não depende do log)
+        try:
+            await self.log.create(messages)
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao registrar {len(messages)} envios do WhatsApp: {e}")
+
+    async def _attempt(self, lane: _InstanceLane, message: OutboundMessage):
+        message.attempts += 1
+        try:
+            message.provider_message_id = await self.client.send_text(message.instance, message.phone, message.text)
+        except EvolutionError as e:
+            if e.retryable and message.attempts < settings.whatsapp_send_max_attempts:
+                self.retries += 1
+                delay = retry_delay(message.attempts, e.retry_after)
+                if message.claimed:
+                    # Volta para a tabela: qualquer réplica tenta de novo depois do backoff
+                    try:
+                        await self.log.retry(message, delay, str(e))
+                    except Exception as retry_error:
+                        logger.warning(f"⚠️ Falha ao reagendar envio {message.id} (sai quando o lease vencer): {retry_error}")
+                    self._unclaim(message)
+                else:
+                    lane.retry_later(message, delay)
+                return
+            self.failed += 1
+            message.status, message.error = "failed", str(e)
+            logger.warning(f"⚠️ Envio para {message.phone} ({message.instance}) falhou após {message.attempts} tentativas: {e}")
+            await self._settle(message, self.log.failed(message, str(e)) if message.id else None)
+            return
+
+        self.sent += 1
+        message.status = "sent"
+        await self._settle(message, self.log.sent(message) if message.id else None)
+
+    async def _settle(self, message: OutboundMessage, record):
+        if record is not None:
+            try:
+                await record
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao registrar status do envio {message.id}: {e}")
+        self._unclaim(message)
+        if message.future and not message.future.done():
+            message.future.set_result(message)
+
+    async def record_status(self, instance: str, provider_message_id: str, provider_status: Any, payload: Dict[str, Any]) -> Optional[str]:
+        """Registrar um callback de status de entrega; retorna o status mapeado (ou None se ignorado)"""
+        status = PROVIDER_STATUS.get(provider_status)
+        if status is None or status == "queued":
+            return None
+        await self.log.status(instance, provider_message_id, status, provider_status, payload)
+        self.status_updates += 1
+        return status
+
+    async def campaign_status(self, campaign_id: str) -> Dict[str, int]:
+        """Contagem de envios da campanha por status"""
+        counts: Dict[str, int] = {}
+        for row in await self.log.campaign(campaign_id):
+            counts[row["status"]] = counts.get(row["status"], 0) + 1
+        return counts
+
+    async def close(self):
+        """Parar as filas e fechar o pool de conexões (encerramento da aplicação)
+
+        Envios de campanha reservados que não saíram são liberados para as outras réplicas.
+        """
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+
+        lanes, self._lanes = list(self._lanes.values()), {}
+        results = await asyncio.gather(*(lane.close() for lane in lanes), return_exceptions=True)
+        leftovers = [message.id for result in results if isinstance(result, list) for message in result]
+        if leftovers:
+            try:
+                await self.log.release(leftovers)
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao liberar {len(leftovers)} envios reservados (saem quando o lease vencer): {e}")
+        self._claimed = 0
+        await self.client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "status_updates": self.status_updates,
+            "claimed": self._claimed,
+            "instances": {instance: lane.stats() for instance, lane in self._lanes.items()}
+        }
+
+
+whatsapp_sender = WhatsAppSender()
+
+metrics.register("whatsapp_sender", whatsapp_sender.stats)
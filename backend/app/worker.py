@@ -0,0 +1,23 @@
+import asyncio
+import logging
+from app.config import get_settings
+from app.database import init_supabase, close_supabase
+from app.services.ingestion_queue import IngestionWorker
+
+settings = get_settings()
+
+
+async def main():
+    """Executar workers de ingestão em um processo separado da API"""
+    logging.basicConfig(level=logging.INFO)
+    await init_supabase()
+
+    workers = [IngestionWorker() for _ in range(max(settings.ingestion_workers, 1))]
+    try:
+        await asyncio.gather(*(worker.run() for worker in workers))
+    finally:
+        await close_supabase()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
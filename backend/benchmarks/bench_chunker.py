@@ -0,0 +1,176 @@
+"""
+Benchmark do chunking: divisor por caracteres (1000/200) x chunker estrutural.
+
+Gera corpora sintéticos de PDF, DOCX e CSV, extrai os blocos como na ingestão
+e reporta, para cada formato, número de chunks, tokens médios por chunk,
+tokens totais enviados ao embedding e throughput (MB/s de texto extraído).
+
+Uso (a partir de backend/):
+    python benchmarks/bench_chunker.py --pages 200 --rows 20000
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Configurações mínimas para importar o app sem .env
+for key in ("SUPABASE_URL", "SUPABASE_KEY", "SUPABASE_SERVICE_KEY", "GEMINI_API_KEY"):
+    os.environ.setdefault(key, "http://localhost" if key == "SUPABASE_URL" else "benchmark")
+
+from app.services.chunker import chunk_blocks, count_tokens, get_profile  # noqa: E402
+from app.services.document_processor import DocumentProcessor  # noqa: E402
+
+WORDS = (
+    "atendimento cliente pedido entrega prazo produto garantia troca devolução pagamento "
+    "cartão boleto pix frete desconto promoção estoque loja horário suporte contrato plano"
+).split()
+
+
+def sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+    return " ".join(words).capitalize() + "."
+
+
+def paragraph(rng: random.Random) -> str:
+    return " ".join(sentence(rng) for _ in range(rng.randint(2, 6)))
+
+
+def make_pdf(pages, rng: random.Random) -> bytes:
+    """PDF mínimo (Helvetica, linhas de ~90 caracteres) legível pelo PyPDF2"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages, preenchido ao final
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+
+    for _ in range(pages):
+        lines = []
+        for _ in range(rng.randint(3, 6)):
+            text = paragraph(rng)
+            # Quebrar em linhas de ~90 caracteres
+            while text:
+                lines.append(text[:90])
+                text = text[90:]
+            lines.append("")
+
+        stream = ["BT /F1 9 Tf 40 800 Td 11 TL"]
+        for line in lines:
+            safe = line.encode("latin-1", "replace").decode("latin-1").replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            stream.append(f"({safe}) '")
+        stream.append("ET")
+        content = "\n".join(stream).encode("latin-1")
+
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def make_docx(sections: int, rng: random.Random) -> bytes:
+    from docx import Document
+
+    doc = Document()
+    for s in range(sections):
+        doc.add_heading(f"Seção {s + 1}: {rng.choice(WORDS)}", level=1)
+        for _ in range(rng.randint(2, 5)):
+            doc.add_paragraph(paragraph(rng))
+    out = io.BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def make_csv(rows: int, rng: random.Random) -> bytes:
+    lines = ["sku,nome,categoria,preco,estoque"]
+    for i in range(rows):
+        lines.append(f"SKU-{i:06d},{rng.choice(WORDS)} {rng.choice(WORDS)},{rng.choice(WORDS)},{rng.uniform(5, 500):.2f},{rng.randint(0, 999)}")
+    return "\n".join(lines).encode("utf-8")
+
+
+def legacy_split(text: str, chunk_size: int = 1000, chunk_overlap: int = 200):
+    """Divisor anterior (caracteres, sobreposição fixa, corte no último ponto)"""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        if end < len(text):
+            last_period = text.rfind(".", start, end)
+            if last_period > start + chunk_size // 2:
+                end = last_period + 1
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        start = end - chunk_overlap
+    return chunks
+
+
+def report(name, chunks, seconds, text_bytes):
+    tokens = [count_tokens(c) for c in chunks]
+    total = sum(tokens)
+    print(
+        f"  {name:<11} chunks={len(chunks):>6}  tokens/chunk={total / max(len(chunks), 1):6.1f}  "
+        f"tokens totais={total:>8}  {text_bytes / seconds / 1e6:6.1f} MB/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200, help="páginas do PDF")
+    parser.add_argument("--sections", type=int, default=300, help="seções do DOCX")
+    parser.add_argument("--rows", type=int, default=20000, help="linhas do CSV")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    processor = DocumentProcessor()
+    corpora = {
+        "pdf": ("manual.pdf", make_pdf(args.pages, rng)),
+        "docx": ("politicas.docx", make_docx(args.sections, rng)),
+        "csv": ("catalogo.csv", make_csv(args.rows, rng)),
+    }
+
+    for doc_type, (filename, content) in corpora.items():
+        # Extração igual para os dois métodos (texto corrido para o divisor legado)
+        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(filename)[1]) as file:
+            file.write(content)
+            file.flush()
+            blocks = list(processor._extract_blocks(file.name, filename, doc_type))
+        text = "\n".join(block.text for block in blocks if block.text)
+        text_bytes = len(text.encode("utf-8"))
+
+        print(f"{doc_type.upper()} ({filename}, {len(content) / 1e6:.1f} MB arquivo, {text_bytes / 1e6:.1f} MB texto)")
+
+        started = time.perf_counter()
+        legacy = legacy_split(text)
+        report("caracteres", legacy, time.perf_counter() - started, text_bytes)
+
+        started = time.perf_counter()
+        structured = [chunk.text for chunk in chunk_blocks(iter(blocks), get_profile(doc_type))]
+        report("estrutural", structured, time.perf_counter() - started, text_bytes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark do tamanho do histórico no prompt ao longo de uma conversa longa.
+
+Simula um atendimento com mensagens de tamanhos variados e, a cada ponto da
+conversa, compara a seção "Histórico da Conversa" do prompt:
+
+  - anterior: 20 primeiras mensagens da conversa, 10 últimas delas literais, sem orçamento
+  - recentes: só a consulta corrigida (20 últimas mensagens, 10 literais), sem resumo
+  - memória:  resumo acumulado + mensagens não resumidas dentro de MEMORY_HISTORY_TOKEN_BUDGET
+
+O resumo é simulado com tamanho fixo (--summary-tokens), sem chamar o Gemini;
+os gatilhos seguem MEMORY_SUMMARY_THRESHOLD / MEMORY_SUMMARY_KEEP_RECENT.
+Também indica se a mensagem atual do cliente aparece no histórico.
+
+Uso (a partir de backend/):
+    python benchmarks/bench_conversation_memory.py --messages 200 --summary-tokens 150
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Configurações mínimas para importar o app sem .env
+for key in ("SUPABASE_URL", "SUPABASE_KEY", "SUPABASE_SERVICE_KEY", "GEMINI_API_KEY"):
+    os.environ.setdefault(key, "http://localhost" if key == "SUPABASE_URL" else "benchmark")
+
+from app.config import get_settings  # noqa: E402
+from app.services.ai_engine import AIEngine  # noqa: E402
+from app.services.chunker import count_tokens  # noqa: E402
+
+settings = get_settings()
+
+WORDS = (
+    "pedido entrega prazo produto garantia troca devolução pagamento cartão boleto pix frete "
+    "desconto estoque loja suporte contrato plano cadastro senha nota fiscal reembolso"
+).split()
+
+
+def make_conversation(count: int, rng: random.Random):
+    messages = []
+    for number in range(count):
+        sender = "client" if number % 2 == 0 else "ai"
+        words = rng.randint(5, 25) if sender == "client" else rng.randint(30, 120)
+        content = f"[{number}] " + " ".join(rng.choice(WORDS) for _ in range(words))
+        messages.append({"id": str(number), "sender": sender, "content": content})
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200, help="mensagens da conversa")
+    parser.add_argument("--summary-tokens", type=int, default=150, help="tamanho simulado do resumo")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    engine = AIEngine()
+    conversation = make_conversation(args.messages, rng)
+    summary_text = " ".join(rng.choice(WORDS) for _ in range(args.summary_tokens))
+
+    checkpoints = {n for n in (10, 20, 50, 100, 200, 500, 1000) if n <= args.messages} | {args.messages}
+    summarized = 0
+    old_total = recent_total = new_total = 0
+
+    print(f"{'mensagens':>9}   {'anterior (tokens)':>17} {'atual?':>6}   {'recentes (tokens)':>17}   {'memória (tokens)':>16} {'atual?':>6} {'resumidas':>9}")
+    for turn in range(1, args.messages + 1):
+        # Mensagem do cliente recém-gravada é a última da conversa
+        current = conversation[turn - 1]
+
+        old = engine._format_history(conversation[:turn][:20][-10:], max_messages=10, token_budget=10 ** 9)
+        old_tokens = count_tokens(old)
+
+        recent = engine._format_history(conversation[:turn][-20:], max_messages=10, token_budget=10 ** 9)
+        recent_tokens = count_tokens(recent)
+
+        pending = conversation[summarized:turn]
+        window = pending[-max(settings.memory_recent_messages, settings.memory_summary_threshold):]
+        new = engine._format_history(window, summary=summary_text if summarized else None)
+        new_tokens = count_tokens(new)
+
+        old_total += old_tokens
+        recent_total += recent_tokens
+        new_total += new_tokens
+
+        # Resumo em segundo plano (efetivado antes da próxima mensagem)
+        if len(pending) >= settings.memory_summary_threshold:
+            fold = min(settings.memory_summary_batch_size, len(pending) - settings.memory_summary_keep_recent)
+            summarized += max(fold, 0)
+
+        if turn in checkpoints:
+            print(
+                f"{turn:>9}   {old_tokens:>17} {'sim' if current['content'] in old else 'não':>6}   {recent_tokens:>17}   "
+                f"{new_tokens:>16} {'sim' if current['content'] in new else 'não':>6} {summarized:>9}"
+            )
+
+    print(f"\nTokens de histórico somados na conversa: anterior={old_total}  recentes={recent_total}  memória={new_total}  "
+          f"(orçamento {settings.memory_history_token_budget}, resumo {args.summary_tokens})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Benchmark do crawler de sites contra um servidor HTTP local (fixture).
+
+O servidor gera uma central de ajuda sintética: páginas com links entre si,
+sitemap.xml, robots.txt (com uma área bloqueada), ETag/304 e latência
+artificial por requisição. Compara:
+
+  - sequencial (uma página por vez, como chamar /crawl página a página)
+  - crawler com concorrência limitada
+  - re-rastreamento condicional (If-None-Match: páginas não modificadas = 304)
+
+Uso (a partir de backend/):
+    python benchmarks/bench_crawler.py --pages 300 --latency 0.05 --concurrency 16
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Configurações mínimas para importar o app sem .env
+for key in ("SUPABASE_URL", "SUPABASE_KEY", "SUPABASE_SERVICE_KEY", "GEMINI_API_KEY"):
+    os.environ.setdefault(key, "http://localhost" if key == "SUPABASE_URL" else "benchmark")
+
+from app.services.crawler import CrawlConfig, SiteCrawler  # noqa: E402
+
+
+def make_handler(pages: int, latency: float):
+    def page_html(number: int) -> str:
+        # Árvore: cada página aponta para 3 filhas, para a página inicial e para a área bloqueada
+        children = [child for child in (number * 3 + 1, number * 3 + 2, number * 3 + 3) if child < pages]
+        links = "".join(f'<li><a href="/ajuda/artigo-{child}#topo">Artigo {child}</a></li>' for child in children)
+        return (
+            f"<html><head><title>Artigo {number}</title></head><body>"
+            f'<nav><a href="/">Início</a> <a href="/privado/painel">Painel</a></nav>'
+            f"<h1>Artigo {number}</h1><p>Como resolver o problema {number} do seu pedido.</p>"
+            f"<ul>{links}</ul></body></html>"
+        )
+
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, para o pool de conexões do crawler fazer diferença
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency)
+            path = self.path.split("?")[0]
+
+            if path == "/robots.txt":
+                body = "User-agent: *\nDisallow: /privado/\nSitemap: http://{}/sitemap.xml\n".format(self.headers["Host"])
+                return self._send(200, body, "text/plain")
+
+            if path == "/sitemap.xml":
+                urls = "".join(
+                    f"<url><loc>http://{self.headers['Host']}/ajuda/artigo-{n}</loc></url>"
+                    for n in range(0, pages, 2)
+                )
+                body = f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'
+                return self._send(200, body, "application/xml")
+
+            if path == "/":
+                return self._send(200, page_html(0), "text/html; charset=utf-8")
+
+            if path.startswith("/ajuda/artigo-"):
+                number = int(path.rsplit("-", 1)[1])
+                if number < pages:
+                    return self._send(200, page_html(number), "text/html; charset=utf-8")
+
+            self._send(404, "não encontrado", "text/plain")
+
+        def _send(self, status: int, body: str, content_type: str):
+            data = body.encode("utf-8")
+            etag = '"' + hashlib.md5(data).hexdigest() + '"'
+            if status == 200 and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+async def run(seed: str, concurrency: int, pages: int, validators=None):
+    crawler = SiteCrawler(
+        CrawlConfig(
+            seed_url=seed,
+            max_depth=10,
+            max_pages=pages * 2,
+            concurrency=concurrency,
+            requests_per_second_per_host=10000.0
+        ),
+        validators=validators
+    )
+    started = time.perf_counter()
+    results = [page async for page in crawler.crawl()]
+    return results, time.perf_counter() - started, crawler.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=300, help="páginas do site de teste")
+    parser.add_argument("--latency", type=float, default=0.05, help="latência do servidor por requisição (s)")
+    parser.add_argument("--concurrency", type=int, default=16, help="downloads simultâneos do crawler")
+    args = parser.parse_args()
+
+    # Fila de conexões maior que o padrão (5), senão conexões simultâneas esperam retransmissão de SYN
+    ThreadingHTTPServer.request_queue_size = 256
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.pages, args.latency))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    seed = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    try:
+        sequential, seconds, _ = asyncio.run(run(seed, 1, args.pages))
+        print(f"sequencial      {len(sequential):>5} páginas  {seconds:6.2f}s  {len(sequential) / seconds:7.1f} páginas/s")
+
+        crawled, seconds, stats = asyncio.run(run(seed, args.concurrency, args.pages))
+        print(f"concorrente x{args.concurrency:<2} {len(crawled):>5} páginas  {seconds:6.2f}s  {len(crawled) / seconds:7.1f} páginas/s  {stats}")
+
+        # Todas as páginas descobertas, nenhuma da área bloqueada pelo robots.txt, sem duplicatas
+        urls = [page.url for page in crawled]
+        assert len(urls) == len(set(urls)) == args.pages + 1, (len(urls), len(set(urls)))
+        assert not any("/privado/" in url for url in urls)
+
+        known = {page.url: {"etag": page.etag, "links": page.links} for page in crawled}
+
+        async def validators(url):
+            return known.get(url)
+
+        recrawled, seconds, stats = asyncio.run(run(seed, args.concurrency, args.pages, validators))
+        unchanged = sum(1 for page in recrawled if page.status == 304)
+        print(f"condicional x{args.concurrency:<2} {len(recrawled):>5} páginas  {seconds:6.2f}s  {unchanged} não modificadas (304)")
+        assert unchanged == len(recrawled) == len(crawled)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
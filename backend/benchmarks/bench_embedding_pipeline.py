@@ -0,0 +1,79 @@
+"""
+Benchmark do pipeline de embeddings em lote contra um backend simulado.
+
+O backend simulado responde cada requisição após `--latency` segundos (independente
+do tamanho do lote, como o batchEmbedContents). O resultado é comparado com a taxa
+do fluxo anterior: uma chamada por chunk seguida de `asyncio.sleep(2)`.
+
+Uso (a partir de backend/):
+    python benchmarks/bench_embedding_pipeline.py --chunks 2000 --latency 0.3 --rpm 120
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Configurações mínimas para importar o app sem .env
+for key in ("SUPABASE_URL", "SUPABASE_KEY", "SUPABASE_SERVICE_KEY", "GEMINI_API_KEY"):
+    os.environ.setdefault(key, "http://localhost" if key == "SUPABASE_URL" else "benchmark")
+
+from app.services.embedding_pipeline import EmbeddingPipeline  # noqa: E402
+from app.services.rate_limiter import TokenBucket  # noqa: E402
+
+DIMENSIONS = 768
+LEGACY_SLEEP = 2.0
+
+
+def make_stub_backend(latency: float, counter: dict):
+    async def embed(texts, task_type):
+        counter["requests"] += 1
+        await asyncio.sleep(latency)
+        return [[0.0] * DIMENSIONS for _ in texts]
+
+    return embed
+
+
+async def run(args) -> float:
+    counter = {"requests": 0}
+    pipeline = EmbeddingPipeline(
+        embed_fn=make_stub_backend(args.latency, counter),
+        batch_size=args.batch_size,
+        max_in_flight=args.in_flight,
+        rate_limiter=TokenBucket.per_minute(args.rpm, burst=args.in_flight)
+    )
+    chunks = (f"chunk {i} " * 50 for i in range(args.chunks))
+
+    start = time.perf_counter()
+    done = 0
+    async for _, texts, embeddings in pipeline.run(chunks):
+        assert embeddings is not None
+        done += len(texts)
+    elapsed = time.perf_counter() - start
+
+    assert done == args.chunks
+    print(f"Requisições ao backend: {counter['requests']}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.3, help="Latência simulada por requisição (s)")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--in-flight", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=120, help="Limite de requisições por minuto")
+    args = parser.parse_args()
+
+    elapsed = asyncio.run(run(args))
+    legacy_rate = 1 / (args.latency + LEGACY_SLEEP)
+
+    print(f"Chunks: {args.chunks} | lote: {args.batch_size} | em voo: {args.in_flight} | {args.rpm:.0f} req/min")
+    print(f"Pipeline em lote : {elapsed:8.2f} s  ({args.chunks / elapsed:8.1f} chunks/s)")
+    print(f"Fluxo anterior   : {args.chunks / legacy_rate:8.2f} s  ({legacy_rate:8.1f} chunks/s, estimado)")
+
+
+if __name__ == "__main__":
+    main()
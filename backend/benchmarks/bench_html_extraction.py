@@ -0,0 +1,132 @@
+"""
+Benchmark da extração de HTML: BeautifulSoup (html.parser) x lxml com remoção de boilerplate.
+
+Sobre um corpus de páginas HTML salvas (--corpus DIR, arquivos *.html) ou, sem
+ele, páginas sintéticas de central de ajuda com menu, banner de cookies,
+barra lateral, rodapé com termos e layouts com e sem <article>. Reporta por
+backend: páginas/s, chunks e tokens por página e, no corpus sintético, a
+fração do artigo preservada e a fração de boilerplate que vazou para os chunks.
+
+Uso (a partir de backend/):
+    python benchmarks/bench_html_extraction.py --pages 500
+    python benchmarks/bench_html_extraction.py --corpus ~/paginas-salvas
+"""
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Configurações mínimas para importar o app sem .env
+for key in ("SUPABASE_URL", "SUPABASE_KEY", "SUPABASE_SERVICE_KEY", "GEMINI_API_KEY"):
+    os.environ.setdefault(key, "http://localhost" if key == "SUPABASE_URL" else "benchmark")
+
+from app.services.chunker import chunk_blocks, count_tokens, get_profile  # noqa: E402
+from app.services.html_extractor import LxmlExtractor, SoupExtractor  # noqa: E402
+
+WORDS = (
+    "pedido entrega prazo produto garantia troca devolução pagamento cartão boleto pix frete "
+    "desconto estoque loja suporte contrato plano cadastro senha nota fiscal reembolso"
+).split()
+
+BOILERPLATE = [
+    "Usamos cookies para melhorar sua experiência. Ao continuar navegando você concorda com a política de privacidade.",
+    "Todos os direitos reservados. Loja Exemplo Comércio Eletrônico LTDA, CNPJ 00.000.000/0001-00.",
+    "Receba ofertas exclusivas: cadastre seu e-mail na nossa newsletter semanal.",
+    "Compartilhe este artigo no WhatsApp, Facebook ou Twitter.",
+    "Artigos relacionados: como rastrear meu pedido, como trocar um produto, formas de pagamento.",
+]
+NAV = ["Início", "Produtos", "Ofertas", "Central de ajuda", "Minha conta", "Carrinho", "Fale conosco"]
+
+
+def sentence(rng: random.Random, marker: int) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(10, 18))]
+    return f"Artigo{marker} " + " ".join(words) + ", conforme a política vigente."
+
+
+def make_page(number: int, rng: random.Random):
+    """(html, frases do artigo) — metade das páginas sem <article>/<main>"""
+    sections = []
+    sentences = []
+    for s in range(rng.randint(2, 5)):
+        paragraphs = []
+        for _ in range(rng.randint(2, 4)):
+            text = [sentence(rng, number) for _ in range(rng.randint(2, 4))]
+            sentences.extend(text)
+            paragraphs.append("<p>" + " ".join(text) + "</p>")
+        sections.append(f"<h2>Seção {s + 1}</h2>" + "".join(paragraphs))
+
+    nav = "".join(f'<li><a href="/{item.lower()}">{item}</a></li>' for item in NAV)
+    related = "".join(f'<li><a href="/ajuda/{n}">Artigo relacionado {n}</a></li>' for n in range(8))
+    content = f"<h1>Como resolver o problema {number}</h1>" + "".join(sections)
+    if number % 2:
+        main = f'<article class="post">{content}</article>'
+    else:
+        main = f'<div id="conteudo"><div class="texto">{content}</div></div>'
+
+    html = (
+        "<!DOCTYPE html><html><head><title>Ajuda | Loja Exemplo</title>"
+        "<style>body{font-family:sans-serif}</style><script>window.dataLayer=[];</script></head><body>"
+        f'<div class="cookie-banner">{BOILERPLATE[0]} <button>Aceitar</button></div>'
+        f'<header class="site-header"><a href="/">Loja Exemplo</a><nav><ul>{nav}</ul></nav></header>'
+        '<div class="breadcrumbs"><a href="/">Início</a> › <a href="/ajuda">Ajuda</a></div>'
+        f'<div class="layout">{main}'
+        f'<div class="sidebar"><h3>Mais lidos</h3><ul>{related}</ul><p>{BOILERPLATE[4]}</p></div></div>'
+        f'<div class="share-buttons">{BOILERPLATE[3]}</div>'
+        f'<div class="newsletter"><p>{BOILERPLATE[2]}</p><form><input name="email"></form></div>'
+        f'<footer class="site-footer"><p>{BOILERPLATE[1]}</p></footer>'
+        "</body></html>"
+    )
+    return html, sentences
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=500, help="páginas sintéticas (sem --corpus)")
+    parser.add_argument("--corpus", help="diretório com páginas HTML salvas")
+    args = parser.parse_args()
+
+    if args.corpus:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(os.path.expanduser(args.corpus), "**", "*.htm*"), recursive=True)):
+            with open(path, encoding="utf-8", errors="ignore") as file:
+                pages.append((file.read(), None))
+        print(f"Corpus: {len(pages)} páginas de {args.corpus}")
+    else:
+        rng = random.Random(7)
+        pages = [make_page(n, rng) for n in range(args.pages)]
+        print(f"Corpus sintético: {len(pages)} páginas")
+
+    total_bytes = sum(len(html.encode("utf-8")) for html, _ in pages)
+    profile = get_profile("html")
+
+    for extractor in (SoupExtractor(), LxmlExtractor()):
+        started = time.perf_counter()
+        extracted = [extractor.extract(html) for html, _ in pages]
+        seconds = time.perf_counter() - started
+
+        chunks = tokens = 0
+        recall = leaked = 0.0
+        for (html, sentences), blocks in zip(pages, extracted):
+            texts = [chunk.text for chunk in chunk_blocks(iter(blocks), profile)]
+            chunks += len(texts)
+            tokens += sum(count_tokens(text) for text in texts)
+            if sentences is not None:
+                joined = "\n".join(block.text for block in blocks)
+                recall += sum(1 for s in sentences if s in joined) / len(sentences)
+                leaked += sum(1 for b in BOILERPLATE if b in joined) / len(BOILERPLATE)
+
+        line = (
+            f"  {extractor.name:<5} {len(pages) / seconds:8.1f} páginas/s  {total_bytes / seconds / 1e6:6.1f} MB/s  "
+            f"chunks/página={chunks / len(pages):5.2f}  tokens/página={tokens / len(pages):7.1f}"
+        )
+        if not args.corpus:
+            line += f"  artigo preservado={recall / len(pages):6.1%}  boilerplate={leaked / len(pages):6.1%}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
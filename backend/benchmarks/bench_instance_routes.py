@@ -0,0 +1,140 @@
+"""
+Benchmark do roteamento instância → organização dos eventos do WhatsApp.
+
+Cliente Supabase em memória com latência fixa por consulta (--db-latency) e
+--instances integrações WhatsApp. Resolve a organização de --events eventos
+distribuídos entre as instâncias (mais alguns de instâncias desconhecidas),
+com --concurrency eventos em paralelo, como os workers de webhook. Compara:
+
+  - consulta por evento: `integrations ... eq("config->>instance", ...)` (fluxo anterior)
+  - `instance_routes`:   tabela em memória, com invalidação a cada --invalidate-every
+                         eventos (simula gravações nas rotas de integrações)
+
+Reporta consultas ao banco, tempo total e latência por evento.
+
+Uso (a partir de backend/):
+    python benchmarks/bench_instance_routes.py --events 5000 --instances 200 --db-latency 0.01
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Configurações mínimas para importar o app sem .env
+for key in ("SUPABASE_URL", "SUPABASE_KEY", "SUPABASE_SERVICE_KEY", "GEMINI_API_KEY"):
+    os.environ.setdefault(key, "http://localhost" if key == "SUPABASE_URL" else "benchmark")
+
+import app.database as database  # noqa: E402
+from app.services.instance_routes import InstanceRoutes  # noqa: E402
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    """Consulta encadeável mínima sobre `integrations`: filtra só pela instância"""
+
+    def __init__(self, client):
+        self.client, self.instance = client, None
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def eq(self, column, value):
+        if column == "config->>instance":
+            self.instance = value
+        return self
+
+    async def execute(self):
+        self.client.queries += 1
+        await asyncio.sleep(self.client.latency)
+        rows = self.client.rows
+        if self.instance is not None:
+            rows = [row for row in rows if row["config"]["instance"] == self.instance]
+        return _Response(rows)
+
+
+class FakeSupabase:
+    def __init__(self, instances: int, latency: float):
+        self.latency = latency
+        self.queries = 0
+        self.rows = [
+            {"id": f"int-{number}", "organization_id": f"org-{number}", "config": {"instance": f"loja-{number}"}}
+            for number in range(instances)
+        ]
+
+    def table(self, name):
+        return _Query(self)
+
+
+async def per_event(instance: str):
+    supabase = database.supabase
+    result = await supabase.table("integrations").select("organization_id").eq("type", "whatsapp").eq(
+        "config->>instance", instance
+    ).limit(1).execute()
+    return result.data[0]["organization_id"] if result.data else None
+
+
+async def run(events, args, resolve, on_event=None):
+    supabase = database.supabase = FakeSupabase(args.instances, args.db_latency)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def handle(number, instance):
+        async with semaphore:
+            if on_event:
+                on_event(number)
+            started = time.perf_counter()
+            await resolve(instance)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handle(number, instance) for number, instance in enumerate(events)))
+    return supabase.queries, time.perf_counter() - started, latencies
+
+
+def report(name: str, queries: int, seconds: float, latencies):
+    latencies = sorted(latencies)
+    print(
+        f"{name:<20} consultas={queries:>5}  total={seconds:6.2f}s  "
+        f"p50={statistics.median(latencies):6.2f}ms  p99={latencies[int(len(latencies) * 0.99) - 1]:6.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=5000, help="eventos a rotear")
+    parser.add_argument("--instances", type=int, default=200, help="integrações WhatsApp")
+    parser.add_argument("--unknown", type=float, default=0.02, help="fração de eventos de instâncias desconhecidas")
+    parser.add_argument("--concurrency", type=int, default=8, help="WEBHOOK_WORKERS")
+    parser.add_argument("--invalidate-every", type=int, default=1000, help="eventos entre gravações em integrações")
+    parser.add_argument("--db-latency", type=float, default=0.01, help="latência por consulta ao Supabase (s)")
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    events = [
+        f"desconhecida-{rng.randrange(20)}" if rng.random() < args.unknown else f"loja-{rng.randrange(args.instances)}"
+        for _ in range(args.events)
+    ]
+
+    report("consulta por evento", *asyncio.run(run(events, args, per_event)))
+
+    routes = InstanceRoutes(ttl=300.0, negative_ttl=30.0)
+
+    def on_event(number):
+        if number and number % args.invalidate_every == 0:
+            routes.invalidate()
+
+    report("instance_routes", *asyncio.run(run(events, args, routes.resolve, on_event)))
+    print(f"  {routes.stats()}")
+
+
+if __name__ == "__main__":
+    main()
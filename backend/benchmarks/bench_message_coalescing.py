@@ -0,0 +1,222 @@
+"""
+Benchmark do agrupamento de mensagens seguidas do WhatsApp em um turno da IA.
+
+Cada conversa manda uma rajada de 2 a --burst mensagens curtas, com intervalo
+aleatório entre elas (--gap), para a fila de webhooks em memória, consumida por
+--replicas pools de workers (`handle_webhook_event`, como em produção com várias
+réplicas). Cliente Supabase em memória com latência fixa (--db-latency),
+embedding e Gemini simulados (--llm-latency). Compara:
+
+  - uma resposta por mensagem: sem janela nem absorção, um turno por mensagem (fluxo anterior)
+  - agrupamento:               MESSAGE_COALESCE_WINDOW_SECONDS, absorvendo da fila as
+                               mensagens seguintes da conversa
+
+Reporta chamadas ao Gemini (iniciadas e concluídas), respostas gravadas por
+rajada e o tempo entre a última mensagem da rajada e a resposta que a cobre.
+
+Uso (a partir de backend/):
+    python benchmarks/bench_message_coalescing.py --conversations 100 --burst 4 --gap 0.2 1.0 --llm-latency 1.0 --replicas 2
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Configurações mínimas para importar o app sem .env
+for key in ("SUPABASE_URL", "SUPABASE_KEY", "SUPABASE_SERVICE_KEY", "GEMINI_API_KEY"):
+    os.environ.setdefault(key, "http://localhost" if key == "SUPABASE_URL" else "benchmark")
+os.environ.setdefault("VECTOR_INDEX_ENABLED", "false")
+os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "false")
+
+import app.database as database  # noqa: E402
+from app.routers import webhooks  # noqa: E402
+from app.services.ai_engine import AIEngine  # noqa: E402
+from app.services.embedding_cache import query_embedding_cache  # noqa: E402
+from app.services.instance_routes import InstanceRoute  # noqa: E402
+from app.services.message_coalescer import MessageCoalescer  # noqa: E402
+from app.services.webhook_queue import InMemoryWebhookQueue, WebhookWorkerPool  # noqa: E402
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    """Consulta encadeável mínima: cada `.execute()` custa `latency` segundos"""
+
+    def __init__(self, client, table):
+        self.client, self.table, self.payload, self.filters = client, table, None, {}
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def insert(self, payload, **kwargs):
+        self.payload = payload
+        return self
+
+    upsert = insert
+
+    async def execute(self):
+        await asyncio.sleep(self.client.latency)
+        if self.payload is not None:
+            row = {"id": str(uuid.uuid4()), "created_at": "2026-01-01T00:00:00+00:00", **self.payload}
+            if self.table == "messages" and self.payload.get("sender") == "ai":
+                self.client.replies.setdefault(self.payload["conversation_id"], []).append(time.perf_counter())
+            return _Response([row])
+        if self.table == "conversations" and "client_phone" in self.filters:
+            phone = self.filters["client_phone"]
+            return _Response([{"id": phone, "organization_id": "org", "handled_by": "ai"}])
+        return _Response([])
+
+
+class FakeSupabase:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.replies = {}
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def rpc(self, name, params=None):
+        return _Query(self, name)
+
+
+class _Text:
+    text = "Certo! Já verifiquei seu pedido."
+
+
+class LLMCounter:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.started = self.completed = 0
+
+    def install(self):
+        async def embed(text):
+            await asyncio.sleep(0.05)
+            return [0.1] * 768
+
+        async def generate(engine, organization_id, prompt):
+            self.started += 1
+            await asyncio.sleep(self.latency)
+            self.completed += 1
+            return _Text()
+
+        query_embedding_cache.embed = embed
+        AIEngine._generate = generate
+
+
+class NoopSender:
+    """Envio pelo WhatsApp fora da medição"""
+
+    async def send(self, *args, **kwargs):
+        return None
+
+
+class StaticRoutes:
+    async def resolve(self, instance):
+        return InstanceRoute(instance=instance, organization_id="org", integration_id="bench")
+
+
+async def conversation(queue: InMemoryWebhookQueue, pools, phone: str, gaps):
+    """Mensagens de uma conversa chegando à fila nos instantes planejados; devolve a chegada da última"""
+    arrival = time.perf_counter()
+    for number, gap in enumerate(gaps):
+        arrival += gap
+        await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+        await queue.enqueue("bench", f"{phone}-{number}", f"bench:{phone}", {"phone": phone, "text": f"mensagem {number}"})
+        for pool in pools:
+            pool.notify()
+    return arrival
+
+
+async def run(bursts, args, window: float):
+    supabase = FakeSupabase(args.db_latency)
+    database.supabase = supabase
+    llm = LLMCounter(args.llm_latency)
+    llm.install()
+
+    coalescer = MessageCoalescer(window=window, max_wait=args.max_wait if window else 0)
+    webhooks.message_coalescer = coalescer
+    webhooks.whatsapp_sender = NoopSender()
+    webhooks.instance_routes = StaticRoutes()
+
+    async def per_message(event, batch):
+        # Fluxo anterior: sem absorver as mensagens seguintes da conversa
+        await webhooks.handle_webhook_event(event)
+
+    # Réplicas consumindo a mesma fila (cada uma com seus workers)
+    handler = webhooks.handle_webhook_event if window else per_message
+    queue = InMemoryWebhookQueue()
+    pools = [
+        WebhookWorkerPool(handler, queue=queue, concurrency=args.workers, worker_id=f"replica-{number}")
+        for number in range(args.replicas)
+    ]
+    pool_tasks = [asyncio.create_task(pool.run()) for pool in pools]
+
+    started = time.perf_counter()
+    last_messages = await asyncio.gather(*(
+        conversation(queue, pools, phone, gaps) for phone, gaps in bursts.items()
+    ))
+    while any(event["status"] in ("queued", "running") for event in queue.events.values()):
+        await asyncio.sleep(0.01)
+    seconds = time.perf_counter() - started
+
+    for pool in pools:
+        pool.stop()
+    await asyncio.gather(*pool_tasks)
+
+    latencies = [
+        (supabase.replies[phone][-1] - last) * 1000
+        for phone, last in zip(bursts, last_messages) if supabase.replies.get(phone)
+    ]
+    replies = sum(len(times) for times in supabase.replies.values())
+    return llm, replies, latencies, seconds, coalescer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=100, help="conversas simultâneas")
+    parser.add_argument("--burst", type=int, default=4, help="máximo de mensagens por rajada")
+    parser.add_argument("--gap", type=float, nargs=2, default=(0.2, 1.0), help="intervalo entre mensagens (s)")
+    parser.add_argument("--window", type=float, default=1.5, help="MESSAGE_COALESCE_WINDOW_SECONDS")
+    parser.add_argument("--max-wait", type=float, default=6.0, help="MESSAGE_COALESCE_MAX_WAIT_SECONDS")
+    parser.add_argument("--replicas", type=int, default=2, help="réplicas consumindo a mesma fila")
+    parser.add_argument("--workers", type=int, default=32, help="WEBHOOK_WORKERS por réplica")
+    parser.add_argument("--db-latency", type=float, default=0.02, help="latência por consulta ao Supabase (s)")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="latência da geração (s)")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    bursts = {
+        f"55119{number:08d}": [rng.uniform(0, 1)] + [rng.uniform(*args.gap) for _ in range(rng.randint(1, args.burst - 1))]
+        for number in range(args.conversations)
+    }
+    messages = sum(len(gaps) for gaps in bursts.values())
+    print(f"{messages} mensagens em {len(bursts)} rajadas")
+
+    for window in (0.0, args.window):
+        llm, replies, latencies, seconds, coalescer = asyncio.run(run(bursts, args, window))
+        name = f"agrupamento {window}s" if window else "por mensagem"
+        print(
+            f"{name:<17} Gemini iniciadas={llm.started:>4} concluídas={llm.completed:>4}  "
+            f"respostas={replies:>4} ({replies / len(bursts):.2f}/rajada)  "
+            f"última msg→resposta p50={statistics.median(latencies):6.0f}ms "
+            f"máx={max(latencies):6.0f}ms  total {seconds:5.1f}s"
+        )
+        if window:
+            print(f"  {coalescer.stats()}")
+
+
+if __name__ == "__main__":
+    main()
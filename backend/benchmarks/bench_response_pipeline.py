@@ -0,0 +1,180 @@
+"""
+Benchmark da montagem do contexto das respostas (etapas em série x em paralelo).
+
+Usa um cliente Supabase em memória com latência fixa por consulta (--db-latency)
+e simula o embedding da pergunta (--embed-latency) e o Gemini (--llm-latency).
+Para cada resposta mede o tempo de POST /conversations/{id}/messages:
+
+  - série:    gravação, conversa, histórico, embedding, versões, recuperação,
+              regras e geração uma após a outra (fluxo anterior)
+  - paralelo: `send_message` atual (fan-out com tempo limite por etapa)
+
+com caches de regras/versões quentes e frios. Por fim repete o paralelo com a
+recuperação mais lenta que RESPONSE_RETRIEVAL_TIMEOUT_SECONDS para mostrar a
+degradação (resposta sem base de conhecimento, no tempo limite).
+
+Uso (a partir de backend/):
+    python benchmarks/bench_response_pipeline.py --replies 50 --db-latency 0.03 --embed-latency 0.15 --llm-latency 0.8
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Configurações mínimas para importar o app sem .env
+for key in ("SUPABASE_URL", "SUPABASE_KEY", "SUPABASE_SERVICE_KEY", "GEMINI_API_KEY"):
+    os.environ.setdefault(key, "http://localhost" if key == "SUPABASE_URL" else "benchmark")
+# Recuperação direto pelas RPCs (sem carregar o índice vetorial local)
+os.environ.setdefault("VECTOR_INDEX_ENABLED", "false")
+os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "false")
+
+import app.database as database  # noqa: E402
+from app.config import get_settings  # noqa: E402
+from app.routers import chat  # noqa: E402
+from app.services.ai_engine import AIEngine  # noqa: E402
+from app.services.conversation_memory import conversation_memory  # noqa: E402
+from app.services.embedding_cache import query_embedding_cache  # noqa: E402
+from app.services.retrieval import retrieve  # noqa: E402
+from app.services.rules_cache import rules_cache  # noqa: E402
+from app.services.semantic_cache import knowledge_versions  # noqa: E402
+
+settings = get_settings()
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    """Consulta encadeável mínima: cada `.execute()` custa `latency` segundos"""
+
+    def __init__(self, client, table):
+        self.client, self.table, self.payload, self.is_single = client, table, None, False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def insert(self, payload, **kwargs):
+        self.payload = payload
+        return self
+
+    def single(self):
+        self.is_single = True
+        return self
+
+    async def execute(self):
+        await asyncio.sleep(self.client.latencies.get(self.table, self.client.latency))
+        if self.payload is not None:
+            return _Response([{"id": str(uuid.uuid4()), "created_at": "2026-01-01T00:00:00+00:00", **self.payload}])
+        if self.table == "conversations" and self.is_single:
+            return _Response({"id": "bench", "organization_id": "org", "handled_by": "ai"})
+        if self.table == "documents_rpc":
+            return _Response([{"id": "doc", "content": "Prazo de entrega: 5 dias úteis.", "similarity": 0.9}])
+        return _Response([])
+
+
+class FakeSupabase:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.latencies = {}
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def rpc(self, name, params=None):
+        return _Query(self, "documents_rpc" if name.startswith("search_documents") else name)
+
+
+class _Text:
+    text = "Seu pedido chega em até 5 dias úteis."
+
+
+def install_stubs(embed_latency: float, llm_latency: float):
+    async def embed(text):
+        await asyncio.sleep(embed_latency)
+        return [0.1] * 768
+
+    async def generate(self, organization_id, prompt):
+        await asyncio.sleep(llm_latency)
+        return _Text()
+
+    query_embedding_cache.embed = embed
+    AIEngine._generate = generate
+
+
+async def sequential_reply(engine: AIEngine, supabase, conversation_id: str, content: str) -> str:
+    """Fluxo anterior: cada etapa espera a anterior"""
+    await supabase.table("messages").insert({"conversation_id": conversation_id, "content": content, "sender": "client"}).execute()
+    conversation = await supabase.table("conversations").select("*").eq("id", conversation_id).single().execute()
+    history = await conversation_memory.fetch_recent(conversation_id)
+    embedding = await query_embedding_cache.embed(content)
+    await knowledge_versions.get(conversation.data["organization_id"])
+    documents = await retrieve(conversation.data["organization_id"], content, embedding, limit=3, threshold=0.7)
+    rules = await engine._get_business_rules(conversation.data["organization_id"])
+    prompt = engine._build_prompt(content, "\n".join(doc["content"] for doc in documents), rules, history)
+    answer = (await engine._generate(conversation.data["organization_id"], prompt)).text
+    await supabase.table("messages").insert({"conversation_id": conversation_id, "content": answer, "sender": "ai"}).execute()
+    return answer
+
+
+async def measure(replies: int, reply, cold: bool):
+    durations = []
+    for number in range(replies):
+        if cold:
+            rules_cache.invalidate()
+            knowledge_versions.invalidate()
+        started = time.perf_counter()
+        await reply(f"Qual o prazo de entrega do pedido {number}?")
+        durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations)
+
+
+async def run(args):
+    supabase = FakeSupabase(args.db_latency)
+    database.supabase = supabase
+    install_stubs(args.embed_latency, args.llm_latency)
+    engine = AIEngine()
+
+    async def sequential(content):
+        return await sequential_reply(engine, supabase, "bench", content)
+
+    last = {}
+
+    async def parallel(content):
+        result = await chat.send_message("bench", chat.MessageRequest(conversation_id="bench", content=content))
+        last.update(result["ai_response"].get("metadata") or {})
+
+    print(f"{'caches':<7} {'série (ms)':>11} {'paralelo (ms)':>14} {'ganho':>7}")
+    for cold in (False, True):
+        serial_ms = await measure(args.replies, sequential, cold)
+        parallel_ms = await measure(args.replies, parallel, cold)
+        print(f"{'frios' if cold else 'quentes':<7} {serial_ms:>11.0f} {parallel_ms:>14.0f} {serial_ms - parallel_ms:>6.0f}ms")
+    print(f"  etapas da última resposta: {last.get('timings_ms')}")
+
+    # Recuperação lenta: a resposta sai sem base de conhecimento no tempo limite da etapa
+    supabase.latencies["documents_rpc"] = settings.response_retrieval_timeout_seconds * 2
+    degraded_ms = await measure(3, parallel, False)
+    print(
+        f"recuperação lenta ({settings.response_retrieval_timeout_seconds * 2:.0f}s): {degraded_ms:.0f}ms  "
+        f"degradadas={last.get('degraded')}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replies", type=int, default=50, help="respostas por cenário")
+    parser.add_argument("--db-latency", type=float, default=0.03, help="latência por consulta ao Supabase (s)")
+    parser.add_argument("--embed-latency", type=float, default=0.15, help="latência do embedding da pergunta (s)")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="latência da geração (s)")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark de memória da extração: documento inteiro em memória x streaming.
+
+Para PDFs e CSVs de tamanhos crescentes, mede o pico de memória alocada no
+processo (tracemalloc) ao extrair e dividir em chunks:
+
+  - inteiro:   bytes do arquivo + texto completo + lista de chunks (fluxo anterior)
+  - streaming: arquivo em disco, páginas/linhas sob demanda, chunks consumidos um a um
+
+No streaming o pico deve ficar praticamente constante. As páginas de PDF são
+extraídas no pool de processos (PDF_EXTRACTION_WORKERS), fora do pico medido.
+
+Uso (a partir de backend/):
+    python benchmarks/bench_streaming_extraction.py --pages 50 200 800 --rows 10000 40000 160000
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Configurações mínimas para importar o app sem .env
+for key in ("SUPABASE_URL", "SUPABASE_KEY", "SUPABASE_SERVICE_KEY", "GEMINI_API_KEY"):
+    os.environ.setdefault(key, "http://localhost" if key == "SUPABASE_URL" else "benchmark")
+
+from bench_chunker import make_csv, make_pdf  # noqa: E402
+from app.services.chunker import chunk_blocks, csv_blocks, get_profile, text_blocks  # noqa: E402
+from app.services.document_processor import DocumentProcessor  # noqa: E402
+from app.services.pdf_extraction import shutdown_pool  # noqa: E402
+
+
+def whole_in_memory(path: str, doc_type: str) -> int:
+    """Fluxo anterior: arquivo inteiro em bytes, texto concatenado e todos os chunks numa lista"""
+    with open(path, "rb") as file:
+        content = file.read()
+
+    if doc_type == "pdf":
+        from PyPDF2 import PdfReader
+
+        reader = PdfReader(io.BytesIO(content))
+        text = "\n".join(page.extract_text() or "" for page in reader.pages)
+        chunks = list(chunk_blocks(text_blocks(text), get_profile(doc_type)))
+    else:
+        text = content.decode("utf-8-sig")
+        chunks = list(chunk_blocks(csv_blocks(io.StringIO(text)), get_profile(doc_type)))
+
+    return len(chunks)
+
+
+def streaming(processor: DocumentProcessor, path: str, doc_type: str) -> int:
+    count = 0
+    for _ in chunk_blocks(processor._extract_blocks(path, "bench." + doc_type, doc_type), get_profile(doc_type)):
+        count += 1
+    return count
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    started = time.perf_counter()
+    chunks = fn(*args)
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return chunks, peak / 1e6, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 200, 800], help="tamanhos de PDF (páginas)")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 40000, 160000], help="tamanhos de CSV (linhas)")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    processor = DocumentProcessor()
+    cases = [("pdf", pages, make_pdf(pages, rng)) for pages in args.pages]
+    cases += [("csv", rows, make_csv(rows, rng)) for rows in args.rows]
+
+    print(f"{'tipo':<5} {'tamanho':>8} {'arquivo':>9}   {'inteiro (pico)':>15} {'streaming (pico)':>17}   {'chunks':>7}")
+    try:
+        for doc_type, size, content in cases:
+            with tempfile.NamedTemporaryFile(suffix="." + doc_type) as file:
+                file.write(content)
+                file.flush()
+                del content
+
+                chunks, whole_peak, whole_seconds = measure(whole_in_memory, file.name, doc_type)
+                streamed, stream_peak, stream_seconds = measure(streaming, processor, file.name, doc_type)
+                assert streamed == chunks or doc_type == "pdf"  # PDF: fronteiras de página mudam a contagem
+
+                print(
+                    f"{doc_type:<5} {size:>8} {os.path.getsize(file.name) / 1e6:>7.1f}MB   "
+                    f"{whole_peak:>9.1f}MB {whole_seconds:>4.1f}s {stream_peak:>11.1f}MB {stream_seconds:>4.1f}s   {streamed:>7}"
+                )
+    finally:
+        shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
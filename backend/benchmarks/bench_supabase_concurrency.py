@@ -0,0 +1,102 @@
+"""
+Benchmark de concorrência da camada de dados (cliente Supabase síncrono x assíncrono).
+
+Sobe um servidor HTTP local que simula o PostgREST com latência fixa e dispara
+N "handlers" concorrentes no mesmo event loop, como o uvicorn faz com as rotas.
+Com o cliente síncrono cada `.execute()` bloqueia o loop e as requisições são
+atendidas em série; com o cliente assíncrono elas se sobrepõem.
+
+Uso:
+    python benchmarks/bench_supabase_concurrency.py --requests 200 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from supabase import create_client, acreate_client
+
+FAKE_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.bench"
+
+
+def start_fake_postgrest(latency: float) -> ThreadingHTTPServer:
+    """Servidor que responde qualquer consulta com `[]` após `latency` segundos"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            # O postgrest-py envia um corpo JSON vazio mesmo em GET; consumir para manter keep-alive
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            time.sleep(latency)
+            body = json.dumps([]).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def run_sync_client(url: str, total: int, concurrency: int) -> float:
+    client = create_client(url, FAKE_KEY)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def handler():
+        async with semaphore:
+            # Mesmo padrão dos handlers antigos: chamada bloqueante dentro de `async def`
+            client.table("messages").select("*").eq("conversation_id", "bench").execute()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(handler() for _ in range(total)))
+    return time.perf_counter() - start
+
+
+async def run_async_client(url: str, total: int, concurrency: int) -> float:
+    client = await acreate_client(url, FAKE_KEY)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def handler():
+        async with semaphore:
+            await client.table("messages").select("*").eq("conversation_id", "bench").execute()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(handler() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    await client.postgrest.aclose()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Total de consultas")
+    parser.add_argument("--concurrency", type=int, default=50, help="Handlers simultâneos")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latência simulada do PostgREST (s)")
+    args = parser.parse_args()
+
+    server = start_fake_postgrest(args.latency)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        sync_elapsed = asyncio.run(run_sync_client(url, args.requests, args.concurrency))
+        async_elapsed = asyncio.run(run_async_client(url, args.requests, args.concurrency))
+    finally:
+        server.shutdown()
+
+    print(f"Consultas: {args.requests} | concorrência: {args.concurrency} | latência: {args.latency * 1000:.0f} ms")
+    print(f"Cliente síncrono : {sync_elapsed:7.2f} s  ({args.requests / sync_elapsed:8.1f} req/s)")
+    print(f"Cliente assíncrono: {async_elapsed:7.2f} s  ({args.requests / async_elapsed:8.1f} req/s)")
+    print(f"Ganho: {sync_elapsed / async_elapsed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Benchmark da entrada de webhooks do WhatsApp em rajada (campanha).
+
+Dispara N eventos `messages.upsert` de C conversas contra a rota /evolution
+(ASGI em processo, fila "memory") com reentregas duplicadas, e simula o
+atendimento de cada mensagem com latência variável (--work). Compara:
+
+  - BackgroundTasks: uma tarefa por mensagem, sem limite, sem ordem (fluxo anterior;
+                     simulado com create_task, porque o transporte ASGI do httpx
+                     espera as BackgroundTasks antes de devolver a resposta)
+  - fila + workers:  ack após enfileirar, WEBHOOK_WORKERS em paralelo, ordem por conversa
+
+Reporta latência do ack, pico de atendimentos simultâneos, tempo até esvaziar,
+mensagens fora de ordem dentro da conversa e duplicatas processadas.
+
+Uso (a partir de backend/):
+    python benchmarks/bench_webhook_intake.py --events 2000 --conversations 200 --work 0.05 --workers 16
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Configurações mínimas para importar o app sem .env
+for key in ("SUPABASE_URL", "SUPABASE_KEY", "SUPABASE_SERVICE_KEY", "GEMINI_API_KEY"):
+    os.environ.setdefault(key, "http://localhost" if key == "SUPABASE_URL" else "benchmark")
+os.environ["WEBHOOK_QUEUE_BACKEND"] = "memory"
+
+import httpx  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+from app.routers import webhooks  # noqa: E402
+from app.services.webhook_queue import WebhookWorkerPool, webhook_intake, webhook_queue  # noqa: E402
+
+
+def make_events(count: int, conversations: int, duplicates: float, rng: random.Random):
+    sequence = defaultdict(int)
+    events = []
+    for number in range(count):
+        phone = f"55119{rng.randrange(conversations):08d}"
+        sequence[phone] += 1
+        events.append({
+            "event": "messages.upsert",
+            "instance": "campanha",
+            "data": {
+                "key": {"id": f"MSG{number}", "remoteJid": f"{phone}@s.whatsapp.net", "fromMe": False},
+                "message": {"conversation": f"{sequence[phone]}"}
+            }
+        })
+        if rng.random() < duplicates:
+            events.append(events[-1])
+    return events
+
+
+class Recorder:
+    """Atendimento simulado: mede concorrência, ordem por conversa e duplicatas"""
+
+    def __init__(self, work: float, rng: random.Random):
+        self.work, self.rng = work, rng
+        self.active = self.peak = 0
+        self.last = {}
+        self.out_of_order = 0
+        self.seen = set()
+        self.duplicates = 0
+        self.done = 0
+
+    async def handle(self, phone: str, text: str, key: str):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.work * self.rng.uniform(0.2, 1.8))
+            if key in self.seen:
+                self.duplicates += 1
+            self.seen.add(key)
+            if int(text) < self.last.get(phone, 0):
+                self.out_of_order += 1
+            self.last[phone] = max(self.last.get(phone, 0), int(text))
+        finally:
+            self.active -= 1
+            self.done += 1
+
+
+async def post_all(app: FastAPI, events, concurrency: int = 10):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def post(body):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/evolution", json=body)
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        await asyncio.gather(*(post(body) for body in events))
+    return latencies
+
+
+async def run_background_tasks(events, work: float):
+    recorder = Recorder(work, random.Random(1))
+    app = FastAPI()
+
+    tasks = set()
+
+    @app.post("/evolution")
+    async def legacy(request: Request):
+        body = await request.json()
+        data = body["data"]
+        task = asyncio.create_task(
+            recorder.handle(data["key"]["remoteJid"], data["message"]["conversation"], data["key"]["id"])
+        )
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return {"status": "ok"}
+
+    started = time.perf_counter()
+    latencies = await post_all(app, events)
+    while recorder.done < len(events):
+        await asyncio.sleep(0.01)
+    return latencies, time.perf_counter() - started, recorder
+
+
+async def run_queue(events, work: float, workers: int):
+    recorder = Recorder(work, random.Random(1))
+
+    async def handler(event, batch):
+        await recorder.handle(event["payload"]["phone"], event["payload"]["text"], event["event_key"])
+
+    pool = WebhookWorkerPool(handler, queue=webhook_queue, concurrency=workers)
+    webhook_intake.on_enqueue(pool.notify)
+    pool_task = asyncio.create_task(pool.run())
+
+    app = FastAPI()
+    app.include_router(webhooks.router)
+
+    started = time.perf_counter()
+    latencies = await post_all(app, events)
+    expected = webhook_intake.stats()["accepted"]
+    while recorder.done < expected:
+        await asyncio.sleep(0.01)
+    seconds = time.perf_counter() - started
+
+    pool.stop()
+    await pool_task
+    return latencies, seconds, recorder
+
+
+def report(name: str, latencies, seconds: float, recorder: Recorder):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{name:<16} ack p50={statistics.median(latencies):6.1f}ms p99={p99:6.1f}ms  "
+        f"pico simultâneo={recorder.peak:>5}  esvaziou em {seconds:6.2f}s  "
+        f"fora de ordem={recorder.out_of_order:>4}  duplicatas processadas={recorder.duplicates}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=2000, help="mensagens na rajada")
+    parser.add_argument("--conversations", type=int, default=200, help="conversas distintas")
+    parser.add_argument("--duplicates", type=float, default=0.05, help="fração de reentregas")
+    parser.add_argument("--work", type=float, default=0.05, help="tempo médio de atendimento (s)")
+    parser.add_argument("--workers", type=int, default=16, help="WEBHOOK_WORKERS")
+    args = parser.parse_args()
+
+    events = make_events(args.events, args.conversations, args.duplicates, random.Random(7))
+    print(f"{len(events)} eventos ({len(events) - args.events} reentregas) de {args.conversations} conversas")
+
+    report("BackgroundTasks", *asyncio.run(run_background_tasks(events, args.work)))
+    report(f"fila x{args.workers}", *asyncio.run(run_queue(events, args.work, args.workers)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Benchmark do envio pelo WhatsApp contra uma Evolution API local (fixture).
+
+O servidor imita `POST /message/sendText/{instance}`: latência por requisição,
+limite de ritmo por instância (acima dele responde 429 com Retry-After, como o
+WhatsApp ao estrangular o número) e uma fração de erros 500. Dispara uma
+campanha de --messages destinatários e, durante ela, --replies respostas de
+atendimento. Compara:
+
+  - ingênuo: um `httpx.AsyncClient` por mensagem, tudo de uma vez, sem nova tentativa
+  - `whatsapp_sender`: pool de conexões, ritmo por instância, backoff com jitter
+                       e respostas na frente da campanha
+
+Reporta mensagens entregues, 429/500 recebidos, conexões TCP abertas, duração
+da campanha e latência das respostas de atendimento.
+
+Uso (a partir de backend/):
+    python benchmarks/bench_whatsapp_sender.py --messages 300 --replies 20 --rate 1200 --server-rate 25 --errors 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Configurações mínimas para importar o app sem .env
+for key in ("SUPABASE_URL", "SUPABASE_KEY", "SUPABASE_SERVICE_KEY", "GEMINI_API_KEY"):
+    os.environ.setdefault(key, "http://localhost" if key == "SUPABASE_URL" else "benchmark")
+
+import httpx  # noqa: E402
+import app.database as database  # noqa: E402
+from app.config import get_settings  # noqa: E402
+from app.services.whatsapp_sender import EvolutionClient, WhatsAppSender  # noqa: E402
+
+settings = get_settings()
+
+
+class EvolutionStandIn:
+    """Estado do servidor de teste (compartilhado entre as threads do ThreadingHTTPServer)"""
+
+    def __init__(self, latency: float, rate: float, errors: float):
+        self.latency, self.rate, self.errors = latency, rate, errors
+        self.lock = threading.Lock()
+        self.rng = random.Random(3)
+        self.allowance = {}
+        self.delivered = []
+        self.throttled = self.failed = 0
+        self.connections = set()
+
+    def reset(self):
+        with self.lock:
+            self.allowance.clear()
+            self.delivered.clear()
+            self.connections.clear()
+            self.throttled = self.failed = 0
+
+    def admit(self, instance: str) -> int:
+        # Token bucket por instância (capacidade de 1 segundo de envios)
+        with self.lock:
+            now = time.monotonic()
+            tokens, updated = self.allowance.get(instance, (self.rate, now))
+            tokens = min(self.rate, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self.allowance[instance] = (tokens, now)
+                self.throttled += 1
+                return 429
+            self.allowance[instance] = (tokens - 1, now)
+            if self.rng.random() < self.errors:
+                self.failed += 1
+                return 500
+            return 200
+
+
+def make_handler(state: EvolutionStandIn):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            time.sleep(state.latency)
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            instance = self.path.rsplit("/", 1)[-1]
+            with state.lock:
+                state.connections.add(self.client_address)
+
+            status = state.admit(instance)
+            if status == 200:
+                with state.lock:
+                    state.delivered.append((body["text"], time.perf_counter()))
+                return self._send(200, {"key": {"id": uuid.uuid4().hex.upper(), "fromMe": True}, "status": "PENDING"})
+            headers = {"Retry-After": "1"} if status == 429 else {}
+            self._send(status, {"error": "rate-overlimit" if status == 429 else "internal"}, headers)
+
+        def _send(self, status: int, payload, headers=None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    """Registro de envios em memória (sem latência): só devolve ids nas inserções"""
+
+    def __init__(self):
+        self.rows = None
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def insert(self, rows, **kwargs):
+        self.rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    async def execute(self):
+        return _Response([{"id": str(uuid.uuid4()), **row} for row in self.rows or []])
+
+
+class FakeSupabase:
+    def table(self, name):
+        return _Query()
+
+
+def plan_replies(count: int, span: float):
+    rng = random.Random(11)
+    return sorted(rng.uniform(0.2, span) for _ in range(count))
+
+
+async def naive(base_url: str, messages: int, replies):
+    """Um cliente por mensagem e nenhuma fila: tudo sai ao mesmo tempo; falhas se perdem"""
+    async def post(text):
+        async with httpx.AsyncClient(base_url=base_url, timeout=15) as client:
+            try:
+                response = await client.post("/message/sendText/loja", json={"number": "5511900000000", "text": text})
+                return response.status_code == 200
+            except httpx.HTTPError:
+                return False
+
+    async def reply(number, at):
+        await asyncio.sleep(at)
+        started = time.perf_counter()
+        await post(f"resposta-{number}")
+        return started
+
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(post(f"campanha-{number}") for number in range(messages)),
+        *(reply(number, at) for number, at in enumerate(replies))
+    )
+    return results[messages:], time.perf_counter() - started
+
+
+async def pipeline(base_url: str, messages: int, replies):
+    # Ritmo e campanha no processo (o registro em memória não reserva envios nem guarda o bucket)
+    sender = WhatsAppSender(client=EvolutionClient(base_url=base_url, api_key="bench"), backend="memory")
+
+    async def reply(number, at):
+        await asyncio.sleep(at)
+        started = time.perf_counter()
+        await sender.send("loja", "+55 11 90000-0000", f"resposta-{number}")
+        return started
+
+    started = time.perf_counter()
+    await sender.send_bulk("loja", (f"55119{number:08d}" for number in range(messages)), "campanha")
+    reply_starts = await asyncio.gather(*(reply(number, at) for number, at in enumerate(replies)))
+    while sender.sent + sender.failed < messages + len(replies):
+        await asyncio.sleep(0.05)
+    seconds = time.perf_counter() - started
+    stats = sender.stats()
+    await sender.close()
+    return reply_starts, seconds, stats
+
+
+def report(name: str, state: EvolutionStandIn, seconds: float, reply_starts, total: int):
+    delivered = {text: at for text, at in state.delivered}
+    latencies = [
+        (delivered[f"resposta-{number}"] - started) * 1000
+        for number, started in enumerate(reply_starts) if f"resposta-{number}" in delivered
+    ]
+    campaign = sum(1 for text, _ in state.delivered if not text.startswith("resposta-"))
+    print(
+        f"{name:<15} entregues={len(state.delivered):>4}/{total}  campanha={campaign:>4}  "
+        f"429={state.throttled:>4}  500={state.failed:>3}  conexões={len(state.connections):>4}  "
+        f"duração={seconds:5.1f}s  resposta p50={statistics.median(latencies) if latencies else float('nan'):6.0f}ms "
+        f"({len(latencies)}/{len(reply_starts)} entregues)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300, help="destinatários da campanha")
+    parser.add_argument("--replies", type=int, default=20, help="respostas de atendimento durante a campanha")
+    parser.add_argument("--rate", type=float, default=1200, help="WHATSAPP_SEND_RATE_PER_MINUTE")
+    parser.add_argument("--server-rate", type=float, default=25, help="envios/s aceitos pela instância antes do 429")
+    parser.add_argument("--latency", type=float, default=0.05, help="latência do servidor por requisição (s)")
+    parser.add_argument("--errors", type=float, default=0.05, help="fração de respostas 500")
+    args = parser.parse_args()
+
+    settings.whatsapp_send_rate_per_minute = args.rate
+    settings.whatsapp_send_burst = max(1, int(args.rate / 60))
+    settings.whatsapp_send_concurrency = 4
+    settings.whatsapp_send_retry_base_seconds = 0.5
+    database.supabase = FakeSupabase()
+
+    ThreadingHTTPServer.request_queue_size = 1024
+    state = EvolutionStandIn(args.latency, args.server_rate, args.errors)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    total = args.messages + args.replies
+    replies = plan_replies(args.replies, args.messages / (args.rate / 60) * 0.8)
+    try:
+        reply_starts, seconds = asyncio.run(naive(base_url, args.messages, replies))
+        report("ingênuo", state, seconds, reply_starts, total)
+
+        state.reset()
+        reply_starts, seconds, stats = asyncio.run(pipeline(base_url, args.messages, replies))
+        report("whatsapp_sender", state, seconds, reply_starts, total)
+        print(f"  {stats}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+-- =====================================================
+-- MIGRATION: Ingestion Jobs
+-- Fila persistente para processamento de uploads e URLs em background
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    organization_id UUID REFERENCES organizations(id) ON DELETE CASCADE,
+    document_id UUID REFERENCES documents(id) ON DELETE CASCADE,
+    job_type TEXT NOT NULL CHECK (job_type IN ('file', 'url')),
+    payload JSONB NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT now(),
+    locked_by TEXT,
+    locked_until TIMESTAMPTZ,
+    chunks_done INT NOT NULL DEFAULT 0,
+    total_chunks INT,
+    error_message TEXT,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+COMMENT ON TABLE ingestion_jobs IS 'Fila de ingestão de documentos (upload e crawl) consumida pelos workers';
+COMMENT ON COLUMN ingestion_jobs.chunks_done IS 'Chunks já persistidos; usado para retomar após falha do worker';
+COMMENT ON COLUMN ingestion_jobs.locked_until IS 'Lease do worker; jobs running com lease expirado são retomados';
+
+CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_ready ON ingestion_jobs(status, run_after);
+CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_document ON ingestion_jobs(document_id, created_at DESC);
+
+ALTER TABLE ingestion_jobs ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view org ingestion jobs" ON ingestion_jobs
+    FOR SELECT USING (
+        organization_id IN (SELECT organization_id FROM profiles WHERE id = auth.uid())
+    );
+
+CREATE TRIGGER update_ingestion_jobs_updated_at
+    BEFORE UPDATE ON ingestion_jobs
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at();
+
+-- Reservar o próximo job disponível (fila ou lease expirado) sem disputa entre workers
+CREATE OR REPLACE FUNCTION claim_ingestion_job(
+    worker_id TEXT,
+    lease_seconds INT DEFAULT 120
+)
+RETURNS SETOF ingestion_jobs
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    UPDATE ingestion_jobs j
+    SET status = 'running',
+        attempts = j.attempts + 1,
+        locked_by = worker_id,
+        locked_until = now() + make_interval(secs => lease_seconds)
+    WHERE j.id = (
+        SELECT id FROM ingestion_jobs
+        WHERE (status = 'queued' AND run_after <= now())
+           OR (status = 'running' AND locked_until < now())
+        ORDER BY run_after, created_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING j.*;
+END;
+$$;
@@ -0,0 +1,19 @@
+-- =====================================================
+-- MIGRATION: Business Rules Realtime
+-- Publica mudanças de business_rules no Supabase Realtime para invalidar
+-- o cache de regras compiladas da API
+-- =====================================================
+
+-- REPLICA IDENTITY FULL para que eventos DELETE tragam organization_id em old_record
+ALTER TABLE business_rules REPLICA IDENTITY FULL;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_publication_tables
+        WHERE pubname = 'supabase_realtime' AND schemaname = 'public' AND tablename = 'business_rules'
+    ) THEN
+        ALTER PUBLICATION supabase_realtime ADD TABLE business_rules;
+    END IF;
+END;
+$$;
@@ -0,0 +1,62 @@
+-- =====================================================
+-- MIGRATION: Blacklist Entries
+-- Um número (E.164) por linha em vez do array blacklists.phone_numbers,
+-- para consultas O(1), escrita incremental e importação em massa
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS blacklist_entries (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    organization_id UUID REFERENCES organizations(id) ON DELETE CASCADE,
+    blacklist_id UUID REFERENCES blacklists(id) ON DELETE CASCADE,
+    phone_number TEXT NOT NULL CHECK (phone_number ~ '^\+[0-9]{8,15}$'),
+    created_at TIMESTAMPTZ DEFAULT now(),
+    UNIQUE (blacklist_id, phone_number)
+);
+
+COMMENT ON TABLE blacklist_entries IS 'Números bloqueados (E.164), um por linha';
+COMMENT ON COLUMN blacklists.phone_numbers IS 'LEGADO: substituído por blacklist_entries (migração 005)';
+
+CREATE INDEX IF NOT EXISTS idx_blacklist_entries_org ON blacklist_entries(organization_id, id);
+CREATE INDEX IF NOT EXISTS idx_blacklist_entries_org_phone ON blacklist_entries(organization_id, phone_number);
+
+ALTER TABLE blacklist_entries ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view org blacklist entries" ON blacklist_entries
+    FOR SELECT USING (
+        organization_id IN (SELECT organization_id FROM profiles WHERE id = auth.uid())
+    );
+
+-- Mesma regra de app.services.blacklist_index.normalize_phone
+CREATE OR REPLACE FUNCTION normalize_phone_e164(raw TEXT, default_country_code TEXT DEFAULT '55')
+RETURNS TEXT
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+DECLARE
+    value TEXT := btrim(split_part(coalesce(raw, ''), '@', 1));
+    digits TEXT := regexp_replace(value, '\D', '', 'g');
+BEGIN
+    IF value LIKE '+%' THEN
+        NULL;
+    ELSIF digits LIKE '00%' THEN
+        digits := substr(digits, 3);
+    ELSE
+        digits := ltrim(digits, '0');
+        IF length(digits) <= 11 THEN
+            digits := default_country_code || digits;
+        END IF;
+    END IF;
+
+    IF length(digits) BETWEEN 8 AND 15 THEN
+        RETURN '+' || digits;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Migrar números existentes dos arrays
+INSERT INTO blacklist_entries (organization_id, blacklist_id, phone_number)
+SELECT b.organization_id, b.id, normalize_phone_e164(n)
+FROM blacklists b, unnest(b.phone_numbers) AS n
+WHERE normalize_phone_e164(n) IS NOT NULL
+ON CONFLICT (blacklist_id, phone_number) DO NOTHING;
@@ -0,0 +1,52 @@
+-- =====================================================
+-- MIGRATION: Knowledge Versions
+-- Versão da base de conhecimento por organização, incrementada a cada
+-- mudança em documents; invalida o cache semântico de respostas da API
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS knowledge_versions (
+    organization_id UUID PRIMARY KEY REFERENCES organizations(id) ON DELETE CASCADE,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+COMMENT ON TABLE knowledge_versions IS 'Contador de mudanças em documents por organização (cache semântico)';
+
+ALTER TABLE knowledge_versions ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view org knowledge version" ON knowledge_versions
+    FOR SELECT USING (
+        organization_id IN (SELECT organization_id FROM profiles WHERE id = auth.uid())
+    );
+
+-- Triggers por comando (não por linha): um INSERT de 50 chunks incrementa uma vez
+CREATE OR REPLACE FUNCTION bump_knowledge_version_new()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO knowledge_versions (organization_id, version)
+    SELECT DISTINCT organization_id, 1 FROM changed_rows WHERE organization_id IS NOT NULL
+    ON CONFLICT (organization_id) DO UPDATE
+        SET version = knowledge_versions.version + 1, updated_at = now();
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS documents_knowledge_version_insert ON documents;
+CREATE TRIGGER documents_knowledge_version_insert
+    AFTER INSERT ON documents
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_knowledge_version_new();
+
+DROP TRIGGER IF EXISTS documents_knowledge_version_update ON documents;
+CREATE TRIGGER documents_knowledge_version_update
+    AFTER UPDATE ON documents
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_knowledge_version_new();
+
+DROP TRIGGER IF EXISTS documents_knowledge_version_delete ON documents;
+CREATE TRIGGER documents_knowledge_version_delete
+    AFTER DELETE ON documents
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_knowledge_version_new();
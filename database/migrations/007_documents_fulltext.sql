@@ -0,0 +1,72 @@
+-- =====================================================
+-- MIGRATION: Documents Full-Text Search
+-- tsvector + GIN em documents.content para a busca híbrida (léxica + vetorial)
+-- =====================================================
+
+-- 'portuguese' para linguagem natural (com stemming) e 'simple' para termos
+-- exatos como códigos de produto e SKUs ("AB-1234")
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_tsv TSVECTOR
+    GENERATED ALWAYS AS (
+        to_tsvector('portuguese', coalesce(content, '')) || to_tsvector('simple', coalesce(content, ''))
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_documents_content_tsv ON documents USING GIN (content_tsv);
+
+-- Busca léxica: termos da pergunta combinados com OR, ordenados por ts_rank_cd
+CREATE OR REPLACE FUNCTION search_documents_lexical(
+    query_text TEXT,
+    org_id UUID,
+    match_count INT DEFAULT 20,
+    conversation_filter UUID DEFAULT NULL,
+    rule_filter UUID DEFAULT NULL,
+    access_filter TEXT DEFAULT NULL
+)
+RETURNS TABLE (
+    id UUID,
+    filename TEXT,
+    content TEXT,
+    rank FLOAT,
+    conversation_id UUID,
+    business_rule_ids UUID[],
+    access_level TEXT
+)
+LANGUAGE plpgsql
+STABLE
+AS $$
+DECLARE
+    portuguese_terms TEXT := replace(plainto_tsquery('portuguese', query_text)::TEXT, '&', '|');
+    simple_terms TEXT := replace(plainto_tsquery('simple', query_text)::TEXT, '&', '|');
+    query TSQUERY;
+BEGIN
+    IF portuguese_terms = '' AND simple_terms = '' THEN
+        RETURN;
+    END IF;
+
+    query := CASE
+        WHEN portuguese_terms = '' THEN simple_terms::TSQUERY
+        WHEN simple_terms = '' THEN portuguese_terms::TSQUERY
+        ELSE portuguese_terms::TSQUERY || simple_terms::TSQUERY
+    END;
+
+    RETURN QUERY
+    SELECT
+        d.id,
+        d.filename,
+        d.content,
+        ts_rank_cd(d.content_tsv, query)::FLOAT AS rank,
+        d.conversation_id,
+        d.business_rule_ids,
+        d.access_level
+    FROM documents d
+    WHERE d.organization_id = org_id
+        AND d.status = 'ready'
+        AND d.embedding IS NOT NULL
+        AND d.content_tsv @@ query
+        -- Filtros opcionais
+        AND (conversation_filter IS NULL OR d.conversation_id = conversation_filter)
+        AND (rule_filter IS NULL OR rule_filter = ANY(d.business_rule_ids))
+        AND (access_filter IS NULL OR d.access_level = access_filter)
+    ORDER BY rank DESC
+    LIMIT match_count;
+END;
+$$;
@@ -0,0 +1,49 @@
+-- =====================================================
+-- MIGRATION: Chunk Content Hash
+-- Chunks endereçados por conteúdo: reingestões só embeddam chunks novos e
+-- embeddings são reaproveitados entre documentos da mesma organização
+-- =====================================================
+
+-- Hash (sha256, hex) do texto normalizado do chunk; NULL no documento principal
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_documents_parent_chunk ON documents(parent_document_id, chunk_index)
+    WHERE parent_document_id IS NOT NULL;
+
+-- Índice de deduplicação por organização: hash do chunk -> embedding.
+-- Sobrevive à exclusão dos documentos (reenvio de um arquivo apagado não paga embeddings)
+CREATE TABLE IF NOT EXISTS chunk_embeddings (
+    organization_id UUID REFERENCES organizations(id) ON DELETE CASCADE,
+    model TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    embedding VECTOR(768) NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (organization_id, model, content_hash)
+);
+
+COMMENT ON TABLE chunk_embeddings IS 'Embeddings por hash de conteúdo (deduplicação entre documentos)';
+
+ALTER TABLE chunk_embeddings ENABLE ROW LEVEL SECURITY;
+
+-- Mesma normalização de app.services.chunker.content_hash:
+-- espaços colapsados, bordas removidas, Unicode NFC
+CREATE OR REPLACE FUNCTION chunk_content_hash(content TEXT)
+RETURNS TEXT
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT encode(sha256(convert_to(normalize(regexp_replace(btrim(coalesce(content, '')), '\s+', ' ', 'g'), NFC), 'UTF8')), 'hex');
+$$;
+
+-- Backfill dos chunks existentes e do índice de deduplicação
+UPDATE documents
+SET content_hash = chunk_content_hash(content)
+WHERE parent_document_id IS NOT NULL AND content IS NOT NULL AND content_hash IS NULL;
+
+INSERT INTO chunk_embeddings (organization_id, model, content_hash, embedding)
+SELECT DISTINCT ON (organization_id, content_hash)
+    organization_id, 'models/embedding-001', content_hash, embedding
+FROM documents
+WHERE content_hash IS NOT NULL AND embedding IS NOT NULL AND organization_id IS NOT NULL
+ORDER BY organization_id, content_hash, created_at DESC
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,13 @@
+-- =====================================================
+-- MIGRATION: Site Crawl
+-- Jobs de rastreamento de site; cada página vira um documento "url"
+-- com metadata.site_document_id apontando para o documento do rastreamento
+-- =====================================================
+
+ALTER TABLE ingestion_jobs DROP CONSTRAINT IF EXISTS ingestion_jobs_job_type_check;
+ALTER TABLE ingestion_jobs ADD CONSTRAINT ingestion_jobs_job_type_check
+    CHECK (job_type IN ('file', 'url', 'site'));
+
+-- Páginas de um rastreamento (re-visitas condicionais e exclusão em cascata)
+CREATE INDEX IF NOT EXISTS idx_documents_site_pages ON documents ((metadata->>'site_document_id'))
+    WHERE parent_document_id IS NULL AND metadata ? 'site_document_id';
@@ -0,0 +1,11 @@
+-- =====================================================
+-- MIGRATION: Conversation Memory
+-- context_summary passa a ser um resumo incremental: cobre as mensagens
+-- até summary_until; as posteriores entram literais no prompt
+-- =====================================================
+
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summary_until TIMESTAMPTZ;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summary_message_count INT NOT NULL DEFAULT 0;
+
+-- Mensagens recentes (created_at DESC) e não resumidas (created_at > summary_until)
+-- usam idx_messages_created (conversation_id, created_at)
@@ -0,0 +1,83 @@
+-- =====================================================
+-- MIGRATION: Webhook Events
+-- Fila durável de eventos recebidos da Evolution API (WhatsApp):
+-- o webhook responde após gravar o evento; workers processam em ordem
+-- dentro de cada conversa e em paralelo entre conversas
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS webhook_events (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    source TEXT NOT NULL DEFAULT 'evolution',
+    instance TEXT NOT NULL,
+    event_key TEXT NOT NULL,
+    ordering_key TEXT NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 3,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT now(),
+    locked_by TEXT,
+    locked_until TIMESTAMPTZ,
+    error_message TEXT,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    updated_at TIMESTAMPTZ DEFAULT now(),
+    -- Reentregas da mesma mensagem (key.id da Evolution) são descartadas
+    UNIQUE (source, instance, event_key)
+);
+
+COMMENT ON TABLE webhook_events IS 'Fila de eventos de webhook (WhatsApp) consumida pelos workers de atendimento';
+COMMENT ON COLUMN webhook_events.ordering_key IS 'instância + remetente: eventos com a mesma chave são processados um de cada vez, em ordem de chegada';
+
+-- Cabeças das filas por conversa (só eventos pendentes)
+CREATE INDEX IF NOT EXISTS idx_webhook_events_pending ON webhook_events(ordering_key, created_at, id)
+    WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_webhook_events_done ON webhook_events(updated_at)
+    WHERE status IN ('done', 'failed');
+
+ALTER TABLE webhook_events ENABLE ROW LEVEL SECURITY;
+
+CREATE TRIGGER update_webhook_events_updated_at
+    BEFORE UPDATE ON webhook_events
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at();
+
+-- Reservar até max_events eventos prontos, no máximo um por ordering_key:
+-- só o evento mais antigo ainda pendente de cada conversa pode ser reservado,
+-- então o próximo só sai depois que o anterior terminar (ou esgotar as tentativas)
+CREATE OR REPLACE FUNCTION claim_webhook_events(
+    worker_id TEXT,
+    lease_seconds INT DEFAULT 120,
+    max_events INT DEFAULT 1
+)
+RETURNS SETOF webhook_events
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    WITH heads AS (
+        SELECT DISTINCT ON (ordering_key) id, ordering_key, status, run_after, locked_until, created_at
+        FROM webhook_events
+        WHERE status IN ('queued', 'running')
+        ORDER BY ordering_key, created_at, id
+    ),
+    ready AS (
+        -- Lock consultivo avaliado sobre a lista já ordenada, parando no LIMIT:
+        -- dois workers não disputam a mesma conversa
+        SELECT id FROM (
+            SELECT id, ordering_key FROM heads
+            WHERE (status = 'queued' AND run_after <= now()) OR (status = 'running' AND locked_until < now())
+            ORDER BY created_at
+        ) ordered
+        WHERE pg_try_advisory_xact_lock(hashtext('webhook_events:' || ordering_key))
+        LIMIT max_events
+    )
+    UPDATE webhook_events e
+    SET status = 'running',
+        attempts = e.attempts + 1,
+        locked_by = worker_id,
+        locked_until = now() + make_interval(secs => lease_seconds)
+    WHERE e.id IN (SELECT id FROM ready)
+      -- Reavaliado na linha atual se outro worker a reservou enquanto isso
+      AND ((e.status = 'queued' AND e.run_after <= now()) OR (e.status = 'running' AND e.locked_until < now()))
+    RETURNING e.*;
+END;
+$$;
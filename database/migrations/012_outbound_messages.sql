@@ -0,0 +1,60 @@
+-- =====================================================
+-- MIGRATION: Outbound Messages
+-- Envios pelo WhatsApp (Evolution API): respostas da IA e campanhas,
+-- com o status de entrega informado pelos callbacks (messages.update)
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS outbound_messages (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    organization_id UUID REFERENCES organizations(id) ON DELETE CASCADE,
+    message_id UUID REFERENCES messages(id) ON DELETE SET NULL,
+    campaign_id UUID,
+    instance TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    content TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'sent', 'delivered', 'read', 'failed')),
+    attempts INT NOT NULL DEFAULT 0,
+    provider_message_id TEXT,
+    error_message TEXT,
+    sent_at TIMESTAMPTZ,
+    delivered_at TIMESTAMPTZ,
+    read_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+COMMENT ON TABLE outbound_messages IS 'Mensagens enviadas pelo WhatsApp (respostas e campanhas) e seu status de entrega';
+COMMENT ON COLUMN outbound_messages.provider_message_id IS 'key.id devolvido pela Evolution API; liga os callbacks de status ao envio';
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_outbound_messages_provider ON outbound_messages(instance, provider_message_id)
+    WHERE provider_message_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_outbound_messages_campaign ON outbound_messages(campaign_id, status)
+    WHERE campaign_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_outbound_messages_org ON outbound_messages(organization_id, created_at DESC);
+
+ALTER TABLE outbound_messages ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view org outbound messages" ON outbound_messages
+    FOR SELECT USING (
+        organization_id IN (SELECT organization_id FROM profiles WHERE id = auth.uid())
+    );
+
+CREATE TRIGGER update_outbound_messages_updated_at
+    BEFORE UPDATE ON outbound_messages
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at();
+
+-- Log bruto dos callbacks de status (inclusive de mensagens sem envio registrado)
+CREATE TABLE IF NOT EXISTS outbound_status_events (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    instance TEXT NOT NULL,
+    provider_message_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMPTZ DEFAULT now()
+);
+
+COMMENT ON TABLE outbound_status_events IS 'Callbacks de status de entrega da Evolution API (messages.update)';
+
+CREATE INDEX IF NOT EXISTS idx_outbound_status_events_message ON outbound_status_events(instance, provider_message_id, created_at);
+
+ALTER TABLE outbound_status_events ENABLE ROW LEVEL SECURITY;
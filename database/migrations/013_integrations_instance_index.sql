@@ -0,0 +1,9 @@
+-- =====================================================
+-- MIGRATION: Integrations Instance Index
+-- Índice de expressão para achar a integração WhatsApp de uma instância da
+-- Evolution API (config->>'instance'), usado quando a tabela de rotas em
+-- memória não conhece a instância
+-- =====================================================
+
+CREATE INDEX IF NOT EXISTS idx_integrations_whatsapp_instance ON integrations ((config->>'instance'))
+    WHERE type = 'whatsapp';
@@ -0,0 +1,48 @@
+-- =====================================================
+-- MIGRATION: Ingestion Jobs - Exhausted Leases
+-- Jobs com lease expirado só são retomados enquanto restam tentativas: um
+-- documento que derruba o worker (ex.: falta de memória) não volta para a fila
+-- para sempre; esgotadas as tentativas, o job falha e o documento fica em erro
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION claim_ingestion_job(
+    worker_id TEXT,
+    lease_seconds INT DEFAULT 120
+)
+RETURNS SETOF ingestion_jobs
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- Worker interrompido na última tentativa: falha definitiva
+    WITH exhausted AS (
+        UPDATE ingestion_jobs
+        SET status = 'failed',
+            locked_by = NULL,
+            locked_until = NULL,
+            error_message = 'Processamento interrompido (worker encerrado) em todas as tentativas'
+        WHERE status = 'running' AND locked_until < now() AND attempts >= max_attempts
+        RETURNING document_id, error_message
+    )
+    UPDATE documents d
+    SET status = 'error',
+        error_message = exhausted.error_message
+    FROM exhausted
+    WHERE d.id = exhausted.document_id;
+
+    RETURN QUERY
+    UPDATE ingestion_jobs j
+    SET status = 'running',
+        attempts = j.attempts + 1,
+        locked_by = worker_id,
+        locked_until = now() + make_interval(secs => lease_seconds)
+    WHERE j.id = (
+        SELECT id FROM ingestion_jobs
+        WHERE (status = 'queued' AND run_after <= now())
+           OR (status = 'running' AND locked_until < now() AND attempts < max_attempts)
+        ORDER BY run_after, created_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING j.*;
+END;
+$$;
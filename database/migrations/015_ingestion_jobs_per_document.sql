@@ -0,0 +1,58 @@
+-- =====================================================
+-- MIGRATION: Ingestion Jobs - One Job per Document
+-- Reenvios e novos scans reaproveitam o documento; dois jobs do mesmo documento
+-- rodando juntos inseririam os mesmos chunks duas vezes. Um job só é reservado
+-- se nenhum outro job do documento está com lease ativo; as reservas são
+-- serializadas (advisory lock) para dois workers não pegarem jobs irmãos ao mesmo tempo
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION claim_ingestion_job(
+    worker_id TEXT,
+    lease_seconds INT DEFAULT 120
+)
+RETURNS SETOF ingestion_jobs
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('claim_ingestion_job'));
+
+    -- Worker interrompido na última tentativa: falha definitiva
+    WITH exhausted AS (
+        UPDATE ingestion_jobs
+        SET status = 'failed',
+            locked_by = NULL,
+            locked_until = NULL,
+            error_message = 'Processamento interrompido (worker encerrado) em todas as tentativas'
+        WHERE status = 'running' AND locked_until < now() AND attempts >= max_attempts
+        RETURNING document_id, error_message
+    )
+    UPDATE documents d
+    SET status = 'error',
+        error_message = exhausted.error_message
+    FROM exhausted
+    WHERE d.id = exhausted.document_id;
+
+    RETURN QUERY
+    UPDATE ingestion_jobs j
+    SET status = 'running',
+        attempts = j.attempts + 1,
+        locked_by = worker_id,
+        locked_until = now() + make_interval(secs => lease_seconds)
+    WHERE j.id = (
+        SELECT c.id FROM ingestion_jobs c
+        WHERE ((c.status = 'queued' AND c.run_after <= now())
+           OR (c.status = 'running' AND c.locked_until < now() AND c.attempts < c.max_attempts))
+          AND NOT EXISTS (
+              SELECT 1 FROM ingestion_jobs other
+              WHERE other.document_id = c.document_id
+                AND other.id <> c.id
+                AND other.status = 'running'
+                AND other.locked_until >= now()
+          )
+        ORDER BY c.run_after, c.created_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING j.*;
+END;
+$$;
@@ -0,0 +1,55 @@
+-- =====================================================
+-- MIGRATION: Webhook Events - Exhausted Leases
+-- Evento com lease expirado só é retomado enquanto restam tentativas: um evento
+-- que derruba o worker não bloqueia a fila da conversa para sempre; esgotadas
+-- as tentativas, ele falha e o próximo evento da conversa é liberado
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION claim_webhook_events(
+    worker_id TEXT,
+    lease_seconds INT DEFAULT 120,
+    max_events INT DEFAULT 1
+)
+RETURNS SETOF webhook_events
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- Worker interrompido na última tentativa: falha definitiva (libera a conversa)
+    UPDATE webhook_events
+    SET status = 'failed',
+        locked_by = NULL,
+        locked_until = NULL,
+        error_message = 'Processamento interrompido (worker encerrado) em todas as tentativas'
+    WHERE status = 'running' AND locked_until < now() AND attempts >= max_attempts;
+
+    RETURN QUERY
+    WITH heads AS (
+        SELECT DISTINCT ON (ordering_key) id, ordering_key, status, attempts, max_attempts, run_after, locked_until, created_at
+        FROM webhook_events
+        WHERE status IN ('queued', 'running')
+        ORDER BY ordering_key, created_at, id
+    ),
+    ready AS (
+        -- Lock consultivo avaliado sobre a lista já ordenada, parando no LIMIT:
+        -- dois workers não disputam a mesma conversa
+        SELECT id FROM (
+            SELECT id, ordering_key FROM heads
+            WHERE (status = 'queued' AND run_after <= now())
+               OR (status = 'running' AND locked_until < now() AND attempts < max_attempts)
+            ORDER BY created_at
+        ) ordered
+        WHERE pg_try_advisory_xact_lock(hashtext('webhook_events:' || ordering_key))
+        LIMIT max_events
+    )
+    UPDATE webhook_events e
+    SET status = 'running',
+        attempts = e.attempts + 1,
+        locked_by = worker_id,
+        locked_until = now() + make_interval(secs => lease_seconds)
+    WHERE e.id IN (SELECT id FROM ready)
+      -- Reavaliado na linha atual se outro worker a reservou enquanto isso
+      AND ((e.status = 'queued' AND e.run_after <= now())
+           OR (e.status = 'running' AND e.locked_until < now() AND e.attempts < e.max_attempts))
+    RETURNING e.*;
+END;
+$$;
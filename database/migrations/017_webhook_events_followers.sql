@@ -0,0 +1,64 @@
+-- =====================================================
+-- MIGRATION: Webhook Events - Followers
+-- O worker que segura a cabeça de uma conversa (ordering_key) reserva também
+-- os eventos seguintes dela, para tratá-los no mesmo turno (mensagens seguidas
+-- do cliente respondidas uma vez). Todos ficam com lease deste worker, renovado
+-- a cada chamada e com o mesmo vencimento, e só são concluídos depois da
+-- resposta; se ele cair, os leases expiram juntos e os eventos voltam para a fila
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION claim_webhook_followers(
+    worker_id TEXT,
+    head_id UUID,
+    lease_seconds INT DEFAULT 120,
+    max_events INT DEFAULT 20
+)
+RETURNS SETOF webhook_events
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    WITH head AS (
+        -- Só quem ainda segura a cabeça (lease válido) pode absorver a fila da conversa
+        SELECT ordering_key, created_at, id
+        FROM webhook_events
+        WHERE id = head_id
+          AND status = 'running'
+          AND locked_by = worker_id
+          AND locked_until >= now()
+    ),
+    followers AS (
+        SELECT f.id
+        FROM webhook_events f, head
+        WHERE f.ordering_key = head.ordering_key
+          -- Pendentes, ou do turno de um worker que caiu (lease expirado, ainda com tentativas)
+          AND (f.status = 'queued'
+               OR (f.status = 'running' AND f.locked_until < now() AND f.attempts < f.max_attempts))
+          AND (f.created_at, f.id) > (head.created_at, head.id)
+        ORDER BY f.created_at, f.id
+        LIMIT max_events
+        FOR UPDATE OF f SKIP LOCKED
+    ),
+    renewed AS (
+        -- Eventos já reservados pelo turno (a cabeça inclusive) vencem junto com os novos
+        UPDATE webhook_events r
+        SET locked_until = now() + make_interval(secs => lease_seconds)
+        FROM head
+        WHERE r.ordering_key = head.ordering_key
+          AND r.status = 'running'
+          AND r.locked_by = worker_id
+          AND r.id NOT IN (SELECT id FROM followers)
+    ),
+    claimed AS (
+        UPDATE webhook_events e
+        SET status = 'running',
+            attempts = e.attempts + 1,
+            locked_by = worker_id,
+            locked_until = now() + make_interval(secs => lease_seconds)
+        WHERE e.id IN (SELECT id FROM followers)
+        RETURNING e.*
+    )
+    SELECT * FROM claimed
+    ORDER BY created_at, id;
+END;
+$$;
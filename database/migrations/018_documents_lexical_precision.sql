@@ -0,0 +1,79 @@
+-- =====================================================
+-- MIGRATION: Documents Lexical Precision
+-- A busca léxica da 007 combinava com OR também os termos da configuração
+-- 'simple', que mantém stopwords ("de", "o", "bem"): quase todo chunk casava
+-- com qualquer mensagem. Agora a linguagem natural usa só 'portuguese' (sem
+-- stopwords, com stemming); 'simple' fica para códigos (termos com dígitos,
+-- ex: "AB-1234"); e há um rank mínimo (ts_rank_cd) para um chunk entrar
+-- =====================================================
+
+-- Assinatura nova (min_rank): remover a antiga para não haver sobrecarga ambígua no PostgREST
+DROP FUNCTION IF EXISTS search_documents_lexical(TEXT, UUID, INT, UUID, UUID, TEXT);
+
+CREATE OR REPLACE FUNCTION search_documents_lexical(
+    query_text TEXT,
+    org_id UUID,
+    match_count INT DEFAULT 20,
+    conversation_filter UUID DEFAULT NULL,
+    rule_filter UUID DEFAULT NULL,
+    access_filter TEXT DEFAULT NULL,
+    min_rank FLOAT DEFAULT 0
+)
+RETURNS TABLE (
+    id UUID,
+    filename TEXT,
+    content TEXT,
+    rank FLOAT,
+    conversation_id UUID,
+    business_rule_ids UUID[],
+    access_level TEXT
+)
+LANGUAGE plpgsql
+STABLE
+AS $$
+DECLARE
+    portuguese_terms TEXT := replace(plainto_tsquery('portuguese', query_text)::TEXT, '&', '|');
+    code_terms TEXT;
+    query TSQUERY;
+BEGIN
+    SELECT coalesce(string_agg(quote_literal(lexeme), ' | '), '')
+    INTO code_terms
+    FROM unnest(tsvector_to_array(to_tsvector('simple', query_text))) AS lexeme
+    WHERE lexeme ~ '[0-9]';
+
+    IF portuguese_terms = '' AND code_terms = '' THEN
+        RETURN;
+    END IF;
+
+    query := CASE
+        WHEN portuguese_terms = '' THEN code_terms::TSQUERY
+        WHEN code_terms = '' THEN portuguese_terms::TSQUERY
+        ELSE portuguese_terms::TSQUERY || code_terms::TSQUERY
+    END;
+
+    RETURN QUERY
+    SELECT *
+    FROM (
+        SELECT
+            d.id,
+            d.filename,
+            d.content,
+            ts_rank_cd(d.content_tsv, query)::FLOAT AS rank,
+            d.conversation_id,
+            d.business_rule_ids,
+            d.access_level
+        FROM documents d
+        WHERE d.organization_id = org_id
+            AND d.status = 'ready'
+            AND d.embedding IS NOT NULL
+            AND d.content_tsv @@ query
+            -- Filtros opcionais
+            AND (conversation_filter IS NULL OR d.conversation_id = conversation_filter)
+            AND (rule_filter IS NULL OR rule_filter = ANY(d.business_rule_ids))
+            AND (access_filter IS NULL OR d.access_level = access_filter)
+    ) AS matches
+    WHERE matches.rank >= min_rank
+    ORDER BY matches.rank DESC
+    LIMIT match_count;
+END;
+$$;
@@ -0,0 +1,14 @@
+-- =====================================================
+-- MIGRATION: Messages Event Key
+-- A fila de webhooks entrega cada evento pelo menos uma vez (nova tentativa,
+-- lease retomado por outro worker): a mensagem do cliente guarda o evento que
+-- a gerou, para que a reentrega não a grave de novo nem responda outra vez
+-- =====================================================
+
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS event_key TEXT;
+
+COMMENT ON COLUMN messages.event_key IS 'Evento de webhook de origem (fonte:instância:key.id); NULL para mensagens de outros canais';
+
+-- Índice único completo (NULLs não conflitam): alvo do upsert on_conflict=event_key
+CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_event_key ON messages(event_key);
+
@@ -0,0 +1,90 @@
+-- =====================================================
+-- MIGRATION: Outbound Messages Dispatch
+-- Campanhas deixam de ficar só na memória do processo: cada réplica reserva
+-- envios pendentes de `outbound_messages` com lease (quem cai devolve o que
+-- reservou quando o lease vence) e o ritmo por instância vira um token bucket
+-- compartilhado entre as réplicas
+-- =====================================================
+
+ALTER TABLE outbound_messages ADD COLUMN IF NOT EXISTS run_after TIMESTAMPTZ NOT NULL DEFAULT now();
+ALTER TABLE outbound_messages ADD COLUMN IF NOT EXISTS locked_by TEXT;
+ALTER TABLE outbound_messages ADD COLUMN IF NOT EXISTS locked_until TIMESTAMPTZ;
+
+-- Envios de campanha pendentes, na ordem em que são reservados
+CREATE INDEX IF NOT EXISTS idx_outbound_messages_dispatch ON outbound_messages(created_at, id)
+    WHERE status = 'queued' AND campaign_id IS NOT NULL;
+
+-- Reservar até max_messages envios de campanha prontos (respostas de atendimento
+-- são enviadas pelo worker do webhook, que já é durável)
+CREATE OR REPLACE FUNCTION claim_outbound_messages(
+    worker_id TEXT,
+    lease_seconds INT DEFAULT 120,
+    max_messages INT DEFAULT 10
+)
+RETURNS SETOF outbound_messages
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    UPDATE outbound_messages o
+    SET locked_by = worker_id,
+        locked_until = now() + make_interval(secs => lease_seconds)
+    WHERE o.id IN (
+        SELECT c.id FROM outbound_messages c
+        WHERE c.status = 'queued'
+            AND c.campaign_id IS NOT NULL
+            AND c.run_after <= now()
+            AND (c.locked_until IS NULL OR c.locked_until < now())
+        ORDER BY c.created_at, c.id
+        LIMIT max_messages
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING o.*;
+END;
+$$;
+
+-- Token bucket por instância, compartilhado pelas réplicas
+CREATE TABLE IF NOT EXISTS whatsapp_send_buckets (
+    instance TEXT PRIMARY KEY,
+    tokens FLOAT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+
+COMMENT ON TABLE whatsapp_send_buckets IS 'Ritmo de envio por instância do WhatsApp (WHATSAPP_SEND_RATE_PER_MINUTE) somado entre as réplicas';
+
+ALTER TABLE whatsapp_send_buckets ENABLE ROW LEVEL SECURITY;
+
+-- Consumir um envio do bucket da instância: 0 se consumiu, senão os segundos
+-- até haver um (nada é consumido nesse caso)
+CREATE OR REPLACE FUNCTION take_send_token(
+    bucket_instance TEXT,
+    rate_per_second FLOAT,
+    burst FLOAT
+)
+RETURNS FLOAT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    bucket whatsapp_send_buckets%ROWTYPE;
+    now_ts TIMESTAMPTZ;
+    available FLOAT;
+BEGIN
+    INSERT INTO whatsapp_send_buckets (instance, tokens)
+    VALUES (bucket_instance, burst)
+    ON CONFLICT (instance) DO NOTHING;
+
+    SELECT * INTO bucket FROM whatsapp_send_buckets WHERE instance = bucket_instance FOR UPDATE;
+
+    -- Relógio lido depois do lock: a espera pela linha não conta como reposição
+    now_ts := clock_timestamp();
+    available := least(burst, bucket.tokens + greatest(extract(epoch FROM now_ts - bucket.updated_at), 0) * rate_per_second);
+
+    IF available >= 1 THEN
+        UPDATE whatsapp_send_buckets SET tokens = available - 1, updated_at = now_ts WHERE instance = bucket_instance;
+        RETURN 0;
+    END IF;
+
+    UPDATE whatsapp_send_buckets SET tokens = available, updated_at = now_ts WHERE instance = bucket_instance;
+    RETURN (1 - available) / rate_per_second;
+END;
+$$;
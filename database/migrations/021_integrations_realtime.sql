@@ -0,0 +1,16 @@
+-- =====================================================
+-- MIGRATION: Integrations Realtime
+-- Publica mudanças de integrations no Supabase Realtime para invalidar a
+-- tabela de rotas instância → organização em todas as réplicas da API
+-- =====================================================
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_publication_tables
+        WHERE pubname = 'supabase_realtime' AND schemaname = 'public' AND tablename = 'integrations'
+    ) THEN
+        ALTER PUBLICATION supabase_realtime ADD TABLE integrations;
+    END IF;
+END;
+$$;